@@ -1,39 +1,213 @@
-from flask import Flask
-from flask_admin import Admin
-from flask_admin.contrib.sqla import ModelView
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.database.models import User, Base
-
-# Создаем Flask-приложение
-app = Flask(__name__)
-
-# Настройка базы данных (синхронный движок)
-engine = create_engine('sqlite:///db.sqlite3')
-Session = sessionmaker(bind=engine)
-session = Session()
-
-# Настройка Flask-Admin
-app.config['SECRET_KEY'] = 'ваш_секретный_ключ'
-admin = Admin(app, name='Админка', template_mode='bootstrap3')
-
-# Модель для отображения пользователей
-class UserAdmin(ModelView):
-    column_list = ('id', 'tg_id', 'login', 'name', 'start_date', 'is_trial', 'end_date')
-    column_labels = {
-        'id': 'ID',
-        'tg_id': 'Telegram ID',
-        'login': 'Логин',
-        'name': 'Имя',
-        'start_date': 'Дата начала',
-        'is_trial': 'Тип (тест/платная)',
-        'end_date': 'Дата окончания',
-    }
-    column_searchable_list = ('login', 'name')
-    column_filters = ('is_trial',)
-
-# Добавляем модель User в админку
-admin.add_view(UserAdmin(User, session))
+import html
+import secrets
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Awaitable, Dict, Optional
+from urllib.parse import urlencode
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from pydantic import BaseModel
+from sqlalchemy import delete, select, update
+
+from app.database.listings import Page, list_users, list_recipes, list_ingredients
+from app.database.models import User, async_session, async_read_session, engine, read_engine
+from app.database.user_cache import record_user_change
+from config import ADMIN_HOST, ADMIN_PORT, ADMIN_PASSWORD
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+
+# Админка работает с базой через тот же асинхронный движок, что и бот: списки
+# читаются через пул только для чтения и постранично по индексам, так что даже
+# на миллионе пользователей страница стоит одинаково и не мешает боту
+app = FastAPI(title="Админка", lifespan=lifespan)
+_basic = HTTPBasic(auto_error=False)
+
+
+def _check_password(credentials: Optional[HTTPBasicCredentials] = Depends(_basic)):
+    # Без ADMIN_PASSWORD админка открыта, как и раньше: слушайте только localhost
+    if not ADMIN_PASSWORD:
+        return
+    if credentials is None or not secrets.compare_digest(credentials.password.encode(), ADMIN_PASSWORD.encode()):
+        raise HTTPException(status_code=401, detail="Нужен пароль админки", headers={"WWW-Authenticate": "Basic"})
+
+
+async def _page(listing: Awaitable[Page]) -> Page:
+    try:
+        return await listing
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def users_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    q: Optional[str] = None,
+    tg_id: Optional[int] = None,
+    is_trial: Optional[bool] = None,
+    expires_after: Optional[datetime] = None,
+    expires_before: Optional[datetime] = None,
+) -> Page:
+    async with async_read_session() as session:
+        return await _page(list_users(session, cursor, limit, q, tg_id, is_trial, expires_after, expires_before))
+
+
+async def recipes_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    q: Optional[str] = None,
+    category_id: Optional[int] = None,
+    cuisine_id: Optional[int] = None,
+    type_id: Optional[int] = None,
+) -> Page:
+    async with async_read_session() as session:
+        return await _page(list_recipes(session, cursor, limit, q, category_id, cuisine_id, type_id))
+
+
+async def ingredients_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    q: Optional[str] = None,
+    ingredient_type_id: Optional[int] = None,
+) -> Page:
+    async with async_read_session() as session:
+        return await _page(list_ingredients(session, cursor, limit, q, ingredient_type_id))
+
+
+protected = [Depends(_check_password)]
+
+
+@app.get("/api/users", dependencies=protected)
+async def api_users(page: Page = Depends(users_page)):
+    return page
+
+
+@app.get("/api/recipes", dependencies=protected)
+async def api_recipes(page: Page = Depends(recipes_page)):
+    return page
+
+
+@app.get("/api/ingredients", dependencies=protected)
+async def api_ingredients(page: Page = Depends(ingredients_page)):
+    return page
+
+
+class UserUpdate(BaseModel):
+    login: Optional[str] = None
+    name: Optional[str] = None
+    is_trial: Optional[bool] = None
+    end_date: Optional[datetime] = None
+
+
+@app.patch("/api/users/{user_id}", dependencies=protected)
+async def api_update_user(user_id: int, changes: UserUpdate):
+    values = changes.model_dump(exclude_unset=True)
+    async with async_session() as session:
+        if values:
+            await session.execute(update(User).where(User.id == user_id).values(**values))
+        row = (await session.execute(
+            select(User.id, User.tg_id, User.login, User.name, User.start_date, User.is_trial, User.end_date).where(User.id == user_id)
+        )).mappings().first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        if values:
+            await record_user_change(session, row["tg_id"])
+        await session.commit()
+    return dict(row)
+
+
+@app.delete("/api/users/{user_id}", dependencies=protected)
+async def api_delete_user(user_id: int):
+    async with async_session() as session:
+        tg_id = await session.scalar(delete(User).where(User.id == user_id).returning(User.tg_id))
+        if tg_id is None:
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        await record_user_change(session, tg_id)
+        await session.commit()
+    return {"deleted": user_id}
+
+
+# Страницы для браузера: те же списки, что и в API, в виде таблиц с фильтрами
+SECTIONS = {
+    "/users": ("Пользователи", ("q", "tg_id", "is_trial", "expires_after", "expires_before")),
+    "/recipes": ("Рецепты", ("q", "category_id", "cuisine_id", "type_id")),
+    "/ingredients": ("Ингредиенты", ("q", "ingredient_type_id")),
+}
+
+COLUMN_LABELS = {
+    'id': 'ID',
+    'tg_id': 'Telegram ID',
+    'login': 'Логин',
+    'name': 'Имя',
+    'start_date': 'Дата начала',
+    'is_trial': 'Тип (тест/платная)',
+    'end_date': 'Дата окончания',
+    'title': 'Название',
+    'category': 'Категория',
+    'cuisine': 'Кухня',
+    'type': 'Диета',
+    'ingredient_type': 'Тип',
+    'protein': 'Белки',
+    'fat': 'Жиры',
+    'carbohydrate': 'Углеводы',
+    'q': 'Начало имени или названия',
+    'expires_after': 'Окончание после',
+    'expires_before': 'Окончание до',
+    'category_id': 'ID категории',
+    'cuisine_id': 'ID кухни',
+    'type_id': 'ID диеты',
+    'ingredient_type_id': 'ID типа',
+}
+
+
+def _render(path: str, request: Request, page: Page) -> str:
+    title, filters = SECTIONS[path]
+    params: Dict[str, str] = {name: value for name, value in request.query_params.items() if name != "cursor" and value}
+    nav = " | ".join(f'<a href="{url}">{html.escape(name)}</a>' for url, (name, _) in SECTIONS.items())
+    form = "".join(
+        f'<label>{html.escape(COLUMN_LABELS[name])} <input name="{name}" value="{html.escape(params.get(name, ""))}"></label> '
+        for name in filters
+    )
+    columns = [column for column in page.items[0] if not column.endswith("_id") or column == "tg_id"] if page.items else []
+    head = "".join(f"<th>{html.escape(COLUMN_LABELS.get(column, column))}</th>" for column in columns)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape('' if item[column] is None else str(item[column]))}</td>" for column in columns) + "</tr>"
+        for item in page.items
+    )
+    more = f'<p><a href="{path}?{html.escape(urlencode({**params, "cursor": page.next_cursor}))}">Дальше →</a></p>' if page.next_cursor else ""
+    return (
+        f"<!doctype html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title></head><body>"
+        f"<p>{nav}</p><h1>{html.escape(title)}</h1>"
+        # Пустые поля формы не отправляем, иначе числовые фильтры не пройдут проверку
+        f"<form onsubmit=\"for (const el of this.elements) if (!el.value) el.disabled = true\">{form}<button>Найти</button></form>"
+        f"<table border='1' cellpadding='4'><tr>{head}</tr>{body}</table>{more}</body></html>"
+    )
+
+
+@app.get("/", response_class=HTMLResponse, dependencies=protected)
+@app.get("/users", response_class=HTMLResponse, dependencies=protected)
+async def html_users(request: Request, page: Page = Depends(users_page)):
+    return _render("/users", request, page)
+
+
+@app.get("/recipes", response_class=HTMLResponse, dependencies=protected)
+async def html_recipes(request: Request, page: Page = Depends(recipes_page)):
+    return _render("/recipes", request, page)
+
+
+@app.get("/ingredients", response_class=HTMLResponse, dependencies=protected)
+async def html_ingredients(request: Request, page: Page = Depends(ingredients_page)):
+    return _render("/ingredients", request, page)
+
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    import uvicorn
+    uvicorn.run(app, host=ADMIN_HOST, port=ADMIN_PORT)
@@ -1,3 +1,14 @@
-from aiogram import Bot
-from config import  TOKEN
-bot = Bot(token=TOKEN)
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import SimpleEventIsolation
+from app.fsm_storage import DatabaseStorage
+from app.outbound import outbound
+from config import  TOKEN, TELEGRAM_API_SERVER
+# Свой сервер Bot API (telegram-bot-api) вместо api.telegram.org, если задан
+bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER)) if TELEGRAM_API_SERVER else None)
+# Все запросы к Telegram проходят через ограничитель частоты отправки
+bot.session.middleware(outbound)
+# Состояния FSM хранятся в базе и переживают перезапуск. Апдейты одного пользователя
+# обрабатываются по очереди, иначе быстрые нажатия перезаписывают состояние друг друга.
+dp = Dispatcher(storage=DatabaseStorage(), events_isolation=SimpleEventIsolation())
@@ -0,0 +1,76 @@
+import re
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple, Union
+
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.fsm.state import State
+from aiogram.types import Message, ReplyKeyboardMarkup
+
+import app.keyboards as kb
+
+_NOT_WORD = re.compile(r'[^\w\s]')
+
+
+def clean_text(text: Optional[str]) -> str:
+    """Убирает эмодзи и знаки препинания: '🥩Мясо' -> 'Мясо'."""
+    if text is None:
+        return ""
+    return _NOT_WORD.sub('', text).strip()
+
+
+def _keyboard_texts(keyboard: ReplyKeyboardMarkup) -> List[str]:
+    return [button.text for row in keyboard.keyboard for button in row]
+
+
+def labels(keyboard: ReplyKeyboardMarkup) -> FrozenSet[str]:
+    """Очищенные подписи кнопок клавиатуры."""
+    return frozenset(clean_text(text) for text in _keyboard_texts(keyboard))
+
+
+# Подпись кнопки как она приходит от Telegram -> очищенная подпись.
+# Нажатия кнопок нормализуются поиском в словаре, регулярка нужна только для текста, набранного вручную.
+_KNOWN_TEXTS: Dict[str, str] = {
+    text: clean_text(text)
+    for keyboard in vars(kb).values() if isinstance(keyboard, ReplyKeyboardMarkup)
+    for text in _keyboard_texts(keyboard)
+}
+
+
+def normalize(text: Optional[str]) -> str:
+    if text is None:
+        return ""
+    known = _KNOWN_TEXTS.get(text)
+    return known if known is not None else clean_text(text)
+
+
+class ButtonActions:
+    """
+    Таблица "подпись кнопки -> обработчик". Вместо того чтобы aiogram по очереди
+    проверял фильтр каждого обработчика, текст сообщения нормализуется один раз
+    и обработчик находится поиском в словаре.
+    """
+
+    def __init__(self):
+        self._actions: Dict[str, List[Tuple[Optional[str], CallableObject]]] = {}
+
+    def register(self, label: str, state: Union[State, str, None] = None) -> Callable:
+        """Регистрирует обработчик кнопки; state ограничивает его одним состоянием FSM."""
+        state_name = state.state if isinstance(state, State) else state
+
+        def decorator(func: Callable[..., Awaitable[Any]]):
+            self._actions.setdefault(clean_text(label), []).append((state_name, CallableObject(func)))
+            return func
+        return decorator
+
+    def find(self, text: Optional[str], raw_state: Optional[str]) -> Optional[CallableObject]:
+        for state_name, action in self._actions.get(normalize(text), ()):
+            if state_name is None or state_name == raw_state:
+                return action
+        return None
+
+    def filter(self, message: Message, raw_state: Optional[str] = None) -> Union[bool, Dict[str, Any]]:
+        # Найденный обработчик aiogram передаст в dispatch параметром button_action
+        action = self.find(message.text, raw_state)
+        return {"button_action": action} if action is not None else False
+
+    async def dispatch(self, message: Message, button_action: CallableObject, **kwargs: Any) -> Any:
+        return await button_action.call(message, **kwargs)
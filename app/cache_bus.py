@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBus:
+    """
+    Сообщения о сбросе кэшей между процессами бота (см. app.workers). Модуль, у
+    которого есть кэш в памяти, регистрирует функцию через subscribe() и после
+    изменения вызывает publish() с теми же аргументами - другие процессы вызовут
+    у себя ту же функцию. Пока процесс один, publish() ничего не делает.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[..., Any]] = {}
+        self._inbox = None  # multiprocessing.Queue этого процесса
+        self._peers: List[Any] = []  # Очереди остальных процессов
+        self._listener: Optional[asyncio.Task] = None
+        # Сообщение применяется у себя: повторно рассылать его не нужно
+        self._applying = False
+        self.sent = 0
+        self.received = 0
+
+    def subscribe(self, name: str, handler: Callable[..., Any]):
+        self._handlers[name] = handler
+
+    def publish(self, name: str, *args: Any):
+        if self._applying or not self._peers:
+            return
+        for peer in self._peers:
+            peer.put((name, args))
+        self.sent += 1
+
+    def connect(self, inbox, peers: List[Any]):
+        """inbox=None - процесс только рассылает и ничего не слушает."""
+        self._inbox = inbox
+        self._peers = list(peers)
+        if inbox is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self._inbox.get)
+            if message is None:
+                return
+            self._apply(*message)
+
+    def _apply(self, name: str, args: tuple):
+        handler = self._handlers.get(name)
+        if handler is None:
+            logger.warning("Неизвестное сообщение о сбросе кэша: %s", name)
+            return
+        self.received += 1
+        self._applying = True
+        try:
+            handler(*args)
+        except Exception:
+            logger.exception("Не удалось применить сообщение %s%r", name, args)
+        finally:
+            self._applying = False
+
+    async def close(self):
+        if self._listener is not None:
+            # Поток, который ждёт очередь, проснётся только от сообщения
+            self._inbox.put(None)
+            await self._listener
+            self._listener = None
+        self._peers = []
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "received": self.received}
+
+
+cache_bus = CacheBus()
@@ -0,0 +1,32 @@
+from enum import Enum
+
+from aiogram.filters.callback_data import CallbackData
+
+# Короткие префиксы и целые ID держат callback_data далеко от лимита Telegram в 64 байта,
+# какой бы длины ни было название ингредиента.
+
+
+class IngredientToggle(CallbackData, prefix="i"):
+    """Отметить или снять ингредиент при поиске рецептов."""
+    id: int
+
+
+class AdminIngredientToggle(CallbackData, prefix="ai"):
+    """Отметить или снять ингредиент рецепта в админке."""
+    id: int
+
+
+class IngredientPage(CallbackData, prefix="p"):
+    """Страница списка ингредиентов."""
+    page: int
+
+
+class RecipeAction(str, Enum):
+    prev = "p"
+    next = "n"
+    cook = "c"
+
+
+class RecipeNav(CallbackData, prefix="r"):
+    """Листание найденных рецептов."""
+    action: RecipeAction
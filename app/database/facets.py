@@ -0,0 +1,132 @@
+from collections import Counter, defaultdict
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache_bus import cache_bus
+from app.database.models import async_session, Recipe, Recipe_ingredient, Ingredient, Category, Cuisine, Type
+
+
+class RecipeIndex:
+    """
+    Индекс рецептов в памяти процесса: для каждой категории, кухни, типа диеты
+    и ингредиента хранится множество ID рецептов. Фильтры поиска отвечаются
+    пересечением множеств, в базу идём только за самими рецептами.
+    Изменения рецептов и названий рассылаются другим процессам бота через cache_bus.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.version = 0
+        self.names: Dict[str, Dict[str, int]] = {"categories": {}, "cuisines": {}, "types": {}, "ingredients": {}}
+        self.by_category: Dict[int, Set[int]] = defaultdict(set)
+        self.by_cuisine: Dict[int, Set[int]] = defaultdict(set)
+        self.by_type: Dict[int, Set[int]] = defaultdict(set)
+        self.by_ingredient: Dict[int, Set[int]] = defaultdict(set)
+        self.recipes: Dict[int, tuple] = {}
+
+    async def build(self, session: AsyncSession):
+        names = {}
+        for key, model in (("categories", Category), ("cuisines", Cuisine), ("types", Type), ("ingredients", Ingredient)):
+            result = await session.execute(select(model.name, model.id))
+            names[key] = {name: id_ for name, id_ in result}
+        ingredients = defaultdict(set)
+        for recipe_id, ingredient_id in await session.execute(select(Recipe_ingredient.recipe_id, Recipe_ingredient.ingredient_id)):
+            ingredients[recipe_id].add(ingredient_id)
+        recipes = await session.execute(select(Recipe.id, Recipe.category_id, Recipe.cuisine_id, Recipe.type_id))
+        version = self.version + 1
+        self.__init__()
+        self.version = version
+        self.names = names
+        for recipe_id, category_id, cuisine_id, type_id in recipes:
+            self._add(recipe_id, category_id, cuisine_id, type_id, ingredients.get(recipe_id, ()))
+        self.ready = True
+
+    def _add(self, recipe_id: int, category_id: int, cuisine_id: int, type_id: int, ingredient_ids):
+        ingredient_ids = frozenset(ingredient_ids)
+        self.recipes[recipe_id] = (category_id, cuisine_id, type_id, ingredient_ids)
+        self.by_category[category_id].add(recipe_id)
+        self.by_cuisine[cuisine_id].add(recipe_id)
+        self.by_type[type_id].add(recipe_id)
+        for ingredient_id in ingredient_ids:
+            self.by_ingredient[ingredient_id].add(recipe_id)
+
+    def add_recipe(self, recipe_id: int, category_id: int, cuisine_id: int, type_id: int, ingredient_ids: Sequence[int]):
+        ingredient_ids = tuple(ingredient_ids)
+        self._remove(recipe_id)
+        self._add(recipe_id, category_id, cuisine_id, type_id, ingredient_ids)
+        cache_bus.publish("recipe_index.add_recipe", recipe_id, category_id, cuisine_id, type_id, ingredient_ids)
+
+    def remove_recipe(self, recipe_id: int):
+        self._remove(recipe_id)
+        cache_bus.publish("recipe_index.remove_recipe", recipe_id)
+
+    def _remove(self, recipe_id: int):
+        facets = self.recipes.pop(recipe_id, None)
+        self.version += 1
+        if facets is None:
+            return
+        category_id, cuisine_id, type_id, ingredient_ids = facets
+        self.by_category[category_id].discard(recipe_id)
+        self.by_cuisine[cuisine_id].discard(recipe_id)
+        self.by_type[type_id].discard(recipe_id)
+        for ingredient_id in ingredient_ids:
+            self.by_ingredient[ingredient_id].discard(recipe_id)
+
+    def resolve_name(self, kind: str, name: str) -> Optional[int]:
+        return self.names[kind].get(name)
+
+    def remember_name(self, kind: str, name: str, id_: int):
+        self.names[kind][name] = id_
+        cache_bus.publish("recipe_index.remember_name", kind, name, id_)
+
+    def ingredient_union(self, ingredient_ids: Sequence[int]) -> Set[int]:
+        result = set()
+        for ingredient_id in ingredient_ids:
+            result |= self.by_ingredient.get(ingredient_id, set())
+        return result
+
+    def ingredient_matches(self, ingredient_ids: Sequence[int], candidates: Optional[Set[int]] = None, match_all: bool = False) -> Iterator[Tuple[int, int, int]]:
+        """Возвращает (recipe_id, совпавших ингредиентов, недостающих ингредиентов) без дублей."""
+        selected = set(ingredient_ids)
+        matched = Counter()
+        for ingredient_id in selected:
+            matched.update(self.by_ingredient.get(ingredient_id, ()))
+        need = len(selected) if match_all else 1
+        for recipe_id, count in matched.items():
+            if count < need or (candidates is not None and recipe_id not in candidates):
+                continue
+            yield recipe_id, count, len(self.recipes[recipe_id][3]) - count
+
+    def find(self, category_id: Optional[int] = None, cuisine_id: Optional[int] = None, type_id: Optional[int] = None, ingredient_ids: Sequence[int] = ()) -> List[int]:
+        sets = []
+        if category_id is not None:
+            sets.append(self.by_category.get(category_id, set()))
+        if cuisine_id is not None:
+            sets.append(self.by_cuisine.get(cuisine_id, set()))
+        if type_id is not None:
+            sets.append(self.by_type.get(type_id, set()))
+        if ingredient_ids:
+            sets.append(self.ingredient_union(ingredient_ids))
+        if not sets:
+            return list(self.recipes)
+        # Пересекаем начиная с самого маленького множества
+        sets.sort(key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            result &= other
+            if not result:
+                break
+        return list(result)
+
+
+recipe_index = RecipeIndex()
+cache_bus.subscribe("recipe_index.add_recipe", recipe_index.add_recipe)
+cache_bus.subscribe("recipe_index.remove_recipe", recipe_index.remove_recipe)
+cache_bus.subscribe("recipe_index.remember_name", recipe_index.remember_name)
+
+
+async def build_recipe_index():
+    async with async_session() as session:
+        await recipe_index.build(session)
@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import time
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.database.models import engine, Recipe, Recipe_ingredient, Ingredient, Category, Cuisine, Type, IngredientType
+
+logger = logging.getLogger(__name__)
+
+# Значение БЖУ для ингредиентов, созданных без него
+UNKNOWN_NUTRIENT = '0'
+
+
+def read_recipes(path: Path) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Читает рецепты построчно из JSONL или CSV, не загружая файл целиком.
+    Поля: title, instructions, category, cuisine, type, ingredients.
+    В JSONL ingredients - список названий или объектов {name, type, protein, fat, carbohydrate},
+    в CSV - названия через ';'. Вместо строки JSONL, которую не удалось разобрать, отдаётся None.
+    """
+    with open(path, encoding='utf-8', newline='') as file:
+        if path.suffix.lower() == '.csv':
+            for row in csv.DictReader(file):
+                row['ingredients'] = (row.get('ingredients') or '').split(';')
+                yield row
+        else:
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    logger.warning("Строка %s не разобрана: %s", number, e)
+                    yield None
+
+
+@dataclass
+class ImportStats:
+    recipes: int = 0
+    ingredients: int = 0  # Строк recipe_ingredient
+    skipped: int = 0
+    malformed: int = 0  # Из пропущенных: не JSON-объект
+    created: int = 0  # Новых категорий, кухонь, типов и ингредиентов
+    seconds: float = 0.0
+
+    @property
+    def per_second(self) -> float:
+        return self.recipes / self.seconds if self.seconds else 0.0
+
+
+class RecipeImporter:
+    """
+    Потоковый импорт рецептов. Справочники (категории, кухни, диеты, типы ингредиентов
+    и ингредиенты) загружаются в словари один раз, недостающие записи создаются
+    пачкой на весь чанк. Рецепты и их ингредиенты пишутся через executemany,
+    каждый чанк - одна транзакция: упавший чанк откатывается целиком.
+    """
+
+    def __init__(self, engine: AsyncEngine = engine, chunk_size: int = 5000, ingredient_type: Optional[str] = None):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        # Тип для новых ингредиентов, заданных только названием
+        self.ingredient_type = ingredient_type
+        self.names: Dict[Any, Dict[str, int]] = {}
+
+    async def _load_names(self, conn: AsyncConnection):
+        for model in (Category, Cuisine, Type, IngredientType, Ingredient):
+            self.names[model] = {name: id_ for name, id_ in await conn.execute(select(model.name, model.id))}
+
+    async def _create_missing(self, conn: AsyncConnection, model, rows: Dict[str, dict]) -> int:
+        """Создаёт недостающие записи справочника одним запросом и запоминает их ID."""
+        known = self.names[model]
+        missing = [{"name": name, **values} for name, values in rows.items() if name not in known]
+        if not missing:
+            return 0
+        result = await conn.execute(insert(model).returning(model.id, sort_by_parameter_order=True), missing)
+        for row, id_ in zip(missing, result.scalars()):
+            known[row["name"]] = id_
+        return len(missing)
+
+    def _clean(self, number: int, raw: Any) -> Optional[dict]:
+        if not isinstance(raw, dict):
+            if raw is not None:
+                logger.warning("Рецепт %s пропущен: ожидался объект, получено %s", number, type(raw).__name__)
+            return None
+        recipe = {key: str(raw.get(key) or '').strip() for key in ('title', 'instructions', 'category', 'cuisine', 'type')}
+        missing = [key for key, value in recipe.items() if not value]
+        known = self.names[Ingredient]
+        # Названия без повторов: повтор нарушил бы уникальный индекс (recipe_id, ingredient_id)
+        names: Dict[str, None] = {}
+        new: Dict[str, dict] = {}  # Описания ингредиентов, которых ещё нет в базе
+        items = raw.get('ingredients') or []
+        if not isinstance(items, list):
+            missing.append("список ингредиентов")
+            items = []
+        for item in items:
+            if not isinstance(item, (str, dict)):
+                missing.append(f"ингредиент {item!r}")
+                continue
+            name = (item if isinstance(item, str) else item.get("name") or '').strip()
+            if not name:
+                continue
+            names[name] = None
+            if name not in known:
+                new[name] = {} if isinstance(item, str) else item
+                if not (new[name].get("type") or self.ingredient_type):
+                    missing.append(f"тип ингредиента '{name}'")
+        if missing:
+            logger.warning("Рецепт %s пропущен, не заполнено: %s", number, ", ".join(missing))
+            return None
+        recipe["ingredients"] = list(names)
+        recipe["new_ingredients"] = new
+        return recipe
+
+    async def _insert_recipes(self, conn: AsyncConnection, rows: List[dict]) -> List[int]:
+        """Вставляет рецепты и возвращает их ID в порядке rows."""
+        if conn.dialect.name != 'sqlite':
+            result = await conn.execute(insert(Recipe).returning(Recipe.id, sort_by_parameter_order=True), rows)
+            return list(result.scalars())
+        # SQLite не обещает порядок строк в RETURNING, и SQLAlchemy вставлял бы рецепты
+        # по одному. Обычный executemany быстрее, а ID восстанавливаются по тому, что
+        # до конца транзакции в таблицу пишем только мы и rowid выдаются подряд.
+        await conn.execute(insert(Recipe), rows)
+        result = await conn.execute(select(Recipe.id).order_by(Recipe.id.desc()).limit(len(rows)))
+        return list(reversed(result.scalars().all()))
+
+    async def _import_chunk(self, conn: AsyncConnection, recipes: List[dict], stats: ImportStats):
+        created = 0
+        for model, key in ((Category, 'category'), (Cuisine, 'cuisine'), (Type, 'type')):
+            created += await self._create_missing(conn, model, {recipe[key]: {} for recipe in recipes})
+        new_ingredients: Dict[str, dict] = {}
+        for recipe in recipes:
+            for name, item in recipe["new_ingredients"].items():
+                new_ingredients.setdefault(name, item)
+        created += await self._create_missing(conn, IngredientType, {
+            item.get("type") or self.ingredient_type: {} for item in new_ingredients.values()
+        })
+        type_ids = self.names[IngredientType]
+        created += await self._create_missing(conn, Ingredient, {
+            name: {
+                "protein": str(item.get("protein", UNKNOWN_NUTRIENT)),
+                "fat": str(item.get("fat", UNKNOWN_NUTRIENT)),
+                "carbohydrate": str(item.get("carbohydrate", UNKNOWN_NUTRIENT)),
+                "ingredient_type_id": type_ids[item.get("type") or self.ingredient_type],
+            }
+            for name, item in new_ingredients.items()
+        })
+
+        recipe_ids = await self._insert_recipes(conn, [
+            {
+                "title": recipe["title"],
+                "instructions": recipe["instructions"],
+                "category_id": self.names[Category][recipe["category"]],
+                "cuisine_id": self.names[Cuisine][recipe["cuisine"]],
+                "type_id": self.names[Type][recipe["type"]],
+                "position": None,
+                "like": None,
+                "dislike": None,
+            }
+            for recipe in recipes
+        ])
+        links = []
+        ingredient_ids = self.names[Ingredient]
+        for recipe, recipe_id in zip(recipes, recipe_ids):
+            for name in recipe["ingredients"]:
+                links.append({"recipe_id": recipe_id, "ingredient_id": ingredient_ids[name]})
+        if links:
+            await conn.execute(insert(Recipe_ingredient), links)
+        stats.recipes += len(recipes)
+        stats.ingredients += len(links)
+        stats.created += created
+
+    async def run(self, rows: Iterable[Optional[Dict[str, Any]]]) -> ImportStats:
+        stats = ImportStats()
+        started = time.perf_counter()
+        async with self.engine.connect() as conn:
+            await self._load_names(conn)
+            await conn.commit()
+            numbered = enumerate(rows, start=1)
+            while True:
+                chunk = list(islice(numbered, self.chunk_size))
+                if not chunk:
+                    break
+                recipes = [recipe for recipe in (self._clean(number, raw) for number, raw in chunk) if recipe]
+                stats.skipped += len(chunk) - len(recipes)
+                stats.malformed += sum(1 for _, raw in chunk if not isinstance(raw, dict))
+                if recipes:
+                    snapshot = {model: dict(names) for model, names in self.names.items()}
+                    try:
+                        async with conn.begin():
+                            await self._import_chunk(conn, recipes, stats)
+                    except Exception:
+                        # ID созданных в откаченной транзакции записей недействительны
+                        self.names = snapshot
+                        raise
+                stats.seconds = time.perf_counter() - started
+                logger.info("Импортировано рецептов: %s (%.0f в секунду)", stats.recipes, stats.per_second)
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+
+async def main():
+    from app.database.migrations import upgrade
+    parser = argparse.ArgumentParser(description="Импорт рецептов из JSONL или CSV.")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--ingredient-type", help="Тип для новых ингредиентов, у которых он не указан")
+    args = parser.parse_args()
+    await upgrade()
+    try:
+        importer = RecipeImporter(chunk_size=args.chunk_size, ingredient_type=args.ingredient_type)
+        stats = await importer.run(read_recipes(args.path))
+    finally:
+        await engine.dispose()
+    print(
+        f"Импортировано рецептов: {stats.recipes}, ингредиентов в них: {stats.ingredients}, "
+        f"создано записей справочников: {stats.created}, пропущено: {stats.skipped} "
+        f"(из них не разобрано строк: {stats.malformed}).\n"
+        f"Время: {stats.seconds:.1f} с, {stats.per_second:.0f} рецептов в секунду.\n"
+        "Запущенный бот увидит новые рецепты после перезапуска."
+    )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
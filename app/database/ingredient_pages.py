@@ -0,0 +1,94 @@
+from typing import NamedTuple, Optional, Tuple
+
+from cachetools import TTLCache
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache_bus import cache_bus
+from app.database.models import Ingredient, IngredientType
+
+
+class IngredientPage(NamedTuple):
+    number: int
+    total_pages: int
+    items: Tuple[Tuple[int, str], ...]  # (id, название) в порядке названий
+
+
+class IngredientPager:
+    """
+    Постраничная выборка ингредиентов (всех или одного типа) в порядке названий.
+    Страница запрашивается по ключу соседней страницы из кэша (keyset), OFFSET
+    нужен только если соседей в кэше нет. Количество и страницы кэшируются;
+    при изменении ингредиентов кэш сбрасывается через invalidate().
+    """
+
+    def __init__(self, per_page: int, maxsize: int = 4096, ttl: float = 600):
+        self.per_page = per_page
+        # TTL страхует от изменений мимо бота (например, из админки)
+        self._type_ids: TTLCache = TTLCache(maxsize=256, ttl=ttl)
+        self._counts: TTLCache = TTLCache(maxsize=256, ttl=ttl)
+        self._pages: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def type_id(self, session: AsyncSession, type_name: str) -> int:
+        type_id = self._type_ids.get(type_name)
+        if type_id is None:
+            type_id = await session.scalar(select(IngredientType.id).where(IngredientType.name == type_name))
+            if not type_id:
+                raise ValueError(f"Тип '{type_name}' не найден.")
+            self._type_ids[type_name] = type_id
+        return type_id
+
+    async def count(self, session: AsyncSession, type_id: Optional[int] = None) -> int:
+        total = self._counts.get(type_id)
+        if total is None:
+            query = select(func.count(Ingredient.id))
+            if type_id is not None:
+                query = query.where(Ingredient.ingredient_type_id == type_id)
+            total = self._counts[type_id] = await session.scalar(query)
+        return total
+
+    async def page(self, session: AsyncSession, type_id: Optional[int], number: int) -> IngredientPage:
+        total_pages = max(1, -(-await self.count(session, type_id) // self.per_page))
+        number = min(max(number, 0), total_pages - 1)
+        items = self._pages.get((type_id, number))
+        if items is None:
+            items = self._pages[(type_id, number)] = await self._fetch(session, type_id, number)
+        return IngredientPage(number, total_pages, items)
+
+    async def _fetch(self, session: AsyncSession, type_id: Optional[int], number: int) -> Tuple[Tuple[int, str], ...]:
+        key = tuple_(Ingredient.name, Ingredient.id)
+        query = select(Ingredient.id, Ingredient.name).limit(self.per_page)
+        if type_id is not None:
+            query = query.where(Ingredient.ingredient_type_id == type_id)
+        previous = self._pages.get((type_id, number - 1)) if number > 0 else None
+        following = self._pages.get((type_id, number + 1))
+        if previous:
+            last_id, last_name = previous[-1]
+            query = query.where(key > tuple_(last_name, last_id)).order_by(Ingredient.name, Ingredient.id)
+        elif following:
+            # Листаем назад: берём записи перед первой записью следующей страницы
+            first_id, first_name = following[0]
+            query = query.where(key < tuple_(first_name, first_id)).order_by(Ingredient.name.desc(), Ingredient.id.desc())
+            return tuple(reversed([tuple(row) for row in await session.execute(query)]))
+        else:
+            query = query.order_by(Ingredient.name, Ingredient.id).offset(number * self.per_page)
+        return tuple(tuple(row) for row in await session.execute(query))
+
+    def invalidate(self):
+        self._type_ids.clear()
+        self._counts.clear()
+        self._pages.clear()
+
+
+# Выбор ингредиентов при поиске (по типу) и в админке (все ингредиенты)
+ingredient_pages = IngredientPager(per_page=5)
+admin_ingredient_pages = IngredientPager(per_page=20)
+
+
+def forget_ingredient_pages():
+    ingredient_pages.invalidate()
+    admin_ingredient_pages.invalidate()
+    cache_bus.publish("forget_ingredient_pages")
+
+
+cache_bus.subscribe("forget_ingredient_pages", forget_ingredient_pages)
@@ -0,0 +1,142 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import Select, and_, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import User, Recipe, Ingredient, IngredientType, Category, Cuisine, Type
+
+# Символ больше любого другого: строки с префиксом q лежат в диапазоне [q, q + _MAX_CHAR)
+_MAX_CHAR = '\U0010ffff'
+
+
+@dataclass
+class Page:
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str]  # None - это последняя страница
+
+
+def _encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str, order: Sequence) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(order):
+            raise ValueError
+        return [
+            datetime.fromisoformat(value) if column.type.python_type is datetime else value
+            for column, value in zip(order, values)
+        ]
+    except (ValueError, TypeError):
+        raise ValueError("Некорректный курсор страницы.") from None
+
+
+def _prefix(column, text: str):
+    # Диапазон вместо LIKE 'text%': так поиск идёт по обычному индексу колонки
+    return and_(column >= text, column < text + _MAX_CHAR)
+
+
+async def fetch_page(session: AsyncSession, query: Select, order: Sequence, cursor: Optional[str], limit: int, descending: bool = False) -> Page:
+    """
+    Страница выборки по ключу (keyset): вместо OFFSET продолжаем после последней
+    строки прошлой страницы, поэтому любая страница стоит одинаково. Колонки order
+    должны однозначно задавать порядок (последней обычно идёт id) и быть в выборке.
+    """
+    if cursor:
+        values = _decode_cursor(cursor, order)
+        key, after = (order[0], values[0]) if len(order) == 1 else (tuple_(*order), tuple_(*values))
+        query = query.where(key < after if descending else key > after)
+    query = query.order_by(*(column.desc() if descending else column for column in order)).limit(limit + 1)
+    rows = [dict(row) for row in (await session.execute(query)).mappings()]
+    if len(rows) <= limit:
+        return Page(rows, None)
+    rows = rows[:limit]
+    return Page(rows, _encode_cursor([rows[-1][column.key] for column in order]))
+
+
+async def list_users(
+    session: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    q: Optional[str] = None,
+    tg_id: Optional[int] = None,
+    is_trial: Optional[bool] = None,
+    expires_after: Optional[datetime] = None,
+    expires_before: Optional[datetime] = None,
+) -> Page:
+    """
+    Пользователи, новые сначала. q - начало логина или имени (с учётом регистра).
+    С фильтром по дате окончания список идёт по возрастанию end_date.
+    """
+    query = select(User.id, User.tg_id, User.login, User.name, User.start_date, User.is_trial, User.end_date)
+    if q:
+        query = query.where(or_(_prefix(User.login, q), _prefix(User.name, q)))
+    if tg_id is not None:
+        query = query.where(User.tg_id == tg_id)
+    if is_trial is not None:
+        query = query.where(User.is_trial == is_trial)
+    if expires_after is None and expires_before is None:
+        return await fetch_page(session, query, (User.id,), cursor, limit, descending=True)
+    if expires_after is not None:
+        query = query.where(User.end_date > expires_after)
+    if expires_before is not None:
+        query = query.where(User.end_date <= expires_before)
+    return await fetch_page(session, query, (User.end_date, User.id), cursor, limit)
+
+
+async def list_recipes(
+    session: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    q: Optional[str] = None,
+    category_id: Optional[int] = None,
+    cuisine_id: Optional[int] = None,
+    type_id: Optional[int] = None,
+) -> Page:
+    """Рецепты, новые сначала. q - начало названия (с учётом регистра)."""
+    query = (
+        select(
+            Recipe.id, Recipe.title,
+            Recipe.category_id, Category.name.label("category"),
+            Recipe.cuisine_id, Cuisine.name.label("cuisine"),
+            Recipe.type_id, Type.name.label("type"),
+        )
+        .outerjoin(Category, Category.id == Recipe.category_id)
+        .outerjoin(Cuisine, Cuisine.id == Recipe.cuisine_id)
+        .outerjoin(Type, Type.id == Recipe.type_id)
+    )
+    if q:
+        query = query.where(_prefix(Recipe.title, q))
+    if category_id is not None:
+        query = query.where(Recipe.category_id == category_id)
+    if cuisine_id is not None:
+        query = query.where(Recipe.cuisine_id == cuisine_id)
+    if type_id is not None:
+        query = query.where(Recipe.type_id == type_id)
+    return await fetch_page(session, query, (Recipe.id,), cursor, limit, descending=True)
+
+
+async def list_ingredients(
+    session: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    q: Optional[str] = None,
+    ingredient_type_id: Optional[int] = None,
+) -> Page:
+    """Ингредиенты по алфавиту. q - начало названия (с учётом регистра)."""
+    query = select(
+        Ingredient.id, Ingredient.name,
+        Ingredient.ingredient_type_id, IngredientType.name.label("ingredient_type"),
+        Ingredient.protein, Ingredient.fat, Ingredient.carbohydrate,
+    ).outerjoin(IngredientType, IngredientType.id == Ingredient.ingredient_type_id)
+    if q:
+        query = query.where(_prefix(Ingredient.name, q))
+    if ingredient_type_id is not None:
+        query = query.where(Ingredient.ingredient_type_id == ingredient_type_id)
+    return await fetch_page(session, query, (Ingredient.name, Ingredient.id), cursor, limit)
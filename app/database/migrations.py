@@ -0,0 +1,225 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Connection, inspect, DateTime, Integer, String, Column, MetaData, Table, select, insert, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.database.models import engine, Base
+
+logger = logging.getLogger(__name__)
+
+# Таблица с номерами применённых миграций. Живёт в отдельной MetaData,
+# чтобы не попадать в create_all моделей бота.
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String(250), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = []
+
+# Ключ advisory-блокировки PostgreSQL, под которой применяются миграции
+MIGRATIONS_LOCK_KEY = 7100
+
+
+def migration(version: int, description: str):
+    def decorator(func: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def _quote(conn: Connection, name: str) -> str:
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def _rebuild_sqlite_table(conn: Connection, table: Table, source_query: str):
+    """
+    SQLite не умеет добавлять внешние ключи в существующую таблицу, поэтому
+    таблица пересоздаётся по текущей модели и данные копируются из старой.
+    В source_query подставляются {columns} и {old}.
+    """
+    old = f"{table.name}_old"
+    conn.exec_driver_sql(f"ALTER TABLE {_quote(conn, table.name)} RENAME TO {_quote(conn, old)}")
+    table.create(conn)
+    columns = ", ".join(_quote(conn, column.name) for column in table.columns)
+    conn.exec_driver_sql(
+        f"INSERT INTO {_quote(conn, table.name)} ({columns}) "
+        + source_query.format(columns=columns, old=_quote(conn, old))
+    )
+    conn.exec_driver_sql(f"DROP TABLE {_quote(conn, old)}")
+
+
+def _create_indexes(conn: Connection, *tables: Table):
+    for table in tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+@migration(1, "Начальная схема")
+def _initial_schema(conn: Connection):
+    Base.metadata.create_all(conn)
+
+
+@migration(2, "Индексы и внешние ключи для поиска рецептов")
+def _search_indexes(conn: Connection):
+    tables = Base.metadata.tables
+    if conn.dialect.name == 'sqlite':
+        inspector = inspect(conn)
+        if not inspector.get_foreign_keys('recipes'):
+            _rebuild_sqlite_table(conn, tables['recipes'], "SELECT {columns} FROM {old}")
+        if not inspector.get_foreign_keys('recipe_ingredient'):
+            # Заодно убираем дубли и ссылки на удалённые рецепты и ингредиенты
+            _rebuild_sqlite_table(
+                conn, tables['recipe_ingredient'],
+                "SELECT MIN(id), recipe_id, ingredient_id FROM {old} "
+                "WHERE recipe_id IN (SELECT id FROM recipes) AND ingredient_id IN (SELECT id FROM ingredients) "
+                "GROUP BY recipe_id, ingredient_id",
+            )
+    _create_indexes(conn, *(tables[name] for name in (
+        'users', 'categories', 'types', 'cuisines', 'recipes', 'recipe_ingredient', 'ingredients', 'ingredient_type',
+    )))
+
+
+@migration(3, "Журнал уведомлений Юкассы")
+def _payment_events(conn: Connection):
+    table = Base.metadata.tables['payment_events']
+    table.create(conn, checkfirst=True)
+    _create_indexes(conn, table)
+
+
+@migration(4, "Хранилище состояний FSM")
+def _fsm_states(conn: Connection):
+    table = Base.metadata.tables['fsm_states']
+    table.create(conn, checkfirst=True)
+    _create_indexes(conn, table)
+
+
+@migration(5, "Индекс по окончанию подписки и журнал напоминаний")
+def _expiry_notices(conn: Connection):
+    users = Base.metadata.tables['users']
+    table = Base.metadata.tables['expiry_notices']
+    table.create(conn, checkfirst=True)
+    _create_indexes(conn, users, table)
+
+
+@migration(6, "Индексы для списков админки")
+def _admin_indexes(conn: Connection):
+    tables = Base.metadata.tables
+    _create_indexes(conn, tables['users'], tables['recipes'])
+
+
+@migration(7, "Журнал изменений пользователей из админки")
+def _user_changes(conn: Connection):
+    table = Base.metadata.tables['user_changes']
+    table.create(conn, checkfirst=True)
+    _create_indexes(conn, table)
+
+
+def _applied_versions(conn: Connection) -> set:
+    schema_migrations.create(conn, checkfirst=True)
+    return set(conn.scalars(select(schema_migrations.c.version)))
+
+
+def _apply_migrations(conn: Connection) -> List[int]:
+    applied = _applied_versions(conn)
+    done = []
+    for version, description, func in sorted(MIGRATIONS, key=lambda item: item[0]):
+        if version in applied:
+            continue
+        logger.info("Применяем миграцию %s: %s", version, description)
+        func(conn)
+        conn.execute(insert(schema_migrations).values(version=version, description=description, applied_at=datetime.now()))
+        done.append(version)
+    if conn.dialect.name == 'sqlite' and done:
+        for violation in conn.exec_driver_sql("PRAGMA foreign_key_check").all():
+            logger.warning("Нарушение внешнего ключа после миграции: %s", tuple(violation))
+    return done
+
+
+async def upgrade(engine: AsyncEngine = engine) -> List[int]:
+    """Применяет все недостающие миграции в одной транзакции, обновляя базу на месте."""
+    async with engine.connect() as conn:
+        driver_connection = None
+        if conn.dialect.name == 'sqlite':
+            # Драйвер сам не включает DDL в транзакцию; в AUTOCOMMIT её открывает
+            # install_profile, и миграции атомарны
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            # Пока таблицы пересоздаются, внешние ключи не проверяем.
+            # PRAGMA действует только вне транзакции, поэтому идём мимо SQLAlchemy.
+            driver_connection = (await conn.get_raw_connection()).driver_connection
+            await driver_connection.execute("PRAGMA foreign_keys=OFF")
+        try:
+            async with conn.begin():
+                if conn.dialect.name == 'postgresql':
+                    # Несколько процессов бота стартуют одновременно: миграции применяет
+                    # один, остальные ждут и видят уже обновлённую схему
+                    await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+                return await conn.run_sync(_apply_migrations)
+        finally:
+            if driver_connection is not None:
+                await driver_connection.execute("PRAGMA foreign_keys=ON")
+
+
+# Горячие запросы бота. Если какой-то из них перестанет использовать индекс,
+# check_query_plans сообщит об этом.
+HOT_QUERIES = [
+    ("пользователь по tg_id", "SELECT * FROM users WHERE tg_id = ?", (1,)),
+    ("пользователь по логину", "SELECT * FROM users WHERE login = ?", ('login',)),
+    ("категория по имени", "SELECT id FROM categories WHERE name = ?", ('name',)),
+    ("кухня по имени", "SELECT id FROM cuisines WHERE name = ?", ('name',)),
+    ("диета по имени", "SELECT id FROM types WHERE name = ?", ('name',)),
+    ("ингредиент по имени", "SELECT id FROM ingredients WHERE name = ?", ('name',)),
+    ("тип ингредиента по имени", "SELECT id FROM ingredient_type WHERE name = ?", ('name',)),
+    ("ингредиенты типа", "SELECT name FROM ingredients WHERE ingredient_type_id = ? ORDER BY name", (1,)),
+    ("страница ингредиентов типа", "SELECT id, name FROM ingredients WHERE ingredient_type_id = ? AND (name, id) > (?, ?) ORDER BY name, id LIMIT 5", (1, 'name', 1)),
+    ("страница всех ингредиентов", "SELECT id, name FROM ingredients WHERE (name, id) > (?, ?) ORDER BY name, id LIMIT 20", ('name', 1)),
+    ("окончание подписки в окне", "SELECT id, tg_id FROM users WHERE end_date > ? AND end_date <= ? AND (end_date, id) > (?, ?) ORDER BY end_date, id LIMIT 500", ('2025-01-01', '2025-01-02', '2025-01-01', 0)),
+    ("напоминание уже отправлено", "SELECT 1 FROM expiry_notices WHERE tg_id = ? AND end_date = ? AND kind = ?", (1, '2025-01-01', 'soon')),
+    ("рецепты по категории, кухне и типу", "SELECT id FROM recipes WHERE category_id = ? AND cuisine_id = ? AND type_id = ?", (1, 1, 1)),
+    ("рецепты по кухне", "SELECT id FROM recipes WHERE cuisine_id = ?", (1,)),
+    ("рецепты по типу", "SELECT id FROM recipes WHERE type_id = ?", (1,)),
+    ("изменения пользователей из админки", "SELECT id, tg_id FROM user_changes WHERE id > ? ORDER BY id LIMIT 1000", (0,)),
+    ("админка: пользователи", "SELECT id FROM users WHERE id < ? ORDER BY id DESC LIMIT 51", (1000,)),
+    ("админка: пользователи по типу", "SELECT id FROM users WHERE is_trial = ? AND id < ? ORDER BY id DESC LIMIT 51", (1, 1000)),
+    ("админка: пользователи по началу имени", "SELECT id FROM users WHERE name >= ? AND name < ? ORDER BY id DESC LIMIT 51", ('Ан', 'Ан\U0010ffff')),
+    ("админка: рецепты по началу названия", "SELECT id FROM recipes WHERE title >= ? AND title < ? ORDER BY id DESC LIMIT 51", ('Бор', 'Бор\U0010ffff')),
+    ("админка: рецепты категории", "SELECT id FROM recipes WHERE category_id = ? AND id < ? ORDER BY id DESC LIMIT 51", (1, 1000)),
+    ("ингредиенты рецепта", "SELECT ingredient_id FROM recipe_ingredient WHERE recipe_id = ?", (1,)),
+    ("рецепты по ингредиентам", "SELECT recipe_id FROM recipe_ingredient WHERE ingredient_id IN (?, ?)", (1, 2)),
+]
+
+
+def _check_query_plans(conn: Connection) -> List[str]:
+    problems = []
+    for name, sql, params in HOT_QUERIES:
+        plan = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params)]
+        # SCAN без индекса означает полный проход по таблице
+        if any(step.startswith("SCAN") and "INDEX" not in step for step in plan):
+            problems.append(f"{name}: {' | '.join(plan)}")
+    return problems
+
+
+async def check_query_plans(engine: AsyncEngine = engine):
+    async with engine.connect() as conn:
+        if conn.dialect.name != 'sqlite':
+            return
+        problems = await conn.run_sync(_check_query_plans)
+    if problems:
+        raise RuntimeError("Запросы без индекса:\n" + "\n".join(problems))
+
+
+async def main():
+    applied = await upgrade()
+    print(f"Применены миграции: {applied}" if applied else "База уже в актуальном состоянии.")
+    await check_query_plans()
+    print("Все горячие запросы используют индексы.")
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
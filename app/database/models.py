@@ -1,36 +1,67 @@
-from sqlalchemy import BigInteger, String, ForeignKey, Boolean, DateTime, Text, VARCHAR
-from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy import BigInteger, String, ForeignKey, Boolean, DateTime, Text, VARCHAR, Index, make_url
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from  sqlalchemy.ext.asyncio import  AsyncAttrs, async_sessionmaker, create_async_engine
 from datetime import datetime
 
-engine = create_async_engine(url='sqlite+aiosqlite:///db.sqlite3')
+from app.database.sqlite_profile import get_profile, install_profile
+from config import DATABASE_URL, DB_PROFILE, DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+DB_URL = make_url(DATABASE_URL)
+db_profile = get_profile(DB_PROFILE)
+
+if DB_URL.get_backend_name() == 'sqlite':
+    engine = create_async_engine(url=DB_URL)
+    install_profile(engine.sync_engine, db_profile)
+    # Поиск и карточки рецептов читают через отдельный пул, чтобы не ждать
+    # свободного соединения за записями (оплаты, состояния FSM, админка)
+    if db_profile.read_pool_size:
+        read_engine = create_async_engine(url=DB_URL, pool_size=db_profile.read_pool_size, max_overflow=0)
+        install_profile(read_engine.sync_engine, db_profile, read_only=True)
+    else:
+        read_engine = engine
+else:
+    # Серверную базу делят несколько процессов бота, поэтому пул каждого ограничен,
+    # а соединения, которые сервер мог закрыть, проверяются и периодически переоткрываются.
+    # Читатели и писатели здесь друг друга не блокируют, отдельный пул не нужен.
+    engine = create_async_engine(
+        url=DB_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+    )
+    read_engine = engine
 
 async_session = async_sessionmaker(engine)
+async_read_session = async_sessionmaker(read_engine)
 
 
 class Base(AsyncAttrs, DeclarativeBase):
-    p
+    pass
 
 
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Список пользователей в админке с фильтром по типу подписки, новые сначала
+        Index('ix_users_is_trial_id', 'is_trial', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)  # Уникальный идентификатор
     tg_id: Mapped[int] = mapped_column(BigInteger, unique=True)  # ID пользователя в Telegram
-    login: Mapped[str] = mapped_column(String(50), nullable=True)  # Логин (может быть пустым)
-    name: Mapped[str] = mapped_column(String(50), nullable=True)  # Имя (может быть пустым)
+    login: Mapped[str] = mapped_column(String(50), nullable=True, index=True)  # Логин (может быть пустым)
+    name: Mapped[str] = mapped_column(String(50), nullable=True, index=True)  # Имя (может быть пустым)
     start_date: Mapped[datetime] = mapped_column(DateTime, default=datetime.now())  # Дата начала
     is_trial: Mapped[bool] = mapped_column(Boolean, default=True)  # Тип (тест/платная)
-    end_date: Mapped[datetime] = mapped_column(DateTime, nullable=True)  # Дата окончания (может быть пустой)
+    end_date: Mapped[datetime] = mapped_column(DateTime, nullable=True, index=True)  # Дата окончания (может быть пустой)
 
 
 
 class Category(Base):
     __tablename__ = 'categories'
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(50))
+    name: Mapped[str] = mapped_column(String(50), index=True)
 
 
 
@@ -43,12 +74,18 @@ class Category_recipe(Base):
 
 class Recipe(Base):
     __tablename__ = 'recipes'
+    __table_args__ = (
+        # Фильтры поиска: категория + кухня + тип, а также кухня/тип по отдельности
+        Index('ix_recipes_category_cuisine_type', 'category_id', 'cuisine_id', 'type_id'),
+        Index('ix_recipes_cuisine_type', 'cuisine_id', 'type_id'),
+        Index('ix_recipes_type_id', 'type_id'),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
-    title: Mapped[str] = mapped_column(String(250))
+    title: Mapped[str] = mapped_column(String(250), index=True)
     instructions: Mapped[str] = mapped_column(Text)
-    category_id: Mapped[int] = mapped_column(BigInteger)  # Убедитесь, что это число
-    type_id: Mapped[int] = mapped_column(BigInteger)  # Убедитесь, что это число
-    cuisine_id: Mapped[int] = mapped_column(BigInteger)  # Убедитесь, что это число
+    category_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('categories.id'))  # Убедитесь, что это число
+    type_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('types.id'))  # Убедитесь, что это число
+    cuisine_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('cuisines.id'))  # Убедитесь, что это число
     position: Mapped[int] = mapped_column(nullable=True)  # Может быть NULL
     like: Mapped[int] = mapped_column(nullable=True)  # Может быть NULL
     dislike: Mapped[int] = mapped_column(nullable=True)  # Может быть NULL
@@ -62,25 +99,34 @@ class Type_recipe(Base):
 class Type(Base):
     __tablename__ = 'types'
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(50))
+    name: Mapped[str] = mapped_column(String(50), index=True)
 
 class Cuisine(Base):
     __tablename__ = 'cuisines'
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(50))
+    name: Mapped[str] = mapped_column(String(50), index=True)
 
 
 class Recipe_ingredient(Base):
     __tablename__ = 'recipe_ingredient'
+    __table_args__ = (
+        # Покрывающие индексы в обе стороны: ингредиенты рецепта и рецепты ингредиента
+        Index('ix_recipe_ingredient_recipe_ingredient', 'recipe_id', 'ingredient_id', unique=True),
+        Index('ix_recipe_ingredient_ingredient_recipe', 'ingredient_id', 'recipe_id'),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
-    recipe_id: Mapped[int] = mapped_column(BigInteger)
-    ingredient_id: Mapped[int] = mapped_column(BigInteger)
+    recipe_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('recipes.id', ondelete='CASCADE'))
+    ingredient_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('ingredients.id', ondelete='CASCADE'))
 
 
 class Ingredient(Base):
     __tablename__ = 'ingredients'
+    __table_args__ = (
+        # Список ингредиентов типа, отсортированный по имени, читается прямо из индекса
+        Index('ix_ingredients_type_name', 'ingredient_type_id', 'name'),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(50))  # Название ингредиента
+    name: Mapped[str] = mapped_column(String(50), index=True)  # Название ингредиента
     protein: Mapped[str] = mapped_column(String(50))  # Белки
     fat: Mapped[str] = mapped_column(String(50))  # Жиры
     carbohydrate: Mapped[str] = mapped_column(String(50))  # Углеводы
@@ -89,8 +135,49 @@ class Ingredient(Base):
 class IngredientType(Base):
     __tablename__ = 'ingredient_type'
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(50))  # Название типа (например, "Мясо", "Рыба")
+    name: Mapped[str] = mapped_column(String(50), index=True)  # Название типа (например, "Мясо", "Рыба")
+
+
+class PaymentEvent(Base):
+    __tablename__ = 'payment_events'
+    __table_args__ = (
+        Index('ix_payment_events_status', 'status'),
+    )
+    payment_id: Mapped[str] = mapped_column(String(64), primary_key=True)  # ID платежа в Юкассе, защищает от повторов
+    event: Mapped[str] = mapped_column(String(50))  # Тип уведомления, например payment.succeeded
+    user_id: Mapped[int] = mapped_column(BigInteger, nullable=True)  # tg_id из метаданных платежа
+    status: Mapped[str] = mapped_column(String(20), default='pending')  # pending / done / failed
+    attempts: Mapped[int] = mapped_column(default=0)
+    received_at: Mapped[datetime] = mapped_column(DateTime)
+    processed_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+
+
+class FsmState(Base):
+    __tablename__ = 'fsm_states'
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)  # Ключ aiogram: бот, чат, пользователь
+    state: Mapped[str] = mapped_column(String(255), nullable=True)
+    data: Mapped[str] = mapped_column(Text, default='{}')  # Данные состояния в JSON
+    updated_at: Mapped[datetime] = mapped_column(DateTime, index=True)  # По нему удаляются давно брошенные состояния
+
+
+class ExpiryNotice(Base):
+    __tablename__ = 'expiry_notices'
+    # Одно напоминание каждого вида на каждый срок подписки: после продления
+    # end_date меняется и пользователь снова получит уведомления
+    tg_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    end_date: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(20), primary_key=True)  # soon / expired
+    sent_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+class UserChange(Base):
+    __tablename__ = 'user_changes'
+    # Журнал изменений пользователей мимо бота (админка - отдельный процесс):
+    # бот читает его по id и сбрасывает кэш подписок (app/database/user_cache.py)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    tg_id: Mapped[int] = mapped_column(BigInteger)
+    changed_at: Mapped[datetime] = mapped_column(DateTime, index=True)
 
 async def async_main():
-    async with engine.begin() as conn:
-        await  conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+    from app.database.migrations import upgrade
+    await upgrade(engine)
\ No newline at end of file
@@ -0,0 +1,50 @@
+from typing import Optional, Sequence
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import Recipe, Recipe_ingredient
+from app.database.facets import recipe_index
+from app.recipe_cards import forget_recipe_card
+
+
+async def save_recipe(
+    session: AsyncSession,
+    title: str,
+    instructions: str,
+    category_id: int,
+    type_id: int,
+    cuisine_id: int,
+    ingredient_ids: Sequence[int],
+    recipe_id: Optional[int] = None,
+) -> int:
+    """
+    Создаёт рецепт (recipe_id=None) или перезаписывает существующий вместе со списком
+    ингредиентов. Связи пишутся одним executemany, коммит один, число запросов
+    не зависит от числа ингредиентов. Возвращает ID рецепта.
+    """
+    values = dict(title=title, instructions=instructions, category_id=category_id, type_id=type_id, cuisine_id=cuisine_id)
+    if recipe_id is None:
+        recipe_id = await session.scalar(
+            insert(Recipe).values(position=None, like=None, dislike=None, **values).returning(Recipe.id)
+        )
+    else:
+        updated = (await session.execute(
+            update(Recipe).where(Recipe.id == recipe_id).values(**values).execution_options(synchronize_session=False)
+        )).rowcount
+        if not updated:
+            await session.rollback()
+            raise ValueError(f"Рецепт с ID {recipe_id} не найден.")
+        await session.execute(delete(Recipe_ingredient).where(Recipe_ingredient.recipe_id == recipe_id))
+    # Повтор ингредиента нарушил бы уникальный индекс (recipe_id, ingredient_id)
+    ingredient_ids = list(dict.fromkeys(ingredient_ids))
+    if ingredient_ids:
+        await session.execute(insert(Recipe_ingredient), [
+            {"recipe_id": recipe_id, "ingredient_id": ingredient_id} for ingredient_id in ingredient_ids
+        ])
+    await session.commit()
+    # Всё, что нужно индексу, уже известно - перечитывать рецепт из базы незачем
+    recipe_index.add_recipe(recipe_id, category_id, cuisine_id, type_id, ingredient_ids)
+    # SQLite может выдать ID удалённого рецепта повторно
+    forget_recipe_card(recipe_id)
+    return recipe_id
@@ -0,0 +1,107 @@
+import heapq
+import random
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from cachetools import LRUCache
+from sqlalchemy import Select, select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.facets import recipe_index
+from app.database.models import Recipe, Recipe_ingredient
+
+# Списки ID рецептов по комбинации фильтров (категория, кухня, тип, ингредиенты).
+# Достаём только колонку id, без сортировки и без загрузки самих рецептов.
+# Версия индекса входит в ключ, поэтому любое изменение рецептов сбрасывает кэш.
+_recipe_ids: LRUCache = LRUCache(maxsize=512)
+
+# Режимы подбора по ингредиентам: хотя бы один из выбранных или все выбранные
+MATCH_ANY = "any"
+MATCH_ALL = "all"
+
+
+def _filter_key(category_id: Optional[int], cuisine_id: Optional[int], type_id: Optional[int], ingredient_ids: Sequence[int]) -> tuple:
+    return recipe_index.version, category_id, cuisine_id, type_id, tuple(sorted(set(ingredient_ids)))
+
+
+async def get_recipe_ids(session: AsyncSession, category_id: Optional[int] = None, cuisine_id: Optional[int] = None, type_id: Optional[int] = None, ingredient_ids: Sequence[int] = ()) -> Tuple[int, ...]:
+    key = _filter_key(category_id, cuisine_id, type_id, ingredient_ids)
+    ids = _recipe_ids.get(key)
+    if ids is not None:
+        return ids
+    if recipe_index.ready:
+        ids = tuple(recipe_index.find(category_id, cuisine_id, type_id, key[4]))
+    else:
+        ids = tuple(await session.scalars(_recipe_ids_query(category_id, cuisine_id, type_id, key[4])))
+    _recipe_ids[key] = ids
+    return ids
+
+
+def _recipe_ids_query(category_id: Optional[int], cuisine_id: Optional[int], type_id: Optional[int], ingredient_ids: Sequence[int] = ()) -> Select:
+    query = select(Recipe.id)
+    if category_id is not None:
+        query = query.where(Recipe.category_id == category_id)
+    if cuisine_id is not None:
+        query = query.where(Recipe.cuisine_id == cuisine_id)
+    if type_id is not None:
+        query = query.where(Recipe.type_id == type_id)
+    if ingredient_ids:
+        # Подзапрос вместо join, чтобы рецепт не повторялся для каждого ингредиента
+        query = query.where(Recipe.id.in_(
+            select(Recipe_ingredient.recipe_id).where(Recipe_ingredient.ingredient_id.in_(ingredient_ids))
+        ))
+    return query
+
+
+def sample_ids(ids: Sequence[int], limit: int) -> List[int]:
+    if len(ids) <= limit:
+        picked = list(ids)
+        random.shuffle(picked)
+        return picked
+    return random.sample(ids, limit)
+
+
+async def get_ingredient_matches(session: AsyncSession, category_id: Optional[int], cuisine_id: Optional[int], type_id: Optional[int], ingredient_ids: Sequence[int], match_all: bool) -> Iterable[Tuple[int, int, int]]:
+    ingredient_ids = sorted(set(ingredient_ids))
+    has_facets = category_id is not None or cuisine_id is not None or type_id is not None
+    if recipe_index.ready:
+        candidates = set(await get_recipe_ids(session, category_id, cuisine_id, type_id)) if has_facets else None
+        return recipe_index.ingredient_matches(ingredient_ids, candidates, match_all)
+    matched = func.count(func.distinct(Recipe_ingredient.ingredient_id))
+    query = select(Recipe_ingredient.recipe_id, matched).where(
+        Recipe_ingredient.ingredient_id.in_(ingredient_ids)
+    ).group_by(Recipe_ingredient.recipe_id)
+    if match_all:
+        query = query.having(matched == len(ingredient_ids))
+    if has_facets:
+        # Фильтры и подходящие рецепты - подзапросами: список ID может быть длиннее
+        # лимита параметров SQLite (32766) на один запрос
+        query = query.where(Recipe_ingredient.recipe_id.in_(_recipe_ids_query(category_id, cuisine_id, type_id)))
+    counts = dict((await session.execute(query)).all())
+    if not counts:
+        return []
+    totals = dict((await session.execute(
+        select(Recipe_ingredient.recipe_id, func.count()).where(
+            Recipe_ingredient.recipe_id.in_(query.with_only_columns(Recipe_ingredient.recipe_id))
+        ).group_by(Recipe_ingredient.recipe_id)
+    )).all())
+    return [(recipe_id, count, totals.get(recipe_id, count) - count) for recipe_id, count in counts.items()]
+
+
+def top_matches(matches: Iterable[Tuple[int, int, int]], limit: int, penalize_missing: bool = False) -> List[int]:
+    """
+    Лучшие limit рецептов по числу совпавших ингредиентов через кучу, без сортировки
+    всего результата. При равенстве - меньше недостающих (если нужно), затем случайно.
+    """
+    if penalize_missing:
+        key = lambda match: (match[1], -match[2], random.random())
+    else:
+        key = lambda match: (match[1], random.random())
+    return [match[0] for match in heapq.nlargest(limit, matches, key=key)]
+
+
+async def sample_recipe_ids(session: AsyncSession, limit: int, category_id: Optional[int] = None, cuisine_id: Optional[int] = None, type_id: Optional[int] = None, ingredient_ids: Sequence[int] = (), match_mode: str = MATCH_ANY, penalize_missing: bool = False) -> List[int]:
+    if ingredient_ids:
+        matches = await get_ingredient_matches(session, category_id, cuisine_id, type_id, ingredient_ids, match_mode == MATCH_ALL)
+        return top_matches(matches, limit, penalize_missing)
+    ids = await get_recipe_ids(session, category_id, cuisine_id, type_id)
+    return sample_ids(ids, limit)
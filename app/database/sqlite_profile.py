@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import Engine, event
+
+
+@dataclass(frozen=True)
+class SqliteProfile:
+    """Настройки соединений SQLite. None - оставить значение SQLite по умолчанию."""
+    journal_mode: Optional[str] = None
+    synchronous: Optional[str] = None
+    cache_size: Optional[int] = None  # Страниц, а если меньше нуля - КиБ
+    mmap_size: Optional[int] = None  # Байт
+    busy_timeout: int = 5000  # Мс, сколько ждать чужую блокировку, прежде чем вернуть "database is locked"
+    read_pool_size: int = 0  # Соединений только для чтения; 0 - читать через общий пул
+
+    def pragmas(self, read_only: bool = False) -> List[str]:
+        pragmas = ["PRAGMA foreign_keys=ON", f"PRAGMA busy_timeout={self.busy_timeout}"]
+        # Режим журнала хранится в файле базы, менять его должен тот, кто пишет
+        if self.journal_mode and not read_only:
+            pragmas.append(f"PRAGMA journal_mode={self.journal_mode}")
+        if self.synchronous:
+            pragmas.append(f"PRAGMA synchronous={self.synchronous}")
+        if self.cache_size is not None:
+            pragmas.append(f"PRAGMA cache_size={self.cache_size}")
+        if self.mmap_size is not None:
+            pragmas.append(f"PRAGMA mmap_size={self.mmap_size}")
+        if read_only:
+            pragmas.append("PRAGMA query_only=ON")
+        return pragmas
+
+
+PROFILES: Dict[str, SqliteProfile] = {
+    # Как было раньше: журнал отката, читатели и писатель блокируют друг друга
+    "default": SqliteProfile(),
+    # WAL: чтение не ждёт записи и наоборот. synchronous=NORMAL в режиме WAL не
+    # портит базу при сбое, но последние транзакции до сбоя питания могут пропасть.
+    "wal": SqliteProfile(
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        cache_size=-65536,
+        mmap_size=256 * 1024 * 1024,
+        busy_timeout=5000,
+        read_pool_size=4,
+    ),
+}
+
+
+def get_profile(name: str) -> SqliteProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Неизвестный профиль SQLite '{name}', доступны: {', '.join(PROFILES)}") from None
+
+
+def install_profile(engine: Engine, profile: SqliteProfile, read_only: bool = False):
+    """Применяет профиль к каждому новому соединению движка (синхронного или engine.sync_engine)."""
+    pragmas = profile.pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        # Внешние ключи SQLite проверяет только если это включено на соединении
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        # Обычно транзакцию открывает драйвер перед первым INSERT/UPDATE/DELETE, а чтения
+        # до него идут вне транзакции. Иначе сессия, которая прочитала и потом пишет,
+        # сразу получает "database is locked", если между чтением и записью закоммитил
+        # кто-то другой: busy_timeout в этом случае не ждёт. Соединение в AUTOCOMMIT
+        # (миграции, см. upgrade) драйвер в транзакцию не оборачивает вовсе, и чтобы
+        # DDL был атомарным, транзакцию открываем сами.
+        if conn.get_execution_options().get("isolation_level") == "AUTOCOMMIT":
+            conn.exec_driver_sql("BEGIN")
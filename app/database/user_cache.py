@@ -0,0 +1,128 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from cachetools import TTLCache
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache_bus import cache_bus
+from app.database.models import async_session, User, UserChange
+
+logger = logging.getLogger(__name__)
+
+
+class UserAccess(NamedTuple):
+    tg_id: int
+    name: Optional[str]
+    is_trial: bool
+    end_date: Optional[datetime]
+
+    @property
+    def has_access(self) -> bool:
+        return bool(self.end_date and self.end_date > datetime.now())
+
+
+# Статус подписки по tg_id. Изменения из самого бота записываются сюда сразу,
+# изменения из других процессов (админка, приёмник оплат) приходят через журнал
+# user_changes (record_user_change и UserChangeWatcher).
+# TTL страхует от правок базы руками.
+_users: TTLCache = TTLCache(maxsize=50000, ttl=300)
+# Незарегистрированных тоже кэшируем, чтобы не ходить в базу на каждое сообщение
+_NOT_REGISTERED = object()
+
+
+async def get_user_access(session: AsyncSession, tg_id: int) -> Optional[UserAccess]:
+    access = _users.get(tg_id)
+    if access is None:
+        row = (await session.execute(
+            select(User.name, User.is_trial, User.end_date).where(User.tg_id == tg_id)
+        )).first()
+        access = UserAccess(tg_id, row.name, row.is_trial, row.end_date) if row else _NOT_REGISTERED
+        _users[tg_id] = access
+    return None if access is _NOT_REGISTERED else access
+
+
+def remember_user(tg_id: int, name: Optional[str], is_trial: bool, end_date: Optional[datetime]):
+    _users[tg_id] = UserAccess(tg_id, name, is_trial, end_date)
+    cache_bus.publish("remember_user", tg_id, name, is_trial, end_date)
+
+
+def forget_user(tg_id: int):
+    _users.pop(tg_id, None)
+    cache_bus.publish("forget_user", tg_id)
+
+
+cache_bus.subscribe("remember_user", remember_user)
+cache_bus.subscribe("forget_user", forget_user)
+
+
+async def record_user_change(session: AsyncSession, tg_id: int):
+    """
+    Отмечает в журнале, что пользователь изменён. Вызывается в транзакции, которая
+    меняет пользователя, из процессов, не связанных с ботом через cache_bus: бот
+    прочитает журнал и сбросит кэш за несколько секунд.
+    """
+    await session.execute(insert(UserChange).values(tg_id=tg_id, changed_at=datetime.now()))
+
+
+class UserChangeWatcher:
+    """
+    Раз в interval секунд читает из user_changes записи, добавленные после
+    последней прочитанной, и сбрасывает кэш этих пользователей здесь и, через
+    cache_bus, в процессах-обработчиках. Запрос идёт по первичному ключу, так что
+    пустой опрос почти ничего не стоит. Записи старше keep удаляются.
+    """
+
+    def __init__(self, interval: float = 5, keep: timedelta = timedelta(days=1), batch_size: int = 1000):
+        self.interval = interval
+        self.keep = keep
+        self.batch_size = batch_size
+        self.last_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self.forgotten = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.exception("Не удалось прочитать изменения пользователей")
+            await asyncio.sleep(self.interval)
+
+    async def poll_once(self) -> int:
+        """Сбрасывает кэш изменённых пользователей. Возвращает число прочитанных записей."""
+        async with async_session() as session:
+            if self.last_id is None:
+                # Кэш процесса только что создан: старые записи к нему не относятся
+                self.last_id = await session.scalar(select(func.max(UserChange.id))) or 0
+                return 0
+            rows = (await session.execute(
+                select(UserChange.id, UserChange.tg_id)
+                .where(UserChange.id > self.last_id)
+                .order_by(UserChange.id)
+                .limit(self.batch_size)
+            )).all()
+            if not rows:
+                return 0
+            for _, tg_id in rows:
+                forget_user(tg_id)
+            self.last_id = rows[-1].id
+            self.forgotten += len(rows)
+            await session.execute(delete(UserChange).where(UserChange.changed_at < datetime.now() - self.keep))
+            await session.commit()
+        return len(rows)
+
+
+user_change_watcher = UserChangeWatcher()
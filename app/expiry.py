@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter
+from sqlalchemy import exists, insert, select, text, tuple_
+
+from app.bot import bot
+from app.database.models import async_session, engine, ExpiryNotice, User
+from app.handlers import notify_subscription_end, notify_subscription_soon
+from app.outbound import Lane, send_lane
+
+logger = logging.getLogger(__name__)
+
+SOON, EXPIRED = 'soon', 'expired'
+
+# Ключ advisory-блокировки PostgreSQL: проход делает один процесс бота из нескольких
+EXPIRY_LOCK_KEY = 7101
+
+
+class ExpiryScheduler:
+    """
+    Раз в interval секунд ищет по индексу users.end_date подписки, которые скоро
+    закончатся или уже закончились, и отправляет напоминания пачками по batch_size
+    в очереди уведомлений (см. app.outbound). Отправленное записывается в
+    expiry_notices, поэтому после перезапуска никто не получит напоминание повторно.
+    """
+
+    def __init__(
+        self,
+        interval: float = 60,
+        remind_before: timedelta = timedelta(days=1),
+        catch_up: timedelta = timedelta(days=1),
+        batch_size: int = 200,
+    ):
+        self.interval = interval
+        self.remind_before = remind_before
+        # Насколько далеко в прошлое смотрим, чтобы догнать пропущенное, пока бот стоял
+        self.catch_up = catch_up
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.failed = 0
+        self.last_run_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._run_exclusive()
+            except Exception:
+                logger.exception("Ошибка при рассылке напоминаний о подписке")
+            await asyncio.sleep(self.interval)
+
+    async def _run_exclusive(self):
+        if engine.dialect.name != 'postgresql':
+            await self.run_once()
+            return
+        async with engine.connect() as conn:
+            if not await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": EXPIRY_LOCK_KEY}):
+                return
+            try:
+                await self.run_once()
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": EXPIRY_LOCK_KEY})
+                await conn.commit()
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """Один проход по обоим окнам. Возвращает, скольких пользователей обработали."""
+        now = now or datetime.now()
+        started = time.monotonic()
+        done = await self._scan(SOON, now, now + self.remind_before)
+        done += await self._scan(EXPIRED, now - self.catch_up, now)
+        self.last_run_ms = round((time.monotonic() - started) * 1000, 1)
+        if done:
+            logger.info("Обработано напоминаний о подписке: %s за %s мс", done, self.last_run_ms)
+        return done
+
+    async def _scan(self, kind: str, start: datetime, end: datetime) -> int:
+        # Окно (start, end] читается по индексу end_date страницами по (end_date, id),
+        # так что неудачные отправки не зацикливают проход и подождут следующего
+        sent = 0
+        last: Optional[Tuple[datetime, int]] = None
+        while True:
+            async with async_session() as session:
+                rows = (await session.execute(self.window_query(kind, start, end, last))).all()
+            if not rows:
+                return sent
+            last = rows[-1].end_date, rows[-1].id
+            done = await self._send_batch(kind, rows)
+            if done:
+                async with async_session() as session:
+                    await session.execute(insert(ExpiryNotice), [
+                        {"tg_id": tg_id, "end_date": end_date, "kind": kind, "sent_at": datetime.now()}
+                        for tg_id, end_date in done
+                    ])
+                    await session.commit()
+            sent += len(done)
+            if len(rows) < self.batch_size:
+                return sent
+
+    def window_query(self, kind: str, start: datetime, end: datetime, last: Optional[Tuple[datetime, int]] = None):
+        """Следующая страница окна после last, без тех, кому напоминание kind уже ушло."""
+        query = (
+            select(User.id, User.tg_id, User.is_trial, User.end_date)
+            .where(User.end_date > start, User.end_date <= end)
+            .where(~exists().where(
+                ExpiryNotice.tg_id == User.tg_id,
+                ExpiryNotice.end_date == User.end_date,
+                ExpiryNotice.kind == kind,
+            ))
+            .order_by(User.end_date, User.id)
+            .limit(self.batch_size)
+        )
+        if last is not None:
+            query = query.where(tuple_(User.end_date, User.id) > tuple_(*last))
+        return query
+
+    async def _send_batch(self, kind: str, rows) -> List[Tuple[int, datetime]]:
+        """Отправляет пачку; возвращает тех, кого больше не нужно уведомлять."""
+        with send_lane(Lane.notification):
+            results = await asyncio.gather(*(self._notify(kind, row) for row in rows), return_exceptions=True)
+        done = []
+        for row, result in zip(rows, results):
+            if isinstance(result, (TelegramNetworkError, TelegramRetryAfter, OSError)):
+                # Временная ошибка - попробуем на следующем проходе
+                self.failed += 1
+                continue
+            if isinstance(result, TelegramAPIError):
+                # Бот заблокирован, чат удалён и т.п. - повтор не поможет
+                logger.info("Напоминание %s для %s не доставлено: %s", kind, row.tg_id, result)
+            elif isinstance(result, Exception):
+                self.failed += 1
+                logger.error("Напоминание %s для %s: %r", kind, row.tg_id, result)
+                continue
+            else:
+                self.sent += 1
+            done.append((row.tg_id, row.end_date))
+        return done
+
+    @staticmethod
+    async def _notify(kind: str, row):
+        if kind == SOON:
+            await notify_subscription_soon(bot, row.tg_id, row.is_trial, row.end_date)
+        else:
+            await notify_subscription_end(bot, row.tg_id, row.is_trial)
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "failed": self.failed, "last_run_ms": self.last_run_ms}
+
+
+expiry_scheduler = ExpiryScheduler()
@@ -0,0 +1,233 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.database.models import engine, FsmState
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'touched')
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        self.state = state
+        self.data = data or {}
+        self.touched = time.monotonic()
+
+
+class DatabaseStorage(BaseStorage):
+    """
+    Хранилище состояний FSM в базе бота. Состояния активных пользователей держатся
+    в памяти, изменения копятся и раз в flush_interval пишутся одной транзакцией,
+    так что несколько update_data за апдейт превращаются в одну запись.
+    Неиспользуемые записи выгружаются из памяти через hot_ttl и удаляются из базы,
+    если не менялись дольше state_ttl.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine = engine,
+        key_builder: Optional[KeyBuilder] = None,
+        flush_interval: float = 1,
+        hot_ttl: float = 600,
+        state_ttl: timedelta = timedelta(days=7),
+        cleanup_interval: float = 3600,
+    ):
+        self.engine = engine
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.flush_interval = flush_interval
+        self.hot_ttl = hot_ttl
+        self.state_ttl = state_ttl
+        self.cleanup_interval = cleanup_interval
+        self._records: Dict[str, _Record] = {}
+        self._dirty: Set[str] = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_cleanup = 0.0
+        self.reads = 0  # Сколько раз состояние загружалось из базы
+        self.writes = 0  # Сколько строк записано в базу
+
+    async def _record(self, key: StorageKey) -> _Record:
+        name = self.key_builder.build(key)
+        record = self._records.get(name)
+        if record is None:
+            loaded = await self._load(name)
+            # Пока шла загрузка, запись мог создать другой апдейт
+            record = self._records.setdefault(name, loaded)
+        record.touched = time.monotonic()
+        return record
+
+    async def _load(self, name: str) -> _Record:
+        self.reads += 1
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(
+                select(FsmState.state, FsmState.data).where(FsmState.key == name)
+            )).first()
+        return _Record(row.state, json.loads(row.data)) if row else _Record()
+
+    def _mark_dirty(self, key: StorageKey):
+        self._dirty.add(self.key_builder.build(key))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._record(key)
+        record.data = data.copy()
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось сохранить состояния FSM, повторим позже")
+            self._evict_idle()
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией и чистит устаревшие строки."""
+        cleanup = time.monotonic() - self._last_cleanup >= self.cleanup_interval
+        if not self._dirty and not cleanup:
+            return
+        names, self._dirty = self._dirty, set()
+        now = datetime.now()
+        rows, empty = [], []
+        for name in names:
+            record = self._records.get(name)
+            if record is None:
+                continue
+            if record.state is None and not record.data:
+                # Состояние сброшено (state.clear()) - строка больше не нужна
+                empty.append(name)
+            else:
+                rows.append({
+                    "key": name,
+                    "state": record.state,
+                    "data": json.dumps(record.data, ensure_ascii=False),
+                    "updated_at": now,
+                })
+        try:
+            async with self.engine.begin() as conn:
+                if rows:
+                    # INSERT ... ON CONFLICT DO UPDATE одинаково пишется в SQLite и PostgreSQL
+                    upsert = postgresql_insert if conn.dialect.name == 'postgresql' else sqlite_insert
+                    stmt = upsert(FsmState)
+                    await conn.execute(stmt.on_conflict_do_update(
+                        index_elements=[FsmState.key],
+                        set_={"state": stmt.excluded.state, "data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at},
+                    ), rows)
+                if empty:
+                    await conn.execute(delete(FsmState).where(FsmState.key.in_(empty)))
+                if cleanup:
+                    await conn.execute(delete(FsmState).where(FsmState.updated_at < now - self.state_ttl))
+        except Exception:
+            # Вернём ключи в очередь, чтобы не потерять изменения
+            self._dirty |= names
+            raise
+        self.writes += len(rows) + len(empty)
+        if cleanup:
+            self._last_cleanup = time.monotonic()
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self.hot_ttl
+        for name in [name for name, record in self._records.items() if record.touched < deadline and name not in self._dirty]:
+            del self._records[name]
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+
+class BufferedFSMContext(FSMContext):
+    """
+    FSMContext на время одного апдейта. Данные читаются из хранилища один раз,
+    все изменения копятся в памяти и записываются в flush() одной операцией,
+    только если что-то действительно поменялось.
+    """
+
+    def __init__(self, context: FSMContext, state: Optional[str]):
+        super().__init__(storage=context.storage, key=context.key)
+        self._state = state  # Состояние уже прочитано FSM-миддлварью aiogram (raw_state)
+        self._state_changed = False
+        self._data: Optional[Dict[str, Any]] = None
+        self._loaded: Optional[Dict[str, Any]] = None  # Снимок данных на момент чтения
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_changed = True
+
+    async def get_state(self) -> Optional[str]:
+        return self._state
+
+    async def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = await self.storage.get_data(key=self.key)
+            # Глубокая копия: обработчики меняют списки из get_data на месте
+            self._loaded = copy.deepcopy(self._data)
+        return self._data
+
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        if self._data is None:
+            # Данные заменяются целиком, читать старые незачем
+            self._loaded = None
+        self._data = data.copy()
+
+    async def get_data(self) -> Dict[str, Any]:
+        return (await self._load()).copy()
+
+    async def get_value(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+        # FSMContext.get_value из aiogram (с версии 3.14) читает прямо из хранилища,
+        # мимо изменений, накопленных за этот апдейт
+        return (await self._load()).get(key, default)
+
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        if data:
+            kwargs.update(data)
+        current = await self._load()
+        current.update(kwargs)
+        return current.copy()
+
+    def changed_keys(self) -> Set[str]:
+        if self._data is None:
+            return set()
+        loaded = self._loaded or {}
+        return {key for key in self._data.keys() | loaded.keys() if self._data.get(key, _MISSING) != loaded.get(key, _MISSING)}
+
+    async def flush(self):
+        if self._state_changed:
+            await self.storage.set_state(key=self.key, state=self._state)
+            self._state_changed = False
+        if self._data is not None and (self._loaded is None or self.changed_keys()):
+            await self.storage.set_data(key=self.key, data=self._data)
+            self._loaded = copy.deepcopy(self._data)
@@ -1,9 +1,9 @@
 import re
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Optional, Tuple
 
 from aiogram.exceptions import TelegramBadRequest
-from sqlalchemy import select, and_, or_, func, delete
+from sqlalchemy import select, and_, or_
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ReplyKeyboardMarkup, \
@@ -12,12 +12,28 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.models import User, async_session, Recipe, Recipe_ingredient, Ingredient, Category, Cuisine, Type, IngredientType
-from app.database.requests import set_user, get_ingredients_by_type
+from app.database.models import User, async_session, async_read_session, Recipe, Ingredient, Category, Cuisine, Type, IngredientType
+from app.database.requests import search_recipe_ids, resolve_name
+from app.database.recipe_writes import save_recipe
+from app.database.sampling import MATCH_ALL, MATCH_ANY
+from app.database.ingredient_pages import ingredient_pages, admin_ingredient_pages, forget_ingredient_pages
+from app.database.facets import recipe_index
+from app.database.user_cache import get_user_access, remember_user
 from app.yookassa_payment import create_payment
 import app.keyboards as kb
+from app.middlewares import DbSessionMiddleware, FSMBufferMiddleware, db_stats
+from app.recipe_cards import get_recipe_card, forget_recipe_card, card_cache
+from app.buttons import ButtonActions, labels, normalize
+from app.markup_edits import markup_editor
+from app.outbound import outbound
+from app.callbacks import IngredientToggle, AdminIngredientToggle, IngredientPage, RecipeNav, RecipeAction
 
 router = Router()
+# Одна сессия БД на апдейт, обработчики получают её параметром session
+router.message.outer_middleware(DbSessionMiddleware(async_session))
+router.callback_query.outer_middleware(DbSessionMiddleware(async_session))
+router.message.outer_middleware(FSMBufferMiddleware())
+router.callback_query.outer_middleware(FSMBufferMiddleware())
 
 class Form(StatesGroup):
     waiting_for_first_menu = State()
@@ -63,53 +79,56 @@ class AdminStates(StatesGroup):
     waiting_for_recipe_to_edit = State()
     waiting_for_recipe_to_delete = State()
 
-def clean_text(text: str) -> str:
-    if text is None:
-        return ""
-    return re.sub(r'[^\w\s]', '', text).strip()
+# Кнопки главного меню, см. menu.register ниже
+menu = ButtonActions()
 
-def clean_button_texts(button_texts: List[str]) -> List[str]:
-    return [clean_text(text) for text in button_texts]
+DIET_OPTIONS = labels(kb.diet)
+CATEGORY_OPTIONS = labels(kb.category)
+COUNTRY_OPTIONS = labels(kb.country)
+INGRIDIENT_CATEGORY_OPTIONS = labels(kb.ingridientCategory)
+# Кнопки поиска на шаге выбора ингредиентов: хватит любого выбранного или нужны все
+SEARCH_MATCH_MODES = {"Показать рецепты": MATCH_ANY, "Только со всеми ингредиентами": MATCH_ALL}
 
 async def get_user(session: AsyncSession, tg_id: int) -> Optional[User]:
     return await session.scalar(select(User).where(User.tg_id == tg_id))
 
 async def create_user(session: AsyncSession, tg_id: int, login: str, name: str, is_trial: bool = True) -> User:
+    end_date = datetime.now() + timedelta(days=3 if is_trial else 365)
     user = User(
         tg_id=tg_id,
         login=login,
         name=name,
         is_trial=is_trial,
         start_date=datetime.now(),
-        end_date=datetime.now() + timedelta(days=3 if is_trial else 365)
+        end_date=end_date
     )
     session.add(user)
     await session.commit()
+    remember_user(tg_id, name, is_trial, end_date)
     return user
 
 @router.message(CommandStart())
-async def cmd_start(message: Message, state: FSMContext, user_id: int = None):
+async def cmd_start(message: Message, state: FSMContext, session: AsyncSession, user_id: int = None):
     target_user_id = user_id if user_id is not None else message.from_user.id
-    async with async_session() as session:
-        user = await get_user(session, target_user_id)
-        if user:
-            welcome_message = f"Добро пожаловать, {user.name}!"
-            if user.end_date and user.end_date > datetime.now():
-                await message.answer(welcome_message, reply_markup=kb.authorized_main)
-            else:
-                await message.answer(f"{welcome_message}\nВаша подписка истекла.", reply_markup=kb.expired_subscription_main)
+    user = await get_user_access(session, target_user_id)
+    if user:
+        welcome_message = f"Добро пожаловать, {user.name}!"
+        if user.has_access:
+            await message.answer(welcome_message, reply_markup=kb.authorized_main)
         else:
-            await message.answer("Добро пожаловать! Выберите действие:", reply_markup=kb.unauthorized_main)
+            await message.answer(f"{welcome_message}\nВаша подписка истекла.", reply_markup=kb.expired_subscription_main)
+    else:
+        await message.answer("Добро пожаловать! Выберите действие:", reply_markup=kb.unauthorized_main)
     await state.set_state(Form.waiting_for_first_menu)
 
 @router.message(F.text == "Назад")
-async def back_button(message: Message, state: FSMContext):
+async def back_button(message: Message, state: FSMContext, session: AsyncSession):
     await message.answer("Возврат")
     await state.set_state(Form.waiting_for_first_menu)
-    await cmd_start(message, state, user_id=message.from_user.id)
+    await cmd_start(message, state, session, user_id=message.from_user.id)
 
 @router.message(F.text == "/testback")
-async def handle_back(message: Message, state: FSMContext):
+async def handle_back(message: Message, state: FSMContext, session: AsyncSession):
     current_state = await state.get_state()
     try:
         current_index = form_states.index(current_state)
@@ -119,30 +138,29 @@ async def handle_back(message: Message, state: FSMContext):
             if previous_state == Form.waiting_for_diet:
                 await show_diet_options(message, state)
             elif previous_state == Form.waiting_for_category:
-                await show_category_options(message, state)
+                await show_category_options(message, state, session)
             elif previous_state == Form.waiting_for_country:
-                await show_country_options(message, state)
+                await show_country_options(message, state, session)
             elif previous_state == Form.waiting_for_ingridientCategory:
-                await show_ingridientCategory_options(message, state)
+                await show_ingridientCategory_options(message, state, session)
         else:
             await message.answer("Вы уже в начале.")
     except ValueError:
         await message.answer("Невозможно вернуться назад.")
 
-@router.message(lambda message: clean_text(message.text) == 'Помощь', Form.waiting_for_first_menu)
+@menu.register('Помощь', Form.waiting_for_first_menu)
 async def handle_help(message: Message, state: FSMContext):
     await state.set_state(Form.at_first_menu)
     await message.answer('Страница помощи', reply_markup=kb.back)
 
-@router.message(lambda message: clean_text(message.text) == 'Попробовать бесплатно 3 дня', Form.waiting_for_first_menu)
-async def handle_trial(message: Message, state: FSMContext):
-    async with async_session() as session:
-        user = await get_user(session, message.from_user.id)
-        if user and user.is_trial and user.end_date > datetime.now():
-            await message.answer(f"Вы уже активировали пробный период. Он закончится через {(user.end_date - datetime.now()).days} дней.")
-            return
-        await state.set_state(Form.waiting_for_name)
-        await message.answer("Как к вам обращаться?")
+@menu.register('Попробовать бесплатно 3 дня', Form.waiting_for_first_menu)
+async def handle_trial(message: Message, state: FSMContext, session: AsyncSession):
+    user = await get_user_access(session, message.from_user.id)
+    if user and user.is_trial and user.has_access:
+        await message.answer(f"Вы уже активировали пробный период. Он закончится через {(user.end_date - datetime.now()).days} дней.")
+        return
+    await state.set_state(Form.waiting_for_name)
+    await message.answer("Как к вам обращаться?")
 
 @router.message(Form.waiting_for_name)
 async def process_name(message: Message, state: FSMContext):
@@ -151,7 +169,7 @@ async def process_name(message: Message, state: FSMContext):
     await message.answer("Придумайте уникальное имя аккаунта:")
 
 @router.message(Form.waiting_for_login)
-async def process_login(message: Message, state: FSMContext):
+async def process_login(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     name = data.get('name')
     login = message.text
@@ -163,35 +181,50 @@ async def process_login(message: Message, state: FSMContext):
         await message.answer("Логин может содержать только буквы на англ, цифры и символ '_'.")
         return
 
-    async with async_session() as session:
-        existing_login = await session.scalar(select(User).where(User.login == login, User.tg_id != message.from_user.id))
-        if existing_login:
-            await message.answer("Это имя аккаунта уже занято. Пожалуйста, выберите другое.")
-            return
+    existing_login = await session.scalar(select(User).where(User.login == login, User.tg_id != message.from_user.id))
+    if existing_login:
+        await message.answer("Это имя аккаунта уже занято. Пожалуйста, выберите другое.")
+        return
 
-        existing_user = await get_user(session, message.from_user.id)
-        if existing_user:
-            if not existing_user.is_trial or existing_user.end_date <= datetime.now():
-                existing_user.login = login
-                existing_user.name = name
-                existing_user.is_trial = True
-                existing_user.start_date = datetime.now()
-                existing_user.end_date = datetime.now() + timedelta(days=3)
-                await session.commit()
-                await message.answer("Регистрация завершена! Теперь у вас есть доступ к пробному периоду на 3 дня.", reply_markup=kb.back)
-            else:
-                await message.answer(f"Вы уже активировали пробный период. Он закончится через {(existing_user.end_date - datetime.now()).days} дней.")
-                return
-        else:
-            await create_user(session, message.from_user.id, login, name)
+    existing_user = await get_user(session, message.from_user.id)
+    if existing_user:
+        if not existing_user.is_trial or existing_user.end_date <= datetime.now():
+            existing_user.login = login
+            existing_user.name = name
+            existing_user.is_trial = True
+            existing_user.start_date = datetime.now()
+            existing_user.end_date = datetime.now() + timedelta(days=3)
+            end_date = existing_user.end_date
+            await session.commit()
+            remember_user(message.from_user.id, name, True, end_date)
             await message.answer("Регистрация завершена! Теперь у вас есть доступ к пробному периоду на 3 дня.", reply_markup=kb.back)
+        else:
+            await message.answer(f"Вы уже активировали пробный период. Он закончится через {(existing_user.end_date - datetime.now()).days} дней.")
+            return
+    else:
+        await create_user(session, message.from_user.id, login, name)
+        await message.answer("Регистрация завершена! Теперь у вас есть доступ к пробному периоду на 3 дня.", reply_markup=kb.back)
 
     await state.set_state(Form.at_first_menu)
 
+# Все кнопки меню одним обработчиком. Регистрируется здесь, после ввода имени и логина,
+# чтобы набранный в этих шагах текст не перехватывался кнопками, как и раньше.
+router.message.register(menu.dispatch, menu.filter)
+
 async def notify_trial_end(bot: Bot, user_id: int):
     await bot.send_message(user_id, "Ваш пробный период закончился. Пожалуйста, перейдите на полную версию.")
 
-@router.message(lambda message: clean_text(message.text) == 'Получить доступ к полной версии')
+async def notify_subscription_end(bot: Bot, user_id: int, is_trial: bool):
+    if is_trial:
+        await notify_trial_end(bot, user_id)
+    else:
+        await bot.send_message(user_id, "Ваша подписка закончилась. Пожалуйста, оплатите полную версию, чтобы продолжить.")
+
+async def notify_subscription_soon(bot: Bot, user_id: int, is_trial: bool, end_date: datetime):
+    period = "Ваш пробный период закончится" if is_trial else "Ваша подписка закончится"
+    await bot.send_message(user_id, f"{period} {end_date:%d.%m.%Y в %H:%M}. Чтобы не потерять доступ к рецептам, оплатите полную версию.")
+
+@menu.register('Получить доступ к полной версии')
 async def handle_full_access(message: Message, state: FSMContext):
     payment = await create_payment(amount=1, description="Оплата полной версии", metadata={"user_id": message.from_user.id})
     if payment.get("status") == "pending":
@@ -199,90 +232,80 @@ async def handle_full_access(message: Message, state: FSMContext):
     else:
         await message.answer("Произошла ошибка при создании платежа. Пожалуйста, попробуйте позже.")
 
-async def update_user_access(user_id: int):
-    async with async_session() as session:
-        user = await get_user(session, user_id)
-        if user:
-            user.is_trial = False
-            user.end_date = datetime.now() + timedelta(days=365)
-            await session.commit()
-            return True
-        return False
-
-@router.message(lambda message: clean_text(message.text) == 'Перейти к рецептам')
-async def handle_recipes(message: Message, state: FSMContext):
-    async with async_session() as session:
-        user = await get_user(session, message.from_user.id)
-        if user:
-            if user.end_date and user.end_date > datetime.now():
-                await state.set_state(Form.waiting_for_diet)
-                await message.answer("Smart Cookbook рекомендует вам внимательно ознакомится со списком ингредиентов блюд и не использовать в приготовлении ингредиенты содержащие известные вам аллергены. Smart Cookbook рекомендует придерживаться сбалансированного рациона если не имеется медицинских противопоказаний.", reply_markup=kb.diet)
-            else:
-                await message.answer("Ваша подписка истекла. Пожалуйста, оплатите полную версию, чтобы продолжить.", reply_markup=kb.expired_subscription_main)
+@menu.register('Перейти к рецептам')
+async def handle_recipes(message: Message, state: FSMContext, session: AsyncSession):
+    user = await get_user_access(session, message.from_user.id)
+    if user:
+        if user.has_access:
+            await state.set_state(Form.waiting_for_diet)
+            await message.answer("Smart Cookbook рекомендует вам внимательно ознакомится со списком ингредиентов блюд и не использовать в приготовлении ингредиенты содержащие известные вам аллергены. Smart Cookbook рекомендует придерживаться сбалансированного рациона если не имеется медицинских противопоказаний.", reply_markup=kb.diet)
         else:
-            await message.answer("Для доступа к рецептам необходимо зарегистрироваться.", reply_markup=kb.unauthorized_main)
+            await message.answer("Ваша подписка истекла. Пожалуйста, оплатите полную версию, чтобы продолжить.", reply_markup=kb.expired_subscription_main)
+    else:
+        await message.answer("Для доступа к рецептам необходимо зарегистрироваться.", reply_markup=kb.unauthorized_main)
 
 @router.message(Form.waiting_for_diet)
 async def show_diet_options(message: Message, state: FSMContext):
-    valid_options = clean_button_texts(get_button_texts(kb.diet))
-    if clean_text(message.text.lower()) == "не важно":
+    text = normalize(message.text)
+    if text.lower() == "не важно":
         await state.update_data(selected_diet=None)
         await state.set_state(Form.waiting_for_category)
         await message.answer("Пожалуйста, выберите один из предложенных вариантов.", reply_markup=kb.category)
         return
-    if clean_text(message.text) not in valid_options:
+    if text not in DIET_OPTIONS:
         await message.answer("Пожалуйста, выберите один из предложенных вариантов.", reply_markup=kb.diet)
         return
-    await state.update_data(selected_diet=clean_text(message.text))
+    await state.update_data(selected_diet=text)
     await state.set_state(Form.waiting_for_category)
     await message.answer("Пожалуйста, выберите один из предложенных вариантов.", reply_markup=kb.category)
 
 @router.message(Form.waiting_for_category)
-async def show_category_options(message: Message, state: FSMContext):
-    valid_options = clean_button_texts(get_button_texts(kb.category))
-    if clean_text(message.text.lower()) == "не важно":
+async def show_category_options(message: Message, state: FSMContext, session: AsyncSession):
+    text = normalize(message.text)
+    if text.lower() == "не важно":
         await state.update_data(selected_categorys=None)
         await state.set_state(Form.waiting_for_country)
         await message.answer("Пожалуйста, выберите один из предложенных вариантов.", reply_markup=kb.country)
         return
-    if clean_text(message.text) not in valid_options:
+    if text not in CATEGORY_OPTIONS:
         await message.answer("Пожалуйста, выберите один из предложенных вариантов.", reply_markup=kb.category)
         return
-    await state.update_data(selected_categorys=clean_text(message.text))
+    await state.update_data(selected_categorys=text)
     await state.set_state(Form.waiting_for_country)
-    await show_country_options(message, state)
+    await show_country_options(message, state, session)
 
 @router.message(Form.waiting_for_country)
-async def show_country_options(message: Message, state: FSMContext):
-    valid_options = clean_button_texts(get_button_texts(kb.country))
-    if clean_text(message.text.lower()) == "не важно":
+async def show_country_options(message: Message, state: FSMContext, session: AsyncSession):
+    text = normalize(message.text)
+    if text.lower() == "не важно":
         await state.update_data(selected_country=None)
         await state.set_state(Form.waiting_for_ingridientCategory)
-        await show_ingridientCategory_options(message, state)
+        await show_ingridientCategory_options(message, state, session)
         return
-    if clean_text(message.text) not in valid_options:
+    if text not in COUNTRY_OPTIONS:
         await message.answer("Пожалуйста, выберите один из предложенных вариантов.", reply_markup=kb.country)
         return
-    await state.update_data(selected_country=clean_text(message.text))
+    await state.update_data(selected_country=text)
     await state.set_state(Form.waiting_for_ingridientCategory)
-    await show_ingridientCategory_options(message, state)
+    await show_ingridientCategory_options(message, state, session)
 
 @router.message(Form.waiting_for_ingridientCategory)
-async def show_ingridientCategory_options(message: Message, state: FSMContext):
-    valid_options = clean_button_texts(get_button_texts(kb.ingridientCategory))
-    if clean_text(message.text) not in valid_options:
+async def show_ingridientCategory_options(message: Message, state: FSMContext, session: AsyncSession):
+    text = normalize(message.text)
+    if text not in INGRIDIENT_CATEGORY_OPTIONS:
         await message.answer("Пожалуйста, выберите один из предложенных вариантов.", reply_markup=kb.ingridientCategory)
         return
-    if clean_text(message.text) == "Показать рецепты":
+    if text in SEARCH_MATCH_MODES:
+        await state.update_data(match_mode=SEARCH_MATCH_MODES[text])
         await state.set_state(Form.waiting_for_recipe_search)
-        await handle_go_to_recipes(message, state)
+        await handle_go_to_recipes(message, state, session)
         return
-    await state.update_data(selected_ingridientCategory=clean_text(message.text))
+    await state.update_data(selected_ingridientCategory=text)
     await state.set_state(Form.waiting_for_ingridients)
-    await show_ingridients_checkboxes(message, state)
+    await show_ingridients_checkboxes(message, state, session)
 
 @router.message(Form.waiting_for_ingridients)
-async def show_ingridients_checkboxes(message: Message, state: FSMContext):
+async def show_ingridients_checkboxes(message: Message, state: FSMContext, session: AsyncSession):
     # Получаем данные из состояния
     data = await state.get_data()
 
@@ -290,11 +313,11 @@ async def show_ingridients_checkboxes(message: Message, state: FSMContext):
     if message.text == "Готово":
         await state.set_state(Form.waiting_for_ingridientCategory)
         await message.answer('Возврат')
-        await show_ingridientCategory_options(message, state)
+        await show_ingridientCategory_options(message, state, session)
         return  # Пропускаем обработку, так как "Готово" уже обработано в другом обработчике
 
     # Очищаем текст от смайликов и лишних символов
-    cleaned_text = re.sub(r'[^\w\s]', '', message.text).strip()
+    cleaned_text = normalize(message.text)
     print(cleaned_text)
 
     # Получаем текущие данные состояния
@@ -310,20 +333,19 @@ async def show_ingridients_checkboxes(message: Message, state: FSMContext):
     # Логирование для отладки
     print(f"Выбранная категория: {selected_category}")
 
-    async with async_session() as session:
-        try:
-            # Создаем чекбоксы для выбранной категории
-            checkboxes = await create_ingridients_checkboxes(selected_category, data.get('selected_ingridients', []), session, 0)
+    try:
+        # Создаем чекбоксы для выбранной категории
+        checkboxes = await create_ingridients_checkboxes(selected_category, data.get('selected_ingridients', []), session, 0)
 
-            # Отправляем сообщение с чекбоксами
-            await message.answer('Выберите ингредиенты:', reply_markup=checkboxes)
+        # Отправляем сообщение с чекбоксами
+        await message.answer('Выберите ингредиенты:', reply_markup=checkboxes)
 
-            # Отправляем сообщение с кнопкой "Готово"
-            await message.answer('Когда закончите, нажмите "Готово":', reply_markup=create_done_keyboard())
-        except ValueError as e:
-            await message.answer(str(e))
+        # Отправляем сообщение с кнопкой "Готово"
+        await message.answer('Когда закончите, нажмите "Готово":', reply_markup=create_done_keyboard())
+    except ValueError as e:
+        await message.answer(str(e))
 
-@router.message(Form.waiting_for_ingridients, lambda message: clean_text(message.text) == "Готово")
+@router.message(Form.waiting_for_ingridients, lambda message: normalize(message.text) == "Готово")
 async def handle_done(message: Message, state: FSMContext):
     data = await state.get_data()
     selected_ingridients = data.get('selected_ingridients', [])
@@ -331,187 +353,134 @@ async def handle_done(message: Message, state: FSMContext):
     await state.set_state(Form.waiting_for_ingridientCategory)
     await message.answer('Выберите следующий шаг:', reply_markup=kb.ingridientCategory)
 
-@router.callback_query(F.data.startswith("ingridient_"))
-async def handle_ingridient_selection(callback: CallbackQuery, state: FSMContext):
-    ingridient = callback.data.split("_")[1]
+@router.callback_query(IngredientToggle.filter())
+async def handle_ingridient_selection(callback: CallbackQuery, callback_data: IngredientToggle, state: FSMContext, session: AsyncSession):
+    # Отвечаем до чтения состояния и базы, чтобы у кнопки сразу пропал индикатор загрузки,
+    # а клавиатуру правим с задержкой: серия нажатий даст одну правку
+    await callback.answer()
+    ingridient = callback_data.id
     data = await state.get_data()
     selected_ingridients = data.get('selected_ingridients', [])
     current_page = data.get('current_page', 0)
     selected_category = data.get('selected_category')
     if not selected_category:
-        await callback.answer("Ошибка: категория не выбрана.")
+        await callback.message.answer("Ошибка: категория не выбрана.")
         return
     if ingridient in selected_ingridients:
         selected_ingridients.remove(ingridient)
     else:
         selected_ingridients.append(ingridient)
     await state.update_data(selected_ingridients=selected_ingridients)
-    async with async_session() as session:
-        try:
-            await update_ingridients_checkboxes(callback.message, selected_category, selected_ingridients, session, current_page)
-        except ValueError as e:
-            await callback.answer(str(e))
-
-async def update_ingridients_checkboxes(message: Message, selected_category: str, selected_ingridients: list, session: AsyncSession, current_page: int):
-    if not selected_category:
-        await message.answer("Ошибка: категория не выбрана.")
-        return
     try:
         checkboxes = await create_ingridients_checkboxes(selected_category, selected_ingridients, session, current_page)
-        await message.edit_text('Выберите ингредиенты:', reply_markup=checkboxes)
     except ValueError as e:
-        await message.answer(str(e))
+        await callback.message.answer(str(e))
+        return
+    markup_editor.schedule(callback.message, checkboxes)
 
 @router.message(F.text == "Показать рецепты", Form.waiting_for_recipe_search)
-async def handle_go_to_recipes(message: Message, state: FSMContext):
+async def handle_go_to_recipes(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     selected_ingridients = data.get('selected_ingridients', [])
     selected_diet = data.get('selected_diet')
     selected_categorys = data.get('selected_categorys')
     selected_country = data.get('selected_country')
     await state.set_state(Form.waiting_for_recipe_search)
-    await search_recipes(message, state)
+    await search_recipes(message, state, session)
 
-async def search_recipes(message: Message, state: FSMContext):
+async def search_recipes(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     selected_diet = data.get('selected_diet')
     selected_categorys = data.get('selected_categorys')
     selected_country = data.get('selected_country')
     selected_ingridients = data.get('selected_ingridients', [])
-    async with async_session() as session:
-        user = await get_user(session, message.from_user.id)
-        is_trial = user.is_trial if user else True
-        query = select(Recipe)
-        if selected_categorys and selected_categorys.lower() != "не важно":
-            category_query = select(Category.id).where(Category.name == selected_categorys)
-            category_result = await session.execute(category_query)
-            category_id = category_result.scalar()
-            if category_id:
-                query = query.where(Recipe.category_id == category_id)
-        if selected_country and selected_country.lower() != "не важно":
-            cuisine_query = select(Cuisine.id).where(Cuisine.name == selected_country)
-            cuisine_result = await session.execute(cuisine_query)
-            cuisine_id = cuisine_result.scalar()
-            if cuisine_id:
-                query = query.where(Recipe.cuisine_id == cuisine_id)
-        if selected_diet and selected_diet.lower() != "не важно":
-            diet_query = select(Type.id).where(Type.name == selected_diet)
-            diet_result = await session.execute(diet_query)
-            diet_id = diet_result.scalar()
-            if diet_id:
-                query = query.where(Recipe.type_id == diet_id)
-        if selected_ingridients:
-            ingredients_query = select(Ingredient.id).where(Ingredient.name.in_(selected_ingridients))
-            ingredients_result = await session.execute(ingredients_query)
-            ingredient_ids = [ing[0] for ing in ingredients_result]
-            if ingredient_ids:
-                query = query.join(Recipe_ingredient, Recipe.id == Recipe_ingredient.recipe_id).where(
-                    Recipe_ingredient.ingredient_id.in_(ingredient_ids))
-        query = query.order_by(func.random())
-        result = await session.execute(query)
-        recipes = result.scalars().all()
-        if is_trial:
-            recipes = recipes[:3]
-        else:
-            recipes = recipes[:10]
-        if not recipes:
-            await reset_search_parameters(state)
-            await message.answer("Рецепты по вашему запросу не найдены.")
-            await state.set_state(Form.waiting_for_first_menu)
-            await cmd_start(message, state, user_id=message.from_user.id)
-            return
-        await state.update_data(recipes=recipes, current_recipe_index=0)
-        await send_recipe(message, state)
+    match_mode = data.get('match_mode') or MATCH_ANY
+    user = await get_user_access(session, message.from_user.id)
+    is_trial = user.is_trial if user else True
+    # Поиск только читает, поэтому идёт через пул соединений для чтения
+    async with async_read_session() as reader:
+        recipe_ids = await search_recipe_ids(reader, selected_diet, selected_categorys, selected_country, selected_ingridients, is_trial, match_mode)
+    if not recipe_ids:
+        await reset_search_parameters(state)
+        await message.answer("Рецепты по вашему запросу не найдены.")
+        await state.set_state(Form.waiting_for_first_menu)
+        await cmd_start(message, state, session, user_id=message.from_user.id)
+        return
+    # В состоянии храним только ID рецептов и курсор, карточки грузятся при показе
+    await state.update_data(recipe_ids=recipe_ids, current_recipe_index=0)
+    await send_recipe(message, state, session)
 
-async def send_recipe(message: Message, state: FSMContext):
+async def send_recipe(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
-    recipes = data.get('recipes', [])
+    recipe_ids = data.get('recipe_ids', [])
     current_recipe_index = data.get('current_recipe_index', 0)
-    if not recipes or current_recipe_index >= len(recipes):
+    card = None
+    if recipe_ids and current_recipe_index < len(recipe_ids):
+        async with async_read_session() as reader:
+            card = await get_recipe_card(reader, recipe_ids[current_recipe_index])
+    if card is None:
         await message.answer("Рецепты не найдены.")
         await state.set_state(Form.waiting_for_first_menu)
-        await cmd_start(message, state, user_id=message.from_user.id)
+        await cmd_start(message, state, session, user_id=message.from_user.id)
         return
-    recipe = recipes[current_recipe_index]
-    async with async_session() as session:
-        ingredients_query = select(Ingredient.name).join(
-            Recipe_ingredient, Ingredient.id == Recipe_ingredient.ingredient_id
-        ).where(Recipe_ingredient.recipe_id == recipe.id)
-        ingredients_result = await session.execute(ingredients_query)
-        ingredients = [ing[0] for ing in ingredients_result]
-        recipe_text = (
-            f"🍴 <b>{recipe.title}</b>\n\n"
-            f"<b>Ингредиенты:</b>\n"
-            f"{', '.join(ingredients)}\n\n"
-        )
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="prev_recipe")],
-            [InlineKeyboardButton(text="Готовим 🍳", callback_data="cook_recipe")],
-            [InlineKeyboardButton(text="➡️ Следующий", callback_data="next_recipe")]
-        ])
-        if "recipe_message_id" not in data:
+    recipe_text = card.short
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data=RecipeNav(action=RecipeAction.prev).pack())],
+        [InlineKeyboardButton(text="Готовим 🍳", callback_data=RecipeNav(action=RecipeAction.cook).pack())],
+        [InlineKeyboardButton(text="➡️ Следующий", callback_data=RecipeNav(action=RecipeAction.next).pack())]
+    ])
+    if "recipe_message_id" not in data:
+        sent_message = await message.answer(recipe_text, reply_markup=keyboard, parse_mode="HTML")
+        await state.update_data(recipe_message_id=sent_message.message_id)
+    else:
+        try:
+            await message.bot.edit_message_text(
+                chat_id=message.chat.id,
+                message_id=data["recipe_message_id"],
+                text=recipe_text,
+                reply_markup=keyboard,
+                parse_mode="HTML"
+            )
+        except TelegramBadRequest:
             sent_message = await message.answer(recipe_text, reply_markup=keyboard, parse_mode="HTML")
             await state.update_data(recipe_message_id=sent_message.message_id)
-        else:
-            try:
-                await message.bot.edit_message_text(
-                    chat_id=message.chat.id,
-                    message_id=data["recipe_message_id"],
-                    text=recipe_text,
-                    reply_markup=keyboard,
-                    parse_mode="HTML"
-                )
-            except TelegramBadRequest:
-                sent_message = await message.answer(recipe_text, reply_markup=keyboard, parse_mode="HTML")
-                await state.update_data(recipe_message_id=sent_message.message_id)
-
-@router.callback_query(F.data == "prev_recipe")
-async def handle_prev_recipe(callback: CallbackQuery, state: FSMContext):
+
+@router.callback_query(RecipeNav.filter(F.action == RecipeAction.prev))
+async def handle_prev_recipe(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     current_recipe_index = data.get('current_recipe_index', 0)
     if current_recipe_index > 0:
         await state.update_data(current_recipe_index=current_recipe_index - 1)
-        await send_recipe(callback.message, state)
+        await send_recipe(callback.message, state, session)
     else:
         await callback.answer("Это первый рецепт.")
 
-@router.callback_query(F.data == "next_recipe")
-async def handle_next_recipe(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(RecipeNav.filter(F.action == RecipeAction.next))
+async def handle_next_recipe(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     current_recipe_index = data.get('current_recipe_index', 0)
-    recipes = data.get('recipes', [])
-    if current_recipe_index < len(recipes) - 1:
+    recipe_ids = data.get('recipe_ids', [])
+    if current_recipe_index < len(recipe_ids) - 1:
         await state.update_data(current_recipe_index=current_recipe_index + 1)
-        await send_recipe(callback.message, state)
+        await send_recipe(callback.message, state, session)
     else:
         await callback.answer("Это последний рецепт.")
 
-@router.callback_query(F.data == "cook_recipe")
-async def handle_cook_recipe(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(RecipeNav.filter(F.action == RecipeAction.cook))
+async def handle_cook_recipe(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
-    recipes = data.get('recipes', [])
+    recipe_ids = data.get('recipe_ids', [])
     current_recipe_index = data.get('current_recipe_index', 0)
-    if recipes and current_recipe_index < len(recipes):
-        recipe = recipes[current_recipe_index]
-        async with async_session() as session:
-            ingredients_query = select(Ingredient.name).join(
-                Recipe_ingredient, Ingredient.id == Recipe_ingredient.ingredient_id
-            ).where(Recipe_ingredient.recipe_id == recipe.id)
-            ingredients_result = await session.execute(ingredients_query)
-            ingredients = [ing[0] for ing in ingredients_result]
-            recipe_text = (
-                f"🍴 <b>{recipe.title}</b>\n\n"
-                f"<b>Ингредиенты:</b>\n"
-                f"{', '.join(ingredients)}\n\n"
-                f"<b>Инструкция:</b>\n"
-                f"{recipe.instructions}"
-            )
-            await callback.message.answer(recipe_text, parse_mode="HTML")
+    if recipe_ids and current_recipe_index < len(recipe_ids):
+        async with async_read_session() as reader:
+            card = await get_recipe_card(reader, recipe_ids[current_recipe_index])
+        if card:
+            await callback.message.answer(card.full, parse_mode="HTML")
             await callback.message.answer("Мы едим, чтобы жить и получать удовольствие. То, как мы питаемся, влияет на продолжительность и качество жизни. Вылечиться от болезней едой мы не можем, но поддержать здоровье — запросто.")
             await callback.answer("Рецепт переслан. Работа бота завершена.")
             await reset_search_parameters(state)
             await state.set_state(Form.waiting_for_first_menu)
-            await cmd_start(callback.message, state, user_id=callback.from_user.id)
+            await cmd_start(callback.message, state, session, user_id=callback.from_user.id)
 
 async def reset_search_parameters(state: FSMContext):
     await state.update_data(
@@ -520,60 +489,50 @@ async def reset_search_parameters(state: FSMContext):
         selected_country=None,
         selected_ingridients=[],
         selected_ingridientCategory=None,
-        recipes=[],
+        match_mode=None,
+        recipe_ids=[],
         current_recipe_index=0,
         recipe_message_id=None,
     )
 
-def get_button_texts(keyboard: ReplyKeyboardMarkup) -> List[str]:
-    button_texts = []
-    for row in keyboard.keyboard:
-        for button in row:
-            button_texts.append(button.text)
-    return button_texts
-
 @router.message(F.text == 'Ы')
 async def gg(message: Message):
     await message.answer('OK!')
 
-@router.callback_query(F.data.startswith("page_"), Form.waiting_for_ingridients)
-async def handle_page_change(callback: CallbackQuery, state: FSMContext):
-    page = int(callback.data.split("_")[1])
+@router.callback_query(IngredientPage.filter(), Form.waiting_for_ingridients)
+async def handle_page_change(callback: CallbackQuery, callback_data: IngredientPage, state: FSMContext, session: AsyncSession):
+    await callback.answer()
+    page = callback_data.page
     await state.update_data(current_page=page)
     data = await state.get_data()
     selected_category = data.get('selected_category')
     selected_ingridients = data.get('selected_ingridients', [])
-    async with async_session() as session:
-        try:
-            checkboxes = await create_ingridients_checkboxes(selected_category, selected_ingridients, session, page)
-            await callback.message.edit_text('Выберите ингредиенты:', reply_markup=checkboxes)
-        except ValueError as e:
-            await callback.answer(str(e))
-
-async def create_ingridients_checkboxes(selected_category: str, selected_ingridients: list, session: AsyncSession, page: int) -> InlineKeyboardMarkup:
     try:
-        ingredients = await get_ingredients_by_type(selected_category, session)
-        total_pages = (len(ingredients) + 4) // 5
-        start_index = page * 5
-        end_index = start_index + 5
-        page_ingredients = ingredients[start_index:end_index]
-        checkboxes = [
-            [InlineKeyboardButton(
-                text=f"{'✅' if ingredient in selected_ingridients else '☑️'} {ingredient}",
-                callback_data=f"ingridient_{ingredient}"
-            )]
-            for ingredient in page_ingredients
-        ]
-        navigation_buttons = []
-        if page > 0:
-            navigation_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"page_{page - 1}"))
-        if page < total_pages - 1:
-            navigation_buttons.append(InlineKeyboardButton(text="Вперед ➡️", callback_data=f"page_{page + 1}"))
-        if navigation_buttons:
-            checkboxes.append(navigation_buttons)
-        return InlineKeyboardMarkup(inline_keyboard=checkboxes)
+        checkboxes = await create_ingridients_checkboxes(selected_category, selected_ingridients, session, page)
     except ValueError as e:
-        raise e
+        await callback.message.answer(str(e))
+        return
+    markup_editor.schedule(callback.message, checkboxes)
+
+async def create_ingridients_checkboxes(selected_category: str, selected_ingridients: list, session: AsyncSession, page: int) -> InlineKeyboardMarkup:
+    type_id = await ingredient_pages.type_id(session, selected_category)
+    ingredients_page = await ingredient_pages.page(session, type_id, page)
+    page = ingredients_page.number
+    checkboxes = [
+        [InlineKeyboardButton(
+            text=f"{'✅' if ingredient_id in selected_ingridients else '☑️'} {ingredient}",
+            callback_data=IngredientToggle(id=ingredient_id).pack()
+        )]
+        for ingredient_id, ingredient in ingredients_page.items
+    ]
+    navigation_buttons = []
+    if page > 0:
+        navigation_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=IngredientPage(page=page - 1).pack()))
+    if page < ingredients_page.total_pages - 1:
+        navigation_buttons.append(InlineKeyboardButton(text="Вперед ➡️", callback_data=IngredientPage(page=page + 1).pack()))
+    if navigation_buttons:
+        checkboxes.append(navigation_buttons)
+    return InlineKeyboardMarkup(inline_keyboard=checkboxes)
 
 def create_done_keyboard() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
@@ -591,6 +550,30 @@ async def cmd_admin(message: Message, state: FSMContext):
         return
     await message.answer("Добро пожаловать в админ-панель!", reply_markup=kb.admin_panel)
 
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, state: FSMContext):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("У вас нет доступа к этой команде.")
+        return
+    stats = card_cache.stats()
+    db = db_stats.as_dict()
+    edits = markup_editor.stats()
+    sends = outbound.stats()
+    await message.answer(
+        "Кэш карточек рецептов:\n"
+        f"карточек: {stats['items']}, занято: {stats['bytes']} из {stats['max_bytes']} байт\n"
+        f"попадания: {stats['hits']}, промахи: {stats['misses']}, вытеснения: {stats['evictions']}\n\n"
+        "База данных:\n"
+        f"апдейтов: {db['updates']}, сессий на апдейт: {db['sessions_per_update']}\n"
+        f"запросов на апдейт: {db['queries_per_update']}, максимум: {db['max_queries_per_update']}\n\n"
+        "Правки клавиатур:\n"
+        f"отправлено: {edits['edits']}, объединено: {edits['coalesced']}, без изменений: {edits['skipped']}\n\n"
+        "Отправка в Telegram:\n"
+        f"отправлено: {sends['sent']}, повторов после 429: {sends['retried']}\n"
+        f"в очереди: {sends['waiting_interactive']} ответов, {sends['waiting_notification']} уведомлений\n"
+        f"задержка: в среднем {sends['latency_avg_ms']} мс, p95 {sends['latency_p95_ms']} мс"
+    )
+
 @router.message(F.text == 'Добавить')
 async def add_menu(message: Message, state: FSMContext):
     if message.from_user.id not in ADMIN_IDS:
@@ -614,17 +597,20 @@ async def edit_recipe_start(message: Message, state: FSMContext):
     await message.answer("Введите ID рецепта, который хотите изменить:")
 
 @router.message(AdminStates.waiting_for_recipe_to_edit)
-async def process_recipe_to_edit(message: Message, state: FSMContext):
-    recipe_id = message.text
-    async with async_session() as session:
-        recipe = await session.scalar(select(Recipe).where(Recipe.id == int(recipe_id)))
-        if not recipe:
-            await message.answer(f"Рецепт с ID {recipe_id} не найден.")
-            await state.clear()
-            return
-        await state.update_data(recipe_id=recipe_id)
-        await state.set_state(AdminStates.waiting_for_recipe_title)
-        await message.answer("Введите новое название рецепта:")
+async def process_recipe_to_edit(message: Message, state: FSMContext, session: AsyncSession):
+    try:
+        recipe_id = int(message.text)
+    except (TypeError, ValueError):
+        await message.answer("Пожалуйста, введите число.")
+        return
+    recipe = await session.scalar(select(Recipe).where(Recipe.id == recipe_id))
+    if not recipe:
+        await message.answer(f"Рецепт с ID {recipe_id} не найден.")
+        await state.clear()
+        return
+    await state.update_data(recipe_id=recipe_id)
+    await state.set_state(AdminStates.waiting_for_recipe_title)
+    await message.answer("Введите новое название рецепта:")
 
 @router.message(F.text == 'Удалить рецепт')
 async def delete_recipe_start(message: Message, state: FSMContext):
@@ -635,16 +621,21 @@ async def delete_recipe_start(message: Message, state: FSMContext):
     await message.answer("Введите ID рецепта, который хотите удалить:")
 
 @router.message(AdminStates.waiting_for_recipe_to_delete)
-async def process_recipe_to_delete(message: Message, state: FSMContext):
-    recipe_id = message.text
-    async with async_session() as session:
-        recipe = await session.scalar(select(Recipe).where(Recipe.id == recipe_id))
-        if recipe:
-            await session.delete(recipe)
-            await session.commit()
-            await message.answer(f"Рецепт с ID {recipe_id} успешно удален.")
-        else:
-            await message.answer(f"Рецепт с ID {recipe_id} не найден.")
+async def process_recipe_to_delete(message: Message, state: FSMContext, session: AsyncSession):
+    try:
+        recipe_id = int(message.text)
+    except (TypeError, ValueError):
+        await message.answer("Пожалуйста, введите число.")
+        return
+    recipe = await session.scalar(select(Recipe).where(Recipe.id == recipe_id))
+    if recipe:
+        await session.delete(recipe)
+        await session.commit()
+        recipe_index.remove_recipe(recipe_id)
+        forget_recipe_card(recipe_id)
+        await message.answer(f"Рецепт с ID {recipe_id} успешно удален.")
+    else:
+        await message.answer(f"Рецепт с ID {recipe_id} не найден.")
     await state.clear()
     await message.answer("Добро пожаловать в админ-панель!", reply_markup=kb.admin_panel)
 
@@ -688,147 +679,111 @@ async def process_recipe_type(message: Message, state: FSMContext):
     await message.answer("Выберите новую кухню:", reply_markup=kb.cuisine_keyboard)
 
 @router.message(AdminStates.waiting_for_recipe_cuisine)
-async def process_recipe_cuisine(message: Message, state: FSMContext):
+async def process_recipe_cuisine(message: Message, state: FSMContext, session: AsyncSession):
     await state.update_data(cuisine=message.text)
     await state.set_state(AdminStates.waiting_for_recipe_ingredients)
-    await start_ingredient_selection(message, state)
-
-async def update_recipe_in_db(message: Message, state: FSMContext):
+    await start_ingredient_selection(message, state, session)
+
+async def recipe_facet_ids(message: Message, session: AsyncSession, data: dict) -> Optional[Tuple[int, int, int]]:
+    """ID категории, диеты и кухни рецепта из данных FSM; если чего-то нет в базе, сообщает об этом и возвращает None."""
+    category_id = await resolve_name(session, "categories", Category, data['category'])
+    type_id = await resolve_name(session, "types", Type, data['type'])
+    cuisine_id = await resolve_name(session, "cuisines", Cuisine, data['cuisine'])
+    if category_id is None:
+        await message.answer(f"Категория '{data['category']}' не найдена. Пожалуйста, используйте существующую категорию.")
+        return None
+    if type_id is None:
+        await message.answer(f"Тип диеты '{data['type']}' не найден. Пожалуйста, используйте существующий тип.")
+        return None
+    if cuisine_id is None:
+        await message.answer(f"Кухня '{data['cuisine']}' не найдена. Пожалуйста, используйте существующую кухню.")
+        return None
+    return category_id, type_id, cuisine_id
+
+async def update_recipe_in_db(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     recipe_id = data.get("recipe_id")
     selected_ingredients = data.get("ingredients", [])
-    async with async_session() as session:
-        recipe = await session.scalar(select(Recipe).where(Recipe.id == int(recipe_id)))
-        if not recipe:
-            await message.answer(f"Рецепт с ID {recipe_id} не найден.")
-            return
-        category = await session.scalar(select(Category).where(Category.name == data['category']))
-        type_ = await session.scalar(select(Type).where(Type.name == data['type']))
-        cuisine = await session.scalar(select(Cuisine).where(Cuisine.name == data['cuisine']))
-        if not category:
-            await message.answer(f"Категория '{data['category']}' не найдена. Пожалуйста, используйте существующую категорию.")
-            return
-        if not type_:
-            await message.answer(f"Тип диеты '{data['type']}' не найден. Пожалуйста, используйте существующий тип.")
-            return
-        if not cuisine:
-            await message.answer(f"Кухня '{data['cuisine']}' не найдена. Пожалуйста, используйте существующую кухню.")
-            return
-        recipe.title = data['title']
-        recipe.instructions = data['instructions']
-        recipe.category_id = category.id
-        recipe.type_id = type_.id
-        recipe.cuisine_id = cuisine.id
-        await session.execute(delete(Recipe_ingredient).where(Recipe_ingredient.recipe_id == recipe.id))
-        for ingredient_name in selected_ingredients:
-            ingredient = await get_or_create_ingredient(session, ingredient_name)
-            recipe_ingredient = Recipe_ingredient(recipe_id=recipe.id, ingredient_id=ingredient.id)
-            session.add(recipe_ingredient)
-        await session.commit()
+    facets = await recipe_facet_ids(message, session, data)
+    if facets is None:
+        return
+    category_id, type_id, cuisine_id = facets
+    try:
+        await save_recipe(session, data['title'], data['instructions'], category_id, type_id, cuisine_id, selected_ingredients, recipe_id=int(recipe_id))
+    except ValueError:
+        await message.answer(f"Рецепт с ID {recipe_id} не найден.")
+        return
     await message.answer("Рецепт успешно обновлен!")
     await state.clear()
     await message.answer("Добро пожаловать в админ-панель!", reply_markup=kb.admin_panel)
 
-async def create_ingredients_checkboxes(session: AsyncSession, selected_ingredients: list = None, page: int = 0, per_page: int = 20) -> InlineKeyboardMarkup:
+async def create_ingredients_checkboxes(session: AsyncSession, selected_ingredients: list = None, page: int = 0) -> InlineKeyboardMarkup:
     if selected_ingredients is None:
         selected_ingredients = []
-    ingredients = await session.execute(select(Ingredient))
-    ingredients = ingredients.scalars().all()
-    total_pages = (len(ingredients) // per_page + (1 if len(ingredients) % per_page > 0 else 0))
-    start_index = page * per_page
-    end_index = start_index + per_page
-    page_ingredients = ingredients[start_index:end_index]
+    ingredients_page = await admin_ingredient_pages.page(session, None, page)
+    page = ingredients_page.number
     checkboxes = [
         [InlineKeyboardButton(
-            text=f"{'✅' if ingredient.name in selected_ingredients else '☑️'} {ingredient.name}",
-            callback_data=f"ingredient_{ingredient.name}"
+            text=f"{'✅' if ingredient_id in selected_ingredients else '☑️'} {ingredient}",
+            callback_data=AdminIngredientToggle(id=ingredient_id).pack()
         )]
-        for ingredient in page_ingredients
+        for ingredient_id, ingredient in ingredients_page.items
     ]
     navigation_buttons = []
     if page > 0:
-        navigation_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"page_{page - 1}"))
-    if page < total_pages - 1:
-        navigation_buttons.append(InlineKeyboardButton(text="➡️ Вперед", callback_data=f"page_{page + 1}"))
+        navigation_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=IngredientPage(page=page - 1).pack()))
+    if page < ingredients_page.total_pages - 1:
+        navigation_buttons.append(InlineKeyboardButton(text="➡️ Вперед", callback_data=IngredientPage(page=page + 1).pack()))
     if navigation_buttons:
         checkboxes.append(navigation_buttons)
     checkboxes.append([InlineKeyboardButton(text="Готово", callback_data="done_ingredients")])
     return InlineKeyboardMarkup(inline_keyboard=checkboxes)
 
 @router.message(AdminStates.waiting_for_recipe_ingredients)
-async def start_ingredient_selection(message: Message, state: FSMContext):
+async def start_ingredient_selection(message: Message, state: FSMContext, session: AsyncSession):
     await state.update_data(selected_ingredients=[], current_page=0)
-    async with async_session() as session:
-        checkboxes = await create_ingredients_checkboxes(session, page=0)
-        await message.answer("Выберите ингредиенты:", reply_markup=checkboxes)
-        await state.set_state(AdminStates.waiting_for_ingredient_selection)
-
-@router.callback_query(F.data.startswith("page_"), AdminStates.waiting_for_ingredient_selection)
-async def handle_page_change(callback: CallbackQuery, state: FSMContext):
-    page = int(callback.data.split("_")[1])
+    checkboxes = await create_ingredients_checkboxes(session, page=0)
+    await message.answer("Выберите ингредиенты:", reply_markup=checkboxes)
+    await state.set_state(AdminStates.waiting_for_ingredient_selection)
+
+@router.callback_query(IngredientPage.filter(), AdminStates.waiting_for_ingredient_selection)
+async def handle_page_change(callback: CallbackQuery, callback_data: IngredientPage, state: FSMContext, session: AsyncSession):
+    await callback.answer()
+    page = callback_data.page
     await state.update_data(current_page=page)
     data = await state.get_data()
     selected_ingredients = data.get("selected_ingredients", [])
-    async with async_session() as session:
-        checkboxes = await create_ingredients_checkboxes(session, selected_ingredients, page)
-        await callback.message.edit_reply_markup(reply_markup=checkboxes)
-    await callback.answer()
+    checkboxes = await create_ingredients_checkboxes(session, selected_ingredients, page)
+    markup_editor.schedule(callback.message, checkboxes)
 
-async def add_recipe_to_db(message: Message, state: FSMContext):
+async def add_recipe_to_db(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     selected_ingredients = data.get("ingredients", [])
-    async with async_session() as session:
-        category = await session.scalar(select(Category).where(Category.name == data['category']))
-        type_ = await session.scalar(select(Type).where(Type.name == data['type']))
-        cuisine = await session.scalar(select(Cuisine).where(Cuisine.name == data['cuisine']))
-        if not category:
-            await message.answer(f"Категория '{data['category']}' не найдена. Пожалуйста, используйте существующую категорию.")
-            return
-        if not type_:
-            await message.answer(f"Тип диеты '{data['type']}' не найден. Пожалуйста, используйте существующий тип.")
-            return
-        if not cuisine:
-            await message.answer(f"Кухня '{data['cuisine']}' не найдена. Пожалуйста, используйте существующую кухню.")
-            return
-        recipe = Recipe(
-            title=data['title'],
-            instructions=data['instructions'],
-            category_id=category.id,
-            type_id=type_.id,
-            cuisine_id=cuisine.id,
-            position=None,
-            like=None,
-            dislike=None
-        )
-        session.add(recipe)
-        await session.commit()
-        await session.refresh(recipe)
-        for ingredient_name in selected_ingredients:
-            ingredient = await get_or_create_ingredient(session, ingredient_name)
-            recipe_ingredient = Recipe_ingredient(recipe_id=recipe.id, ingredient_id=ingredient.id)
-            session.add(recipe_ingredient)
-        await session.commit()
+    facets = await recipe_facet_ids(message, session, data)
+    if facets is None:
+        return
+    category_id, type_id, cuisine_id = facets
+    await save_recipe(session, data['title'], data['instructions'], category_id, type_id, cuisine_id, selected_ingredients)
     await message.answer("Рецепт успешно добавлен!")
     await message.answer("Добро пожаловать в админ-панель!", reply_markup=kb.admin_panel)
 
-@router.callback_query(F.data.startswith("ingredient_"), AdminStates.waiting_for_ingredient_selection)
-async def handle_ingredient_selection(callback: CallbackQuery, state: FSMContext):
-    ingredient_name = callback.data.split("_")[1]
+@router.callback_query(AdminIngredientToggle.filter(), AdminStates.waiting_for_ingredient_selection)
+async def handle_ingredient_selection(callback: CallbackQuery, callback_data: AdminIngredientToggle, state: FSMContext, session: AsyncSession):
+    await callback.answer()
+    ingredient_id = callback_data.id
     data = await state.get_data()
     selected_ingredients = data.get("selected_ingredients", [])
     current_page = data.get("current_page", 0)
-    if ingredient_name in selected_ingredients:
-        selected_ingredients.remove(ingredient_name)
+    if ingredient_id in selected_ingredients:
+        selected_ingredients.remove(ingredient_id)
     else:
-        selected_ingredients.append(ingredient_name)
+        selected_ingredients.append(ingredient_id)
     await state.update_data(selected_ingredients=selected_ingredients)
-    async with async_session() as session:
-        checkboxes = await create_ingredients_checkboxes(session, selected_ingredients, current_page)
-        await callback.message.edit_reply_markup(reply_markup=checkboxes)
-    await callback.answer()
+    checkboxes = await create_ingredients_checkboxes(session, selected_ingredients, current_page)
+    markup_editor.schedule(callback.message, checkboxes)
 
 @router.callback_query(F.data == "done_ingredients", AdminStates.waiting_for_ingredient_selection)
-async def handle_done_ingredients(callback: CallbackQuery, state: FSMContext):
+async def handle_done_ingredients(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     selected_ingredients = data.get("selected_ingredients", [])
     if not selected_ingredients:
@@ -836,45 +791,19 @@ async def handle_done_ingredients(callback: CallbackQuery, state: FSMContext):
         return
     await state.update_data(ingredients=selected_ingredients)
     if "recipe_id" in data:
-        await update_recipe_in_db(callback.message, state)
+        await update_recipe_in_db(callback.message, state, session)
     else:
-        await add_recipe_to_db(callback.message, state)
+        await add_recipe_to_db(callback.message, state, session)
 
 @router.message(AdminStates.waiting_for_recipe_ingredients)
-async def process_recipe_ingredients(message: Message, state: FSMContext):
+async def process_recipe_ingredients(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     selected_ingredients = data.get("ingredients", [])
-    async with async_session() as session:
-        category = await session.scalar(select(Category).where(Category.name == data['category']))
-        type_ = await session.scalar(select(Type).where(Type.name == data['type']))
-        cuisine = await session.scalar(select(Cuisine).where(Cuisine.name == data['cuisine']))
-        if not category:
-            await message.answer(f"Категория '{data['category']}' не найдена. Пожалуйста, используйте существующую категорию.")
-            return
-        if not type_:
-            await message.answer(f"Тип диеты '{data['type']}' не найден. Пожалуйста, используйте существующий тип.")
-            return
-        if not cuisine:
-            await message.answer(f"Кухня '{data['cuisine']}' не найдена. Пожалуйста, используйте существующую кухню.")
-            return
-        recipe = Recipe(
-            title=data['title'],
-            instructions=data['instructions'],
-            category_id=category.id,
-            type_id=type_.id,
-            cuisine_id=cuisine.id,
-            position=None,
-            like=None,
-            dislike=None
-        )
-        session.add(recipe)
-        await session.commit()
-        await session.refresh(recipe)
-        for ingredient_name in selected_ingredients:
-            ingredient = await get_or_create_ingredient(session, ingredient_name)
-            recipe_ingredient = Recipe_ingredient(recipe_id=recipe.id, ingredient_id=ingredient.id)
-            session.add(recipe_ingredient)
-        await session.commit()
+    facets = await recipe_facet_ids(message, session, data)
+    if facets is None:
+        return
+    category_id, type_id, cuisine_id = facets
+    await save_recipe(session, data['title'], data['instructions'], category_id, type_id, cuisine_id, selected_ingredients)
     await message.answer("Рецепт успешно добавлен!")
     await state.clear()
     await message.answer("Добро пожаловать в админ-панель!", reply_markup=kb.admin_panel)
@@ -895,7 +824,7 @@ async def process_ingredient_name(message: Message, state: FSMContext):
 
 @router.message(AdminStates.waiting_for_ingredient_category)
 async def process_ingredient_category(message: Message, state: FSMContext):
-    category_name = clean_text(message.text)
+    category_name = normalize(message.text)
     await state.update_data(ingredient_category=category_name)
     await state.set_state(AdminStates.waiting_for_ingredient_protein)
     await message.answer("Введите количество белков (в граммах на 100 г продукта):")
@@ -925,7 +854,7 @@ async def process_ingredient_fat(message: Message, state: FSMContext):
     await message.answer("Введите количество углеводов (в граммах на 100 г продукта):")
 
 @router.message(AdminStates.waiting_for_ingredient_carbohydrate)
-async def process_ingredient_carbohydrate(message: Message, state: FSMContext):
+async def process_ingredient_carbohydrate(message: Message, state: FSMContext, session: AsyncSession):
     carbohydrate = message.text
     try:
         carbohydrate = float(carbohydrate)
@@ -937,25 +866,25 @@ async def process_ingredient_carbohydrate(message: Message, state: FSMContext):
     category_name = data.get("ingredient_category")
     protein = data.get("ingredient_protein")
     fat = data.get("ingredient_fat")
-    async with async_session() as session:
-        existing_ingredient = await session.scalar(select(Ingredient).where(Ingredient.name == ingredient_name))
-        if existing_ingredient:
-            await message.answer(f"Ингредиент '{ingredient_name}' уже существует.")
-            return
-        category = await session.scalar(select(IngredientType).where(IngredientType.name == category_name))
-        if not category:
-            await message.answer(f"Категория '{category_name}' не найдена.")
-            return
-        ingredient = Ingredient(
-            name=ingredient_name,
-            protein=protein,
-            fat=fat,
-            carbohydrate=carbohydrate,
-            ingredient_type_id=category.id
-        )
-        session.add(ingredient)
-        await session.commit()
-        await session.refresh(ingredient)
+    existing_ingredient = await session.scalar(select(Ingredient).where(Ingredient.name == ingredient_name))
+    if existing_ingredient:
+        await message.answer(f"Ингредиент '{ingredient_name}' уже существует.")
+        return
+    category = await session.scalar(select(IngredientType).where(IngredientType.name == category_name))
+    if not category:
+        await message.answer(f"Категория '{category_name}' не найдена.")
+        return
+    # Колонки БЖУ строковые: PostgreSQL не приводит float к VARCHAR сам
+    ingredient = Ingredient(
+        name=ingredient_name,
+        protein=str(protein),
+        fat=str(fat),
+        carbohydrate=str(carbohydrate),
+        ingredient_type_id=category.id
+    )
+    session.add(ingredient)
+    await session.commit()
+    forget_ingredient_pages()
     await message.answer(f"Ингредиент '{ingredient_name}' успешно добавлен в категорию '{category_name}'!")
     await state.clear()
     await message.answer("Добро пожаловать в админ-панель!", reply_markup=kb.admin_panel)
@@ -969,17 +898,16 @@ async def add_cuisine_start(message: Message, state: FSMContext):
     await message.answer("Введите название кухни:")
 
 @router.message(AdminStates.waiting_for_cuisine_name)
-async def process_cuisine_name(message: Message, state: FSMContext):
+async def process_cuisine_name(message: Message, state: FSMContext, session: AsyncSession):
     cuisine_name = message.text
-    async with async_session() as session:
-        existing_cuisine = await session.scalar(select(Cuisine).where(Cuisine.name == cuisine_name))
-        if existing_cuisine:
-            await message.answer(f"Кухня '{cuisine_name}' уже существует.")
-            return
-        cuisine = Cuisine(name=cuisine_name)
-        session.add(cuisine)
-        await session.commit()
-        await session.refresh(cuisine)
+    existing_cuisine = await session.scalar(select(Cuisine).where(Cuisine.name == cuisine_name))
+    if existing_cuisine:
+        await message.answer(f"Кухня '{cuisine_name}' уже существует.")
+        return
+    cuisine = Cuisine(name=cuisine_name)
+    session.add(cuisine)
+    await session.commit()
+    await session.refresh(cuisine)
     await message.answer(f"Кухня '{cuisine_name}' успешно добавлена!")
     await state.clear()
     await message.answer("Добро пожаловать в админ-панель!", reply_markup=kb.admin_panel)
@@ -993,16 +921,15 @@ async def add_diet_start(message: Message, state: FSMContext):
     await message.answer("Введите название диеты:")
 
 @router.message(AdminStates.waiting_for_diet_name)
-async def process_diet_name(message: Message, state: FSMContext):
+async def process_diet_name(message: Message, state: FSMContext, session: AsyncSession):
     diet_name = message.text
-    async with async_session() as session:
-        existing_diet = await session.scalar(select(Type).where(Type.name == diet_name))
-        if existing_diet:
-            await message.answer(f"Диета '{diet_name}' уже существует.")
-            return
-        diet = Type(name=diet_name)
-        session.add(diet)
-        await session.commit()
+    existing_diet = await session.scalar(select(Type).where(Type.name == diet_name))
+    if existing_diet:
+        await message.answer(f"Диета '{diet_name}' уже существует.")
+        return
+    diet = Type(name=diet_name)
+    session.add(diet)
+    await session.commit()
     await message.answer(f"Диета '{diet_name}' успешно добавлена!")
     await state.clear()
     await message.answer("Добро пожаловать в админ-панель!", reply_markup=kb.admin_panel)
@@ -1016,48 +943,15 @@ async def add_category_start(message: Message, state: FSMContext):
     await message.answer("Введите название категории:")
 
 @router.message(AdminStates.waiting_for_category_name)
-async def process_category_name(message: Message, state: FSMContext):
+async def process_category_name(message: Message, state: FSMContext, session: AsyncSession):
     category_name = message.text
-    async with async_session() as session:
-        existing_category = await session.scalar(select(Category).where(Category.name == category_name))
-        if existing_category:
-            await message.answer(f"Категория '{category_name}' уже существует.")
-            return
-        category = Category(name=category_name)
-        session.add(category)
-        await session.commit()
+    existing_category = await session.scalar(select(Category).where(Category.name == category_name))
+    if existing_category:
+        await message.answer(f"Категория '{category_name}' уже существует.")
+        return
+    category = Category(name=category_name)
+    session.add(category)
+    await session.commit()
     await message.answer(f"Категория '{category_name}' успешно добавлена!")
     await state.clear()
     await message.answer("Добро пожаловать в админ-панель!", reply_markup=kb.admin_panel)
-
-async def get_or_create_category(session: AsyncSession, name: str) -> Category:
-    category = await session.scalar(select(Category).where(Category.name == name))
-    if not category:
-        category = Category(name=name)
-        session.add(category)
-        await session.commit()
-    return category
-
-async def get_or_create_type(session: AsyncSession, name: str) -> Type:
-    type_ = await session.scalar(select(Type).where(Type.name == name))
-    if not type_:
-        type_ = Type(name=name)
-        session.add(type_)
-        await session.commit()
-    return type_
-
-async def get_or_create_cuisine(session: AsyncSession, name: str) -> Cuisine:
-    cuisine = await session.scalar(select(Cuisine).where(Cuisine.name == name))
-    if not cuisine:
-        cuisine = Cuisine(name=name)
-        session.add(cuisine)
-        await session.commit()
-    return cuisine
-
-async def get_or_create_ingredient(session: AsyncSession, name: str) -> Ingredient:
-    ingredient = await session.scalar(select(Ingredient).where(Ingredient.name == name))
-    if not ingredient:
-        ingredient = Ingredient(name=name)
-        session.add(ingredient)
-        await session.commit()
-    return ingredient
\ No newline at end of file
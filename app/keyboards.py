@@ -66,7 +66,8 @@ ingridientCategory = ReplyKeyboardMarkup(keyboard=[
     [KeyboardButton(text='🦀Морепродукты')],
     [KeyboardButton(text='🫑Овощи')],
     [KeyboardButton(text='🫘Бакалея')],
-    [KeyboardButton(text='🔍Показать рецепты')]
+    [KeyboardButton(text='🔍Показать рецепты')],
+    [KeyboardButton(text='🧺Только со всеми ингредиентами')]
 
 ])
 
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, Message
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+MessageKey = Tuple[int, int]  # (chat_id, message_id)
+
+
+def _layout(markup: Optional[InlineKeyboardMarkup]) -> tuple:
+    # Сравниваем только то, что видит пользователь и что приходит в колбэке
+    if markup is None:
+        return ()
+    return tuple(tuple((button.text, button.callback_data) for button in row) for row in markup.inline_keyboard)
+
+
+class MarkupEditor:
+    """
+    Редактирует inline-клавиатуры сообщений с задержкой: правка уходит, когда
+    нажатия на сообщении стихли на delay секунд (но не позже max_wait от начала
+    серии), с последним вариантом клавиатуры. Серия нажатий даёт одну правку,
+    а правка, которая ничего не меняет, не отправляется вовсе.
+    """
+
+    def __init__(self, delay: float = 0.3, max_wait: float = 1.5, maxsize: int = 10000):
+        self.delay = delay
+        self.max_wait = max_wait
+        self._shown: LRUCache = LRUCache(maxsize=maxsize)  # Клавиатура, которую сейчас видит пользователь
+        self._pending: Dict[MessageKey, InlineKeyboardMarkup] = {}
+        self._touched: Dict[MessageKey, float] = {}  # Время последнего нажатия
+        self._tasks: Dict[MessageKey, asyncio.Task] = {}
+        self.edits = 0
+        self.coalesced = 0  # Правки, поглощённые следующей
+        self.skipped = 0  # Правки без изменений
+
+    def schedule(self, message: Message, markup: InlineKeyboardMarkup):
+        key = (message.chat.id, message.message_id)
+        if key not in self._shown:
+            self._shown[key] = _layout(message.reply_markup)
+        if key in self._pending:
+            self.coalesced += 1
+        self._pending[key] = markup
+        self._touched[key] = time.monotonic()
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(message.bot, key))
+
+    async def _settle(self, key: MessageKey):
+        """Ждёт паузы в нажатиях, но не дольше max_wait."""
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = min(self._touched[key] + self.delay, deadline) - time.monotonic()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def _run(self, bot: Bot, key: MessageKey):
+        try:
+            while key in self._pending:
+                await self._settle(key)
+                markup = self._pending.pop(key)
+                layout = _layout(markup)
+                if self._shown.get(key) == layout:
+                    self.skipped += 1
+                    continue
+                try:
+                    await bot.edit_message_reply_markup(chat_id=key[0], message_id=key[1], reply_markup=markup)
+                except TelegramRetryAfter as e:
+                    # Повторим с самой свежей клавиатурой после паузы
+                    self._pending.setdefault(key, markup)
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except TelegramBadRequest as e:
+                    if "message is not modified" not in e.message:
+                        logger.warning("Не удалось обновить клавиатуру %s: %s", key, e.message)
+                        continue
+                self._shown[key] = layout
+                self.edits += 1
+        except Exception:
+            logger.exception("Ошибка при обновлении клавиатуры %s", key)
+        finally:
+            self._tasks.pop(key, None)
+            self._touched.pop(key, None)
+            # Если задача упала, следующее нажатие начнёт всё заново
+            self._pending.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"edits": self.edits, "coalesced": self.coalesced, "skipped": self.skipped, "pending": len(self._pending)}
+
+
+markup_editor = MarkupEditor()
@@ -0,0 +1,113 @@
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.database.models import engine, read_engine
+from app.fsm_storage import BufferedFSMContext
+
+
+class DbStats:
+    """Счётчики сессий и запросов к базе в разрезе обработанных апдейтов."""
+
+    def __init__(self):
+        self.updates = 0
+        self.sessions = 0
+        self.queries = 0
+        self.max_queries_per_update = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "updates": self.updates,
+            "sessions": self.sessions,
+            "queries": self.queries,
+            "sessions_per_update": round(self.sessions / self.updates, 2) if self.updates else 0,
+            "queries_per_update": round(self.queries / self.updates, 2) if self.updates else 0,
+            "max_queries_per_update": self.max_queries_per_update,
+        }
+
+
+db_stats = DbStats()
+# [запросов, сессий] в рамках текущего апдейта; None вне обработки апдейта
+_update_counters: ContextVar[Optional[list]] = ContextVar("update_counters", default=None)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counters = _update_counters.get()
+    if counters is not None and statement != "BEGIN":
+        counters[0] += 1
+
+
+for _engine in {engine, read_engine}:
+    event.listen(_engine.sync_engine, "before_cursor_execute", _count_query)
+
+
+@event.listens_for(Session, "after_begin")
+def _count_session(session, transaction, connection):
+    # Считаем начатые транзакции: столько раз за апдейт бралось соединение
+    counters = _update_counters.get()
+    if counters is not None:
+        counters[1] += 1
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Открывает одну сессию на апдейт и передаёт её в обработчик параметром session.
+    Если обработчик отработал без ошибок - коммитит, иначе откатывает.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker):
+        self.session_pool = session_pool
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if "session" in data:
+            return await handler(event, data)
+        counters = [0, 0]
+        token = _update_counters.set(counters)
+        try:
+            async with self.session_pool() as session:
+                data["session"] = session
+                try:
+                    result = await handler(event, data)
+                except Exception:
+                    await session.rollback()
+                    raise
+                await session.commit()
+                return result
+        finally:
+            _update_counters.reset(token)
+            db_stats.updates += 1
+            db_stats.queries += counters[0]
+            db_stats.sessions += counters[1]
+            db_stats.max_queries_per_update = max(db_stats.max_queries_per_update, counters[0])
+
+
+class FSMBufferMiddleware(BaseMiddleware):
+    """
+    Подменяет state на BufferedFSMContext: за апдейт хранилище видит одно чтение
+    данных и не больше одной записи. Если обработчик упал, изменения не сохраняются.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        state = data.get("state")
+        if state is None or isinstance(state, BufferedFSMContext):
+            return await handler(event, data)
+        buffered = BufferedFSMContext(state, data.get("raw_state"))
+        data["state"] = buffered
+        result = await handler(event, data)
+        await buffered.flush()
+        return result
@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Deque, Dict, List, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from cachetools import TTLCache
+
+from config import TELEGRAM_RATE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+class Lane(IntEnum):
+    """Очередь отправки: чем меньше значение, тем раньше сообщение уйдёт."""
+    interactive = 0  # Ответы на действия пользователя
+    notification = 1  # Рассылки и фоновые уведомления
+
+
+_lane: ContextVar[Lane] = ContextVar("send_lane", default=Lane.interactive)
+
+
+@contextmanager
+def send_lane(lane: Lane):
+    """Все отправки внутри блока идут в указанную очередь."""
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Сколько ждать до появления целого токена."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def reserve(self) -> float:
+        """Берёт токен в долг и возвращает, сколько ждать до его появления."""
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def block(self, seconds: float):
+        # После 429 от Telegram ничего не отправляем в этот чат seconds секунд
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: ограничивает отправку в каждый чат и суммарно по боту
+    (token bucket), при нехватке глобального лимита пропускает вперёд интерактивные
+    ответы, а на TelegramRetryAfter ждёт и повторяет запрос.
+    Методы без chat_id (answerCallbackQuery, getUpdates и т.п.) идут без ограничений.
+    """
+
+    def __init__(self, global_rate: float = 30, global_burst: float = 5, per_chat_rate: float = 1, per_chat_burst: float = 5, retries: int = 3, chat_ttl: float = 60):
+        self.per_chat_rate = per_chat_rate
+        # Ответ из 4-5 сообщений (карточка рецепта, подсказка, клавиатура) уходит без пауз
+        self.per_chat_burst = per_chat_burst
+        self.retries = retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: TTLCache = TTLCache(maxsize=100000, ttl=chat_ttl)
+        # Чаты, которым Telegram велел подождать. Живут здесь, пока пауза не кончится,
+        # иначе TTLCache мог бы выбросить бакет раньше и лимит бы забылся
+        self._blocked: Dict[Any, TokenBucket] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump_task = None
+        self.waiting: Dict[Lane, int] = {lane: 0 for lane in Lane}
+        self.sent = 0
+        self.retried = 0
+        self._latencies: Deque[float] = deque(maxlen=1000)
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._blocked.get(chat_id)
+        if bucket is not None:
+            if bucket.delay() > 0:
+                return bucket
+            del self._blocked[chat_id]
+            self._chats[chat_id] = bucket
+            return bucket
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return bucket
+
+    def _block_chat(self, chat_id: Any, seconds: float):
+        bucket = self._chat_bucket(chat_id)
+        bucket.block(seconds)
+        # Заодно забываем чаты, пауза которых уже кончилась и которые больше не писали
+        for other in [other for other, blocked in self._blocked.items() if blocked.delay() == 0]:
+            del self._blocked[other]
+        self._blocked[chat_id] = bucket
+
+    async def _acquire_global(self, lane: Lane):
+        if not self._waiters and self._global.delay() == 0:
+            self._global.reserve()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self):
+        # Раздаёт глобальные токены ожидающим в порядке (очередь, время постановки)
+        while self._waiters:
+            wait = self._global.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._global.reserve()
+                future.set_result(None)
+
+    async def _acquire(self, chat_id: Any, lane: Lane):
+        self.waiting[lane] += 1
+        try:
+            wait = self._chat_bucket(chat_id).reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self._acquire_global(lane)
+        finally:
+            self.waiting[lane] -= 1
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        lane = _lane.get()
+        started = time.monotonic()
+        for attempt in range(1, self.retries + 1):
+            await self._acquire(chat_id, lane)
+            try:
+                response = await make_request(bot, method)
+                break
+            except TelegramRetryAfter as e:
+                self.retried += 1
+                logger.warning("Telegram просит подождать %s с в чате %s (попытка %s/%s)", e.retry_after, chat_id, attempt, self.retries)
+                if attempt == self.retries:
+                    raise
+                self._block_chat(chat_id, e.retry_after)
+        self.sent += 1
+        self._latencies.append(time.monotonic() - started)
+        return response
+
+    def split(self, parts: int):
+        """
+        Оставляет процессу 1/parts общего лимита бота, когда отправляют несколько
+        процессов (см. app.workers). Лимит на чат не делится: чат обслуживает один процесс.
+        """
+        self._global = TokenBucket(self._global.rate / parts, max(1.0, self._global.capacity / parts))
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "waiting_interactive": self.waiting[Lane.interactive],
+            "waiting_notification": self.waiting[Lane.notification],
+            "latency_avg_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0,
+            "latency_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1) if latencies else 0,
+        }
+
+
+outbound = OutboundLimiter(global_rate=TELEGRAM_RATE_LIMIT)
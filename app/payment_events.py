@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.bot import bot
+from app.database.models import async_session, PaymentEvent, User
+from app.database.user_cache import record_user_change, remember_user
+from app.outbound import Lane, send_lane
+
+logger = logging.getLogger(__name__)
+
+# pending - событие записано, доступ ещё не выдан;
+# applied - доступ выдан, уведомление ещё не отправлено;
+# done - всё сделано; failed - пользователь не найден.
+PENDING, APPLIED, DONE, FAILED = 'pending', 'applied', 'done', 'failed'
+
+SUCCESS_TEXT = "Оплата прошла успешно! Теперь у вас есть доступ к полной версии."
+
+
+async def record_payment_event(payment_id: str, event: str, user_id: Optional[int]) -> bool:
+    """Записывает уведомление в журнал. False, если платёж с таким ID уже был."""
+    async with async_session() as session:
+        session.add(PaymentEvent(
+            payment_id=payment_id, event=event, user_id=user_id,
+            status=PENDING, attempts=0, received_at=datetime.now(),
+        ))
+        try:
+            await session.commit()
+        except IntegrityError:
+            return False
+    return True
+
+
+class PaymentEventWorker:
+    """
+    Пул фоновых обработчиков уведомлений об оплате. Состояние каждого события
+    хранится в payment_events, поэтому после падения необработанные события
+    подхватываются заново (at-least-once), а повторы от Юкассы отсекаются
+    по ID платежа ещё при записи.
+    """
+
+    def __init__(self, workers: int = 4, max_attempts: int = 5, backoff: float = 1):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # ID в очереди или в обработке, чтобы одно событие не взяли два обработчика
+        self._queued: Set[str] = set()
+
+    def enqueue(self, payment_id: str):
+        if self._queue is None or payment_id in self._queued:
+            return
+        self._queued.add(payment_id)
+        self._queue.put_nowait(payment_id)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        await self.recover()
+
+    async def recover(self):
+        """Ставит в очередь события, которые не успели обработать до перезапуска."""
+        async with async_session() as session:
+            payment_ids = (await session.scalars(
+                select(PaymentEvent.payment_id).where(PaymentEvent.status.in_((PENDING, APPLIED)))
+            )).all()
+        if payment_ids:
+            logger.info("Возобновляем обработку %s уведомлений об оплате", len(payment_ids))
+        for payment_id in payment_ids:
+            self.enqueue(payment_id)
+
+    async def stop(self, timeout: float = 10):
+        """Дожидается обработки очереди (не дольше timeout) и останавливает обработчики."""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Не обработано уведомлений об оплате: %s, продолжим после перезапуска", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._queued.clear()
+
+    async def _run(self):
+        while True:
+            payment_id = await self._queue.get()
+            try:
+                await self._handle(payment_id)
+            except Exception:
+                logger.exception("Ошибка при обработке платежа %s", payment_id)
+            finally:
+                self._queued.discard(payment_id)
+                self._queue.task_done()
+
+    async def _handle(self, payment_id: str):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await process_payment_event(payment_id)
+                return
+            except (TelegramNetworkError, TelegramRetryAfter, OSError) as e:
+                delay = e.retry_after if isinstance(e, TelegramRetryAfter) else self.backoff * 2 ** (attempt - 1)
+                logger.warning("Платёж %s: попытка %s/%s не удалась: %r", payment_id, attempt, self.max_attempts, e)
+                async with async_session() as session:
+                    await session.execute(
+                        update(PaymentEvent).where(PaymentEvent.payment_id == payment_id)
+                        .values(attempts=PaymentEvent.attempts + 1)
+                    )
+                    await session.commit()
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(delay)
+        # Событие остаётся необработанным и будет подхвачено recover при следующем запуске
+        logger.error("Платёж %s не обработан за %s попыток", payment_id, self.max_attempts)
+
+
+async def process_payment_event(payment_id: str):
+    """Выдаёт доступ и отправляет уведомление. Повторный вызов для того же платежа ничего не делает."""
+    async with async_session() as session:
+        # Сначала забираем событие условным UPDATE: так его не возьмут дважды, а SQLite
+        # сразу берёт блокировку на запись и не упирается в "database is locked"
+        claimed = (await session.execute(
+            update(PaymentEvent).where(PaymentEvent.payment_id == payment_id, PaymentEvent.status == PENDING)
+            .values(status=APPLIED)
+        )).rowcount
+        user_id = await session.scalar(select(PaymentEvent.user_id).where(PaymentEvent.payment_id == payment_id))
+        if claimed:
+            user = await session.scalar(select(User).where(User.tg_id == user_id)) if user_id else None
+            if user is None:
+                logger.warning("Платёж %s: пользователь %s не найден", payment_id, user_id)
+                await session.execute(
+                    update(PaymentEvent).where(PaymentEvent.payment_id == payment_id)
+                    .values(status=FAILED, processed_at=datetime.now())
+                )
+                await session.commit()
+                return
+            # Доступ и отметка о нём меняются в одной транзакции, поэтому доступ
+            # продлевается ровно один раз, сколько бы раз событие ни обработали
+            user.is_trial = False
+            user.end_date = datetime.now() + timedelta(days=365)
+            name, end_date = user.name, user.end_date
+            # В режиме polling уведомления Юкассы принимает отдельный процесс (app.webhook),
+            # кэш бота он сбрасывает через журнал
+            await record_user_change(session, user_id)
+            await session.commit()
+            remember_user(user_id, name, False, end_date)
+        else:
+            status = await session.scalar(select(PaymentEvent.status).where(PaymentEvent.payment_id == payment_id))
+            await session.commit()
+            if status != APPLIED:
+                return
+
+        try:
+            with send_lane(Lane.notification):
+                await bot.send_message(user_id, SUCCESS_TEXT)
+        except (TelegramNetworkError, TelegramRetryAfter):
+            raise
+        except TelegramAPIError as e:
+            # Пользователь заблокировал бота и т.п. - повтор не поможет, доступ уже выдан
+            logger.warning("Платёж %s: не удалось отправить уведомление: %s", payment_id, e)
+
+        await session.execute(
+            update(PaymentEvent).where(PaymentEvent.payment_id == payment_id)
+            .values(status=DONE, processed_at=datetime.now())
+        )
+        await session.commit()
+
+
+payment_worker = PaymentEventWorker()
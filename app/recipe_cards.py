@@ -0,0 +1,121 @@
+from typing import NamedTuple, Optional, Tuple
+
+from cachetools import LRUCache
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache_bus import cache_bus
+from app.database.models import Recipe, Recipe_ingredient, Ingredient
+
+
+class RecipeCard(NamedTuple):
+    id: int
+    title: str
+    instructions: str
+    ingredients: Tuple[str, ...]
+
+
+class RenderedCard(NamedTuple):
+    short: str  # Карточка для листания: название и ингредиенты
+    full: str  # Карточка "Готовим" с инструкцией
+
+
+def render_short(card: RecipeCard) -> str:
+    return (
+        f"🍴 <b>{card.title}</b>\n\n"
+        f"<b>Ингредиенты:</b>\n"
+        f"{', '.join(card.ingredients)}\n\n"
+    )
+
+
+def render_full(card: RecipeCard) -> str:
+    return (
+        f"🍴 <b>{card.title}</b>\n\n"
+        f"<b>Ингредиенты:</b>\n"
+        f"{', '.join(card.ingredients)}\n\n"
+        f"<b>Инструкция:</b>\n"
+        f"{card.instructions}"
+    )
+
+
+def _card_size(rendered: RenderedCard) -> int:
+    return len(rendered.short.encode()) + len(rendered.full.encode())
+
+
+class RecipeCardCache(LRUCache):
+    """LRU готовых HTML-карточек по ID рецепта, ограниченный суммарным размером в байтах."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(maxsize=max_bytes, getsizeof=_card_size)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def popitem(self):
+        # LRUCache вызывает popitem только при вытеснении
+        self.evictions += 1
+        return super().popitem()
+
+    def stats(self) -> dict:
+        return {
+            "items": len(self),
+            "bytes": self.currsize,
+            "max_bytes": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+card_cache = RecipeCardCache(max_bytes=8 * 1024 * 1024)
+
+
+async def load_recipe_card(session: AsyncSession, recipe_id: int) -> Optional[RecipeCard]:
+    if session.bind.dialect.name == 'postgresql':
+        # PostgreSQL собирает ингредиенты в массив прямо в запросе рецепта: один запрос вместо двух
+        ingredients = select(func.array_agg(Ingredient.name)).join(
+            Recipe_ingredient, Ingredient.id == Recipe_ingredient.ingredient_id
+        ).where(Recipe_ingredient.recipe_id == Recipe.id).scalar_subquery()
+        row = (await session.execute(
+            select(Recipe.title, Recipe.instructions, ingredients.label("ingredients")).where(Recipe.id == recipe_id)
+        )).first()
+        if row is None:
+            return None
+        return RecipeCard(recipe_id, row.title, row.instructions, tuple(row.ingredients or ()))
+    row = (await session.execute(
+        select(Recipe.title, Recipe.instructions).where(Recipe.id == recipe_id)
+    )).first()
+    if row is None:
+        return None
+    ingredients = await session.scalars(
+        select(Ingredient.name).join(
+            Recipe_ingredient, Ingredient.id == Recipe_ingredient.ingredient_id
+        ).where(Recipe_ingredient.recipe_id == recipe_id)
+    )
+    return RecipeCard(recipe_id, row.title, row.instructions, tuple(ingredients))
+
+
+async def get_recipe_card(session: AsyncSession, recipe_id: int) -> Optional[RenderedCard]:
+    rendered = card_cache.get(recipe_id)
+    if rendered is not None:
+        card_cache.hits += 1
+        return rendered
+    card_cache.misses += 1
+    card = await load_recipe_card(session, recipe_id)
+    if card is None:
+        return None
+    rendered = RenderedCard(render_short(card), render_full(card))
+    try:
+        card_cache[recipe_id] = rendered
+    except ValueError:
+        # Карточка больше всего кэша - просто не кэшируем
+        pass
+    return rendered
+
+
+def forget_recipe_card(recipe_id: int):
+    card_cache.pop(recipe_id, None)
+    cache_bus.publish("forget_recipe_card", recipe_id)
+
+
+cache_bus.subscribe("forget_recipe_card", forget_recipe_card)
@@ -1,17 +1,81 @@
 from fastapi import FastAPI, Request, HTTPException
+import asyncio
 import hmac
 import hashlib
 import json
-from aiogram import Bot
-from app.database.models import async_session
-from app.handlers import update_user_access
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+from aiogram.types import Update
+from app.bot import bot, dp
+from app.payment_events import payment_worker, record_payment_event
+from app.workers import UpdateSharder
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_MAX_CONCURRENCY
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Обработчики уведомлений об оплате живут столько же, сколько сервер
+    await payment_worker.start()
+    try:
+        yield
+    finally:
+        await payment_worker.stop()
+
+app = FastAPI(lifespan=lifespan)
+logger = logging.getLogger(__name__)
+
+# Ограничиваем число апдейтов, которые обрабатываются одновременно
+_updates_semaphore = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY)
+_update_tasks = set()
+# Если обработчиков несколько, апдейты не обрабатываются здесь, а уходят им (см. app.workers)
+_sharder: Optional[UpdateSharder] = None
 
 YOOKASSA_SECRET_KEY = "test_LvDIvXY-BYCeyqJc1zuhOt1QKcami3BHnm5JdrGkGGY"
 
+@app.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    if _sharder is not None:
+        await _sharder.dispatch([await request.json()])
+        return {"ok": True}
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    # Отвечаем Telegram сразу, а апдейт обрабатываем в фоне. Если все места заняты,
+    # запрос ждёт здесь - так Telegram сам притормозит доставку.
+    await _updates_semaphore.acquire()
+    task = asyncio.create_task(_process_update(update))
+    _update_tasks.add(task)
+    task.add_done_callback(_update_tasks.discard)
+    return {"ok": True}
+
+async def _process_update(update: Update):
+    try:
+        await dp.feed_update(bot, update)
+    except Exception:
+        logger.exception("Ошибка при обработке апдейта %s", update.update_id)
+    finally:
+        _updates_semaphore.release()
+
+async def run_webhook(sharder: Optional[UpdateSharder] = None):
+    global _sharder
+    import uvicorn
+    _sharder = sharder
+    await bot.set_webhook(
+        WEBHOOK_URL + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        max_connections=min(WEBHOOK_MAX_CONCURRENCY, 100),
+    )
+    server = uvicorn.Server(uvicorn.Config(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT))
+    try:
+        await server.serve()
+    finally:
+        if _update_tasks:
+            await asyncio.gather(*_update_tasks, return_exceptions=True)
+        await dp.storage.close()
+        await bot.session.close()
+
 @app.post('/yookassa-webhook')
-async def yookassa_webhook(request: Request, bot: Bot):
+async def yookassa_webhook(request: Request):
     # Получаем данные из запроса
     data = await request.body()
     signature = request.headers.get('Content-SHA256')
@@ -20,20 +84,17 @@ async def yookassa_webhook(request: Request, bot: Bot):
     if not verify_signature(data.decode(), signature):
         raise HTTPException(status_code=400, detail="Invalid signature")
 
-    # Обрабатываем уведомление
+    # Записываем уведомление и сразу отвечаем Юкассе. Доступ и сообщение пользователю
+    # обрабатываются в фоне; повторное уведомление о том же платеже игнорируется.
     event = json.loads(data)
     if event.get("event") == "payment.succeeded":
-        payment = event.get("object")
+        payment = event.get("object") or {}
         user_id = payment.get("metadata", {}).get("user_id")
-        if user_id:
-            # Обновляем данные пользователя
-            success = await update_user_access(int(user_id))
-            if success:
-                # Отправляем уведомление пользователю
-                await bot.send_message(user_id, "Оплата прошла успешно! Теперь у вас есть доступ к полной версии.")
-                return {"status": "success"}
-            else:
-                raise HTTPException(status_code=404, detail="User not found")
+        if payment.get("id") and user_id:
+            if await record_payment_event(payment["id"], event["event"], int(user_id)):
+                payment_worker.enqueue(payment["id"])
+                return {"status": "accepted"}
+            return {"status": "duplicate"}
 
     return {"status": "ignored"}
 
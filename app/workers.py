@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import multiprocessing
+from collections import defaultdict
+from queue import Full
+from typing import Any, Dict, Iterable, List, Optional
+
+from aiogram import Bot, Dispatcher
+
+from config import WEBHOOK_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# spawn, а не fork: приёмник к этому моменту уже открыл соединения с базой
+_context = multiprocessing.get_context("spawn")
+
+
+def update_chat_id(raw: Dict[str, Any]) -> int:
+    """ID чата апдейта (или пользователя, если чата нет) - из них aiogram строит ключ FSM."""
+    for kind, event in raw.items():
+        if kind == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+    return 0
+
+
+class UpdateSharder:
+    """
+    Приёмник апдейтов для нескольких процессов-обработчиков. Апдейты одного чата
+    всегда попадают в один процесс (chat_id % workers), поэтому они обрабатываются
+    по порядку, а состояние FSM, которое DatabaseStorage держит в памяти, не
+    расходится между процессами. Сбросы кэшей процессы рассылают друг другу
+    через cache_bus. Сам приёмник апдейты не обрабатывает.
+    """
+
+    def __init__(self, workers: int, queue_size: int = 1000):
+        self.workers = workers
+        # В очереди лежат пачки апдейтов; None - сигнал завершиться
+        self._updates = [_context.Queue(queue_size) for _ in range(workers)]
+        self._inboxes = [_context.Queue() for _ in range(workers)]
+        self._processes: List[multiprocessing.Process] = []
+        self.dispatched = 0
+
+    def start(self):
+        from app.cache_bus import cache_bus
+        for index in range(self.workers):
+            peers = [inbox for number, inbox in enumerate(self._inboxes) if number != index]
+            process = _context.Process(
+                target=_worker_main,
+                args=(index, self.workers, self._updates[index], self._inboxes[index], peers),
+                name=f"bot-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        # Приёмник меняет данные только из фоновых задач (оплаты), ему достаточно рассылать
+        cache_bus.connect(None, self._inboxes)
+
+    async def _put(self, index: int, item: Optional[list]):
+        queue = self._updates[index]
+        try:
+            queue.put_nowait(item)
+        except Full:
+            # Обработчик не успевает - ждём места, а вместе с нами ждёт и Telegram
+            await asyncio.get_running_loop().run_in_executor(None, queue.put, item)
+
+    async def dispatch(self, raw_updates: Iterable[Dict[str, Any]]):
+        batches: Dict[int, list] = defaultdict(list)
+        for raw in raw_updates:
+            batches[update_chat_id(raw) % self.workers].append(raw)
+        for index, batch in batches.items():
+            await self._put(index, batch)
+            self.dispatched += len(batch)
+
+    async def poll(self, bot: Bot, dp: Dispatcher, timeout: int = 30):
+        """Long polling в приёмнике: обработчики получают апдейты из очередей."""
+        allowed_updates = dp.resolve_used_update_types()
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+            except Exception:
+                logger.exception("Не удалось получить апдейты, повторим через секунду")
+                await asyncio.sleep(1)
+                continue
+            if updates:
+                offset = updates[-1].update_id + 1
+                await self.dispatch(update.model_dump(mode="json", by_alias=True, exclude_none=True) for update in updates)
+
+    async def stop(self, timeout: float = 30):
+        from app.cache_bus import cache_bus
+        await cache_bus.close()
+        for index in range(self.workers):
+            await self._put(index, None)
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logger.warning("Обработчик %s не завершился за %s с", process.name, timeout)
+                process.terminate()
+        self._processes = []
+
+
+def _worker_main(index: int, workers: int, updates, inbox, peers):
+    logging.basicConfig(level=logging.INFO, format=f"[worker {index}] %(levelname)s:%(name)s:%(message)s")
+    try:
+        asyncio.run(_serve(workers, updates, inbox, peers))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _serve(workers: int, updates, inbox, peers):
+    from app.bot import bot, dp
+    from app.cache_bus import cache_bus
+    from app.database.facets import build_recipe_index, recipe_index
+    from app.database.models import engine
+    from app.handlers import router
+    from app.outbound import outbound
+
+    # Лимит бота делят обработчики и приёмник (оплаты, напоминания о подписке)
+    outbound.split(workers + 1)
+    await build_recipe_index()
+    # Сообщения, пришедшие во время построения индекса, ждут в очереди и применятся после
+    cache_bus.connect(inbox, peers)
+    dp.include_router(router)
+    logger.info("Обработчик готов, рецептов в индексе: %s", len(recipe_index.recipes))
+    semaphore = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY)
+    tasks = set()
+
+    async def process(raw: Dict[str, Any]):
+        try:
+            await dp.feed_raw_update(bot, raw)
+        except Exception:
+            logger.exception("Ошибка при обработке апдейта %s", raw.get("update_id"))
+        finally:
+            semaphore.release()
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            batch = await loop.run_in_executor(None, updates.get)
+            if batch is None:
+                break
+            for raw in batch:
+                await semaphore.acquire()
+                task = asyncio.create_task(process(raw))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await cache_bus.close()
+        await dp.storage.close()
+        await bot.session.close()
+        await engine.dispose()
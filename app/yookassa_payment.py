@@ -1,8 +1,73 @@
-import requests
+import asyncio
+import logging
 import uuid
+from typing import Optional
+
+import aiohttp
 
 YOOKASSA_SHOP_ID = "1035013"
 YOOKASSA_SECRET_KEY = "test_LvDIvXY-BYCeyqJc1zuhOt1QKcami3BHnm5JdrGkGGY"
+YOOKASSA_API_URL = "https://api.yookassa.ru/v3"
+
+logger = logging.getLogger(__name__)
+
+
+class YooKassaClient:
+    """
+    Асинхронный клиент API Юкассы. Одна HTTP-сессия с пулом соединений на весь процесс,
+    таймаут на каждый запрос, ограничение числа одновременных запросов и повторы
+    с тем же Idempotence-Key, чтобы повтор не создал второй платёж.
+    """
+
+    def __init__(self, shop_id: str, secret_key: str, base_url: str = YOOKASSA_API_URL, timeout: float = 10, max_concurrency: int = 20, retries: int = 3, backoff: float = 0.5):
+        self.shop_id = shop_id
+        self.secret_key = secret_key
+        self.base_url = base_url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(self.shop_id, self.secret_key),
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=self.timeout,
+            )
+        return self._session
+
+    async def request(self, method: str, path: str, payload: Optional[dict] = None, idempotence_key: Optional[str] = None) -> dict:
+        headers = {"Idempotence-Key": idempotence_key or str(uuid.uuid4())}
+        url = f"{self.base_url}{path}"
+        for attempt in range(1, self.retries + 1):
+            try:
+                async with self._semaphore:
+                    async with self._get_session().request(method, url, json=payload, headers=headers) as response:
+                        # 5xx и 429 - временные ошибки, повторяем с тем же ключом идемпотентности
+                        if response.status < 500 and response.status != 429:
+                            try:
+                                return await response.json(content_type=None)
+                            except ValueError:
+                                # HTML-страница ошибки от балансировщика вместо ответа API
+                                error = f"HTTP {response.status}, ответ не в JSON"
+                        else:
+                            error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            logger.warning("Юкасса: попытка %s/%s %s %s не удалась: %s", attempt, self.retries, method, path, error)
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+        return {"type": "error", "code": "request_failed", "description": error}
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+yookassa = YooKassaClient(YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY)
 
 
 async def create_payment(amount, currency="RUB", description="Оплата полной версии", metadata=None):
@@ -15,12 +80,6 @@ async def create_payment(amount, currency="RUB", description="Оплата по
     :param metadata: Метаданные (например, user_id).
     :return: Ответ от API Юкассы.
     """
-    url = "https://api.yookassa.ru/v3/payments"
-    headers = {
-        "Idempotence-Key": str(uuid.uuid4()),  # Уникальный ключ для идемпотентности
-        "Content-Type": "application/json",
-    }
-    auth = (YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY)
     payload = {
         "amount": {
             "value": str(amount),  # Сумма оплаты
@@ -38,5 +97,4 @@ async def create_payment(amount, currency="RUB", description="Оплата по
     if metadata:
         payload["metadata"] = metadata
 
-    response = requests.post(url, json=payload, headers=headers, auth=auth)
-    return response.json()
\ No newline at end of file
+    return await yookassa.request("POST", "/payments", payload)
@@ -0,0 +1,97 @@
+"""
+Страницы списков админки на таблице пользователей до 1 млн строк.
+
+    python -m benchmarks.bench_admin_listings [--users 1000000] [--limit 50]
+
+Для каждой глубины (первая страница, середина, конец списка) сравнивает
+страницу по ключу из app.database.listings со страницей через OFFSET, как
+листала прежняя админка, без фильтров и с фильтрами по типу подписки, началу
+имени и окну окончания подписки.
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.listings import _encode_cursor, list_users
+from app.database.models import User
+from benchmarks.common import measure, temp_engine
+
+NOW = datetime(2026, 1, 1)
+NAMES = ["Анна", "Борис", "Вера", "Глеб", "Дарья", "Егор", "Жанна", "Зоя"]
+
+
+async def fill(session: AsyncSession, users: int):
+    for start in range(0, users, 50000):
+        await session.execute(insert(User), [
+            {
+                "tg_id": number,
+                "login": f"user{number}",
+                "name": f"{random.choice(NAMES)} {number}",
+                "start_date": NOW - timedelta(days=365),
+                "is_trial": number % 3 != 0,
+                "end_date": NOW + timedelta(minutes=random.randint(-525600, 525600)),
+            }
+            for number in range(start, min(start + 50000, users))
+        ])
+    await session.commit()
+
+
+def offset_page_query(**filters):
+    query = select(User.id, User.tg_id, User.login, User.name, User.start_date, User.is_trial, User.end_date)
+    if "is_trial" in filters:
+        query = query.where(User.is_trial == filters["is_trial"])
+    if "q" in filters:
+        query = query.where(or_(User.login.like(filters["q"] + "%"), User.name.like(filters["q"] + "%")))
+    if "expires_before" in filters:
+        query = query.where(User.end_date > filters["expires_after"], User.end_date <= filters["expires_before"])
+        query = query.order_by(User.end_date, User.id)
+    else:
+        query = query.order_by(User.id.desc())
+    return query
+
+
+async def offset_page(session: AsyncSession, offset: int, limit: int, **filters):
+    return (await session.execute(offset_page_query(**filters).offset(offset).limit(limit))).all()
+
+
+async def cursor_at(session: AsyncSession, offset: int, **filters):
+    """Курсор страницы, которая начинается с offset; None - первая страница."""
+    if not offset:
+        return None
+    row = (await offset_page(session, offset - 1, 1, **filters))[0]
+    return _encode_cursor([row.end_date, row.id] if "expires_before" in filters else [row.id])
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+    engine = await temp_engine()
+    async with AsyncSession(engine) as session:
+        await fill(session, args.users)
+        cases = [
+            ("все", {}),
+            ("пробные", {"is_trial": True}),
+            ("имя 'Вера'", {"q": "Вера"}),
+            ("кончаются за 30 дней", {"expires_after": NOW, "expires_before": NOW + timedelta(days=30)}),
+        ]
+        print(f"{args.users} пользователей, страница {args.limit} строк (медиана, мс)")
+        print(f"{'фильтр':>22} | {'строк':>8} | {'глубина':>8} | {'по ключу':>9} | {'OFFSET':>9}")
+        for name, filters in cases:
+            total = await session.scalar(select(func.count()).select_from(offset_page_query(**filters).subquery()))
+            for offset in (0, total // 2, max(total - args.limit, 0)):
+                # В админке курсор приходит со ссылкой "дальше", здесь его находим заранее
+                cursor = await cursor_at(session, offset, **filters)
+                keyset = await measure(lambda: list_users(session, cursor, args.limit, **filters), 20)
+                old = await measure(lambda: offset_page(session, offset, args.limit, **filters), 5)
+                print(f"{name:>22} | {total:>8} | {offset:>8} | {keyset['median_ms']:>9} | {old['median_ms']:>9}")
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
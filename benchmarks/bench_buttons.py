@@ -0,0 +1,87 @@
+"""
+Разбор нажатия кнопки меню при 5-500 кнопках.
+
+    python -m benchmarks.bench_buttons [--buttons 5 20 100 500] [--updates 500]
+
+Апдейты проходят через Dispatcher aiogram целиком. Раньше у каждой кнопки был
+свой обработчик с фильтром clean_text(message.text) == 'подпись', и aiogram
+проверял их по очереди; теперь все кнопки за одним обработчиком
+ButtonActions.dispatch, который находит действие поиском в словаре
+(app.buttons). Меряем первую и последнюю кнопку и текст, не совпавший ни с одной.
+"""
+import argparse
+import asyncio
+import re
+import time
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Chat, Message, Update, User
+
+from app.buttons import ButtonActions
+
+
+def old_clean_text(text: str) -> str:
+    # Так фильтры кнопок чистили текст до app.buttons
+    if text is None:
+        return ""
+    return re.sub(r'[^\w\s]', '', text).strip()
+
+
+async def pressed(message: Message):
+    return None
+
+
+def filter_chain(texts) -> Router:
+    router = Router()
+    for text in texts:
+        label = old_clean_text(text)
+        router.message.register(pressed, lambda message, label=label: old_clean_text(message.text) == label)
+    return router
+
+
+def button_table(texts) -> Router:
+    router = Router()
+    menu = ButtonActions()
+    for text in texts:
+        menu.register(text)(pressed)
+    router.message.register(menu.dispatch, menu.filter)
+    return router
+
+
+def update(number: int, text: str) -> Update:
+    user = User(id=42, is_bot=False, first_name='Аня')
+    return Update(update_id=number, message=Message(
+        message_id=number, date=datetime.now(), chat=Chat(id=42, type='private'), from_user=user, text=text,
+    ))
+
+
+async def per_update_us(dp: Dispatcher, bot: Bot, text: str, count: int) -> float:
+    updates = [update(number, text) for number in range(count)]
+    started = time.perf_counter()
+    for item in updates:
+        await dp.feed_update(bot, item)
+    return round((time.perf_counter() - started) / count * 1e6, 1)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buttons", type=int, nargs="+", default=[5, 20, 100, 500])
+    parser.add_argument("--updates", type=int, default=500)
+    args = parser.parse_args()
+    bot = Bot(token="42:BENCH")
+    print(f"{'кнопок':>6} | {'кнопка':>10} | {'фильтры':>8} | {'словарь':>8}  (мкс на апдейт)")
+    for buttons in args.buttons:
+        texts = [f"🍲 Кнопка {number}" for number in range(buttons)]
+        for name, text in (("первая", texts[0]), ("последняя", texts[-1]), ("нет такой", "Привет!")):
+            timings = []
+            for build in (filter_chain, button_table):
+                dp = Dispatcher()
+                dp.include_router(build(texts))
+                timings.append(await per_update_us(dp, bot, text, args.updates))
+            print(f"{buttons:>6} | {name:>10} | {timings[0]:>8} | {timings[1]:>8}")
+    await bot.session.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Память под состояние листания рецептов у 100 тыс. пользователей одновременно.
+
+    python -m benchmarks.bench_fsm_memory [--users 100000] [--old-users 10000]
+
+Раньше в данных FSM лежали сами объекты Recipe (10 штук с инструкциями на
+пользователя), теперь - список ID и курсор. Старую схему меряем на --old-users
+пользователях, потому что на 100 тыс. она не помещается в память тестовой машины,
+и пересчитываем на --users. Карточки рецептов при новой схеме лежат в общем
+кэше (app.recipe_cards), его размер ограничен отдельно.
+"""
+import argparse
+import asyncio
+import json
+import random
+import tracemalloc
+from typing import Tuple
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import Recipe, Category, Cuisine, Type
+from app.recipe_cards import card_cache
+from benchmarks.common import temp_engine
+
+RECIPES = 1000
+PER_USER = 10
+INSTRUCTIONS = "Нарезать, перемешать и запекать 40 минут при 180 градусах. " * 10
+
+
+def _key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+async def old_states(engine, users: int) -> int:
+    storage = MemoryStorage()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for user_id in range(users):
+        ids = random.sample(range(1, RECIPES + 1), PER_USER)
+        # Как раньше: рецепты загружаются в своей сессии и живут в FSM отсоединёнными
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            recipes = (await session.scalars(select(Recipe).where(Recipe.id.in_(ids)))).all()
+        await storage.update_data(_key(user_id), {"recipes": list(recipes), "current_recipe_index": 0})
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used
+
+
+async def new_states(users: int) -> Tuple[int, int]:
+    storage = MemoryStorage()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for user_id in range(users):
+        ids = random.sample(range(1, RECIPES + 1), PER_USER)
+        await storage.update_data(_key(user_id), {"recipe_ids": ids, "current_recipe_index": 0})
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # Столько же в среднем занимает строка состояния в базе (app.fsm_storage)
+    row = len(json.dumps(await storage.get_data(_key(0)), ensure_ascii=False).encode())
+    return used, row
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--old-users", type=int, default=10000)
+    args = parser.parse_args()
+    engine = await temp_engine()
+    async with AsyncSession(engine) as session:
+        for model in (Category, Cuisine, Type):
+            await session.execute(insert(model), [{"name": model.__tablename__}])
+        await session.execute(insert(Recipe), [
+            {"title": f"Рецепт {n}", "instructions": INSTRUCTIONS, "category_id": 1, "cuisine_id": 1, "type_id": 1, "position": None, "like": None, "dislike": None}
+            for n in range(RECIPES)
+        ])
+        await session.commit()
+    old = await old_states(engine, args.old_users)
+    new, row = await new_states(args.users)
+    mb = 1024 * 1024
+    print(f"Объекты Recipe в FSM: {old / mb:.1f} МБ на {args.old_users} пользователей, "
+          f"{old / args.old_users / 1024:.1f} КБ на пользователя, ~{old / args.old_users * args.users / mb:.0f} МБ на {args.users}")
+    print(f"ID и курсор в FSM:    {new / mb:.1f} МБ на {args.users} пользователей, {new / args.users:.0f} Б на пользователя, "
+          f"строка в базе {row} Б")
+    print(f"Кэш карточек рецептов: не больше {card_cache.maxsize / mb:.0f} МБ на процесс")
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
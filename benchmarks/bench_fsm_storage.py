@@ -0,0 +1,78 @@
+"""
+Пропускная способность апдейтов с состоянием FSM в памяти и в базе.
+
+    python -m benchmarks.bench_fsm_storage [--users 1000] [--updates 20000]
+
+Каждый апдейт делает то же, что листание рецептов в боте: читает состояние
+и данные через BufferedFSMContext (app.fsm_storage), меняет курсор и
+сохраняет. Сравниваем MemoryStorage aiogram и DatabaseStorage: с пустой
+памятью (состояния загружаются из базы), с состояниями в памяти и с
+flush_interval=0, когда изменения пишутся в базу почти сразу. Время включает
+close(), то есть запись последних изменений.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.fsm_storage import BufferedFSMContext, DatabaseStorage
+from benchmarks.common import temp_engine
+
+STATE = "Form:browsing_recipes"
+
+
+def _key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+async def handle(storage: BaseStorage, user_id: int):
+    key = _key(user_id)
+    # FSM-миддлварь aiogram читает состояние, FSMBufferMiddleware сохраняет в конце апдейта
+    state = BufferedFSMContext(FSMContext(storage, key), await storage.get_state(key))
+    data = await state.get_data()
+    await state.update_data(recipe_ids=data.get("recipe_ids") or random.sample(range(1, 100000), 10),
+                            current_recipe_index=data.get("current_recipe_index", -1) + 1)
+    await state.set_state(STATE)
+    await state.flush()
+
+
+async def run(storage: BaseStorage, users: int, updates: int) -> float:
+    started = time.perf_counter()
+    for _ in range(updates):
+        await handle(storage, random.randrange(users))
+        # Между апдейтами бот ждёт сеть, фоновая запись успевает выполниться
+        await asyncio.sleep(0)
+    await storage.close()
+    return updates / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+    engine = await temp_engine()
+    print(f"{args.updates} апдейтов от {args.users} пользователей")
+    print(f"{'хранилище':>28} | {'апдейтов/с':>10} | {'чтений':>7} | {'записей':>7}")
+    rate = await run(MemoryStorage(), args.users, args.updates)
+    print(f"{'MemoryStorage':>28} | {rate:>10.0f} | {'-':>7} | {'-':>7}")
+    for name, storage, warm in (
+        ("DatabaseStorage, холодная", DatabaseStorage(engine), False),
+        ("DatabaseStorage", DatabaseStorage(engine), True),
+        ("DatabaseStorage, интервал 0", DatabaseStorage(engine, flush_interval=0), True),
+    ):
+        if warm:
+            for user_id in range(args.users):
+                await storage.get_state(_key(user_id))
+            storage.reads = 0
+        rate = await run(storage, args.users, args.updates)
+        print(f"{name:>28} | {rate:>10.0f} | {storage.reads:>7} | {storage.writes:>7}")
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+Задержка перелистывания страницы ингредиентов при 50 тыс. ингредиентов.
+
+    python -m benchmarks.bench_ingredient_pages [--ingredients 50000] [--types 10]
+
+Для выбора при поиске (один тип, по 5 на странице) и для админки (все, по 20)
+сравнивает на разной глубине страницу через OFFSET с количеством, как листал
+бот раньше, следующую страницу по ключу из IngredientPager без кэша этой
+страницы и страницу из кэша.
+"""
+import argparse
+import asyncio
+import random
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.ingredient_pages import IngredientPager
+from app.database.models import Ingredient, IngredientType
+from benchmarks.common import measure, temp_engine
+
+WORDS = ["Томат", "Огурец", "Сыр", "Мука", "Рис", "Лук", "Перец", "Мясо", "Рыба", "Соус"]
+
+
+async def fill(session: AsyncSession, ingredients: int, types: int):
+    await session.execute(insert(IngredientType), [{"name": f"Тип {n}"} for n in range(1, types + 1)])
+    await session.execute(insert(Ingredient), [
+        {"name": f"{random.choice(WORDS)} {number:06d}", "protein": "1", "fat": "1", "carbohydrate": "1",
+         "ingredient_type_id": random.randint(1, types)}
+        for number in range(ingredients)
+    ])
+    await session.commit()
+
+
+async def offset_page(session: AsyncSession, type_id, number: int, per_page: int):
+    # Раньше каждое нажатие считало ингредиенты и брало страницу через OFFSET
+    count = select(func.count(Ingredient.id))
+    query = select(Ingredient.id, Ingredient.name).order_by(Ingredient.name, Ingredient.id)
+    if type_id is not None:
+        count = count.where(Ingredient.ingredient_type_id == type_id)
+        query = query.where(Ingredient.ingredient_type_id == type_id)
+    await session.scalar(count)
+    return (await session.execute(query.offset(number * per_page).limit(per_page))).all()
+
+
+async def keyset_page(session: AsyncSession, pager: IngredientPager, type_id, number: int):
+    # Предыдущая страница в кэше (её только что показали), эта - нет
+    pager._pages.pop((type_id, number), None)
+    return await pager.page(session, type_id, number)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ingredients", type=int, default=50000)
+    parser.add_argument("--types", type=int, default=10)
+    args = parser.parse_args()
+    engine = await temp_engine()
+    async with AsyncSession(engine) as session:
+        await fill(session, args.ingredients, args.types)
+        print(f"{args.ingredients} ингредиентов, {args.types} типов (медиана, мс)")
+        print(f"{'список':>10} | {'страница':>8} | {'OFFSET':>8} | {'по ключу':>8} | {'из кэша':>8}")
+        for name, type_id, per_page in (("тип 1", 1, 5), ("админка", None, 20)):
+            pager = IngredientPager(per_page=per_page)
+            last = (await pager.page(session, type_id, 10 ** 9)).number
+            for number in sorted({1, 10, last // 2, last}):
+                await pager.page(session, type_id, number - 1)
+                old = await measure(lambda: offset_page(session, type_id, number, per_page), 30)
+                keyset = await measure(lambda: keyset_page(session, pager, type_id, number), 30)
+                cached = await measure(lambda: pager.page(session, type_id, number), 200)
+                print(f"{name:>10} | {number:>8} | {old['median_ms']:>8} | {keyset['median_ms']:>8} | {cached['median_ms']:>8}")
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+Подбор рецептов по 1, 5 и 20 выбранным ингредиентам в режимах "любой" и "все".
+
+    python -m benchmarks.bench_matching [--recipes 100000] [--ingredients 500] [--per-recipe 8]
+
+Сравнивает прежний join с recipe_ingredient (дубли рецептов, без ранжирования)
+с get_ingredient_matches + top_matches: группировкой в SQL и через индекс в памяти.
+"""
+import argparse
+import asyncio
+import random
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.facets import recipe_index
+from app.database.models import Recipe, Recipe_ingredient, Ingredient, IngredientType, Category, Cuisine, Type
+from app.database.sampling import get_ingredient_matches, top_matches
+from benchmarks.common import measure, temp_engine
+
+LIMIT = 10
+
+
+async def fill(session: AsyncSession, recipes: int, ingredients: int, per_recipe: int):
+    await session.execute(insert(IngredientType), [{"name": "Тип"}])
+    for model in (Category, Cuisine, Type):
+        await session.execute(insert(model), [{"name": model.__tablename__}])
+    await session.execute(insert(Ingredient), [
+        {"name": f"Ингредиент {n}", "protein": "0", "fat": "0", "carbohydrate": "0", "ingredient_type_id": 1}
+        for n in range(ingredients)
+    ])
+    rows = [
+        {"title": f"Рецепт {n}", "instructions": "", "category_id": 1, "cuisine_id": 1, "type_id": 1, "position": None, "like": None, "dislike": None}
+        for n in range(recipes)
+    ]
+    for offset in range(0, len(rows), 50000):
+        await session.execute(insert(Recipe), rows[offset:offset + 50000])
+    # Популярные ингредиенты встречаются чаще, как соль и лук в настоящих рецептах
+    weights = [1 / (rank + 1) for rank in range(ingredients)]
+    links = []
+    for recipe_id in range(1, recipes + 1):
+        picked = set()
+        while len(picked) < per_recipe:
+            picked.update(random.choices(range(1, ingredients + 1), weights, k=per_recipe - len(picked)))
+        links.extend({"recipe_id": recipe_id, "ingredient_id": ingredient_id} for ingredient_id in picked)
+        if len(links) >= 100000:
+            await session.execute(insert(Recipe_ingredient), links)
+            links = []
+    if links:
+        await session.execute(insert(Recipe_ingredient), links)
+    await session.commit()
+
+
+async def old_join(session: AsyncSession, selected):
+    # Так искал бот раньше: рецепт повторяется для каждого совпавшего ингредиента
+    result = await session.execute(
+        select(Recipe).join(Recipe_ingredient).where(Recipe_ingredient.ingredient_id.in_(selected)).order_by(func.random())
+    )
+    return result.scalars().all()[:LIMIT]
+
+
+async def ranked(session: AsyncSession, selected, match_all: bool):
+    return top_matches(await get_ingredient_matches(session, None, None, None, selected, match_all), LIMIT, penalize_missing=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--ingredients", type=int, default=500)
+    parser.add_argument("--per-recipe", type=int, default=8)
+    args = parser.parse_args()
+    engine = await temp_engine()
+    async with AsyncSession(engine) as session:
+        await fill(session, args.recipes, args.ingredients, args.per_recipe)
+        print(f"рецептов: {args.recipes}, ингредиентов: {args.ingredients}, в рецепте: {args.per_recipe}; медиана, мс")
+        print(f"{'выбрано':>7} | {'join':>8} | {'SQL любой':>9} | {'SQL все':>8} | {'индекс любой':>12} | {'индекс все':>10}")
+        for count in (1, 5, 20):
+            # Выбираем из первой сотни: так ингредиенты пересекаются, как у настоящих пользователей
+            selected = random.sample(range(1, min(args.ingredients, 100) + 1), count)
+            recipe_index.ready = False
+            join = await measure(lambda: old_join(session, selected), 5)
+            sql_any = await measure(lambda: ranked(session, selected, False), 10)
+            sql_all = await measure(lambda: ranked(session, selected, True), 10)
+            await recipe_index.build(session)
+            index_any = await measure(lambda: ranked(session, selected, False), 10)
+            index_all = await measure(lambda: ranked(session, selected, True), 10)
+            print(
+                f"{count:>7} | {join['median_ms']:>8} | {sql_any['median_ms']:>9} | {sql_all['median_ms']:>8} | "
+                f"{index_any['median_ms']:>12} | {index_all['median_ms']:>10}"
+            )
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Случайная выборка рецептов по фильтрам на таблице от 1 тыс. до 1 млн рецептов.
+
+    python -m benchmarks.bench_sampling [--sizes 1000 10000 100000 1000000]
+
+Сравнивает прежний поиск (ORDER BY random() и загрузка всех подходящих рецептов)
+с app.database.sampling: без индекса в памяти и без кэша, с кэшем списков ID
+и с индексом рецептов (app.database.facets), как работает бот.
+"""
+import argparse
+import asyncio
+import random
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.facets import recipe_index
+from app.database.models import Recipe, Category, Cuisine, Type
+from app.database import sampling
+from benchmarks.common import measure, temp_engine
+
+CATEGORIES, CUISINES, TYPES = 10, 10, 5
+INSTRUCTIONS = "Нарезать, перемешать и запекать 40 минут при 180 градусах. " * 10
+LIMIT = 10
+
+
+async def fill(session: AsyncSession, start: int, stop: int):
+    rows = [
+        {
+            "title": f"Рецепт {number}",
+            "instructions": INSTRUCTIONS,
+            "category_id": random.randint(1, CATEGORIES),
+            "cuisine_id": random.randint(1, CUISINES),
+            "type_id": random.randint(1, TYPES),
+            "position": None, "like": None, "dislike": None,
+        }
+        for number in range(start, stop)
+    ]
+    for offset in range(0, len(rows), 50000):
+        await session.execute(insert(Recipe), rows[offset:offset + 50000])
+    await session.commit()
+
+
+async def order_by_random(session: AsyncSession):
+    # Так искал бот до выборки по спискам ID
+    result = await session.execute(
+        select(Recipe).where(Recipe.category_id == 1, Recipe.cuisine_id == 1).order_by(func.random())
+    )
+    return result.scalars().all()[:LIMIT]
+
+
+async def sample(session: AsyncSession):
+    ids = await sampling.sample_recipe_ids(session, LIMIT, category_id=1, cuisine_id=1)
+    return (await session.scalars(select(Recipe).where(Recipe.id.in_(ids)))).all()
+
+
+async def sample_uncached(session: AsyncSession):
+    sampling._recipe_ids.clear()
+    return await sample(session)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    args = parser.parse_args()
+    engine = await temp_engine()
+    async with AsyncSession(engine) as session:
+        for model, count in ((Category, CATEGORIES), (Cuisine, CUISINES), (Type, TYPES)):
+            await session.execute(insert(model), [{"name": f"{model.__tablename__} {n}"} for n in range(1, count + 1)])
+        await session.commit()
+        filled = 0
+        print(f"{'рецептов':>9} | {'ORDER BY random()':>18} | {'без кэша':>10} | {'с кэшем':>10} | {'индекс':>10}  (медиана, мс)")
+        for size in sorted(args.sizes):
+            await fill(session, filled, size)
+            filled = size
+            repeat = 5 if size >= 100000 else 30
+            recipe_index.ready = False
+            old = await measure(lambda: order_by_random(session), repeat)
+            uncached = await measure(lambda: sample_uncached(session), repeat)
+            cached = await measure(lambda: sample(session), 200)
+            await recipe_index.build(session)
+            sampling._recipe_ids.clear()
+            indexed = await measure(lambda: sample(session), 200)
+            print(f"{size:>9} | {old['median_ms']:>18} | {uncached['median_ms']:>10} | {cached['median_ms']:>10} | {indexed['median_ms']:>10}")
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
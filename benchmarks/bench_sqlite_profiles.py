@@ -0,0 +1,177 @@
+"""
+Смешанная нагрузка на SQLite с профилями из app.database.sqlite_profile.
+
+    python -m benchmarks.bench_sqlite_profiles [--profiles default wal] [--seconds 10]
+        [--recipes 100000] [--users 10000] [--searchers 50] [--payers 4]
+
+Одновременно идут поиски (выборка ID без индекса в памяти, чтобы чтения шли
+в базу, и три карточки рецептов) через пул чтения, оплаты - сессия читает
+пользователя и потом пишет, как process_payment_event, - и запись состояний
+FSM через DatabaseStorage. Считаются операции в секунду, p95 и ошибки
+"database is locked".
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from app.database import sampling
+from app.database.facets import recipe_index
+from app.database.migrations import upgrade
+from app.database.models import Recipe, Recipe_ingredient, Ingredient, IngredientType, Category, Cuisine, Type, User, PaymentEvent
+from app.database.sqlite_profile import get_profile, install_profile
+from app.fsm_storage import DatabaseStorage
+from app.recipe_cards import load_recipe_card
+
+INGREDIENTS = 500
+PER_RECIPE = 5
+INSTRUCTIONS = "Нарезать, перемешать и запекать 40 минут при 180 градусах. " * 10
+
+
+def engines(profile_name: str):
+    """Движки для записи и чтения, как их строит app.database.models."""
+    profile = get_profile(profile_name)
+    url = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.sqlite3")
+    engine = create_async_engine(url)
+    install_profile(engine.sync_engine, profile)
+    read_engine = engine
+    if profile.read_pool_size:
+        read_engine = create_async_engine(url, pool_size=profile.read_pool_size, max_overflow=0)
+        install_profile(read_engine.sync_engine, profile, read_only=True)
+    return engine, read_engine
+
+
+async def fill(engine: AsyncEngine, recipes: int, users: int):
+    async with AsyncSession(engine) as session:
+        for model in (Category, Cuisine, Type, IngredientType):
+            await session.execute(insert(model), [{"name": f"{model.__tablename__} {n}"} for n in range(1, 6)])
+        await session.execute(insert(Ingredient), [
+            {"name": f"Ингредиент {n}", "protein": "1", "fat": "1", "carbohydrate": "1", "ingredient_type_id": n % 5 + 1}
+            for n in range(INGREDIENTS)
+        ])
+        for start in range(0, recipes, 20000):
+            count = min(20000, recipes - start)
+            await session.execute(insert(Recipe), [
+                {"title": f"Рецепт {n}", "instructions": INSTRUCTIONS, "category_id": random.randint(1, 5),
+                 "cuisine_id": random.randint(1, 5), "type_id": random.randint(1, 5), "position": None, "like": None, "dislike": None}
+                for n in range(start, start + count)
+            ])
+            await session.execute(insert(Recipe_ingredient), [
+                {"recipe_id": recipe_id, "ingredient_id": ingredient_id}
+                for recipe_id in range(start + 1, start + count + 1)
+                for ingredient_id in random.sample(range(1, INGREDIENTS + 1), PER_RECIPE)
+            ])
+        now = datetime.now()
+        await session.execute(insert(User), [
+            {"tg_id": tg_id, "name": f"Пользователь {tg_id}", "is_trial": True, "start_date": now, "end_date": now + timedelta(days=3)}
+            for tg_id in range(1, users + 1)
+        ])
+        await session.commit()
+
+
+class Load:
+    def __init__(self):
+        self.timings: Dict[str, List[float]] = {"поиск": [], "оплата": []}
+        self.locked: Dict[str, int] = {"поиск": 0, "оплата": 0}
+        self.running = True
+
+    async def repeat(self, kind: str, call):
+        while self.running:
+            started = time.perf_counter()
+            try:
+                await call()
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                self.locked[kind] += 1
+                continue
+            self.timings[kind].append((time.perf_counter() - started) * 1000)
+
+
+async def search(reader: async_sessionmaker):
+    async with reader() as session:
+        ids = await sampling.sample_recipe_ids(
+            session, 10, category_id=random.randint(1, 5),
+            ingredient_ids=random.sample(range(1, INGREDIENTS + 1), 3),
+        )
+        for recipe_id in ids[:3]:
+            await load_recipe_card(session, recipe_id)
+
+
+async def pay(writer: async_sessionmaker, users: int, payments):
+    tg_id = random.randint(1, users)
+    async with writer() as session:
+        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        await session.execute(insert(PaymentEvent).values(
+            payment_id=f"pay-{next(payments)}", event="payment.succeeded", user_id=tg_id,
+            status="done", attempts=0, received_at=datetime.now(), processed_at=datetime.now(),
+        ))
+        await session.execute(update(User).where(User.id == user.id).values(is_trial=False, end_date=datetime.now() + timedelta(days=365)))
+        await session.commit()
+
+
+async def browse(storage: DatabaseStorage, users: int, load: Load):
+    # Листание рецептов: данные FSM меняются на каждый апдейт, в базу уходят пачкой раз в секунду
+    while load.running:
+        user_id = random.randint(1, users)
+        await storage.set_data(StorageKey(bot_id=1, chat_id=user_id, user_id=user_id), {"current_recipe_index": random.randint(0, 9)})
+        await asyncio.sleep(0.001)
+
+
+def p95(timings: List[float]) -> float:
+    return round(sorted(timings)[int(len(timings) * 0.95) - 1], 1) if timings else 0.0
+
+
+async def run(profile: str, args) -> str:
+    engine, read_engine = engines(profile)
+    await upgrade(engine)
+    await fill(engine, args.recipes, args.users)
+    recipe_index.ready = False
+    sampling._recipe_ids.clear()
+    writer, reader = async_sessionmaker(engine), async_sessionmaker(read_engine)
+    storage = DatabaseStorage(engine=engine)
+    load = Load()
+    payments = iter(range(10 ** 9))
+    tasks = [asyncio.create_task(load.repeat("поиск", lambda: search(reader))) for _ in range(args.searchers)]
+    tasks += [asyncio.create_task(load.repeat("оплата", lambda: pay(writer, args.users, payments))) for _ in range(args.payers)]
+    tasks.append(asyncio.create_task(browse(storage, args.users, load)))
+    await asyncio.sleep(args.seconds)
+    load.running = False
+    await asyncio.gather(*tasks)
+    await storage.close()
+    await engine.dispose()
+    await read_engine.dispose()
+    searches, paid = load.timings["поиск"], load.timings["оплата"]
+    return (
+        f"{profile:>8} | {len(searches) / args.seconds:>8.0f} | {statistics.median(searches) if searches else 0:>8.1f} | {p95(searches):>8} | "
+        f"{len(paid) / args.seconds:>8.0f} | {p95(paid):>8} | {load.locked['поиск'] + load.locked['оплата']:>7} | {storage.writes:>9}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", nargs="+", default=["default", "wal"])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--searchers", type=int, default=50)
+    parser.add_argument("--payers", type=int, default=4)
+    args = parser.parse_args()
+    print(f"{args.recipes} рецептов, {args.users} пользователей, {args.searchers} поисков и {args.payers} оплаты одновременно, {args.seconds:.0f} с")
+    print(f"{'профиль':>8} | {'поиск/с':>8} | {'медиана':>8} | {'p95 мс':>8} | {'оплат/с':>8} | {'p95 мс':>8} | {'locked':>7} | {'строк FSM':>9}")
+    for profile in args.profiles:
+        print(await run(profile, args))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
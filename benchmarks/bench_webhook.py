@@ -0,0 +1,111 @@
+"""
+Пропускная способность и задержка приёма апдейтов: вебхук против getUpdates.
+
+    python -m benchmarks.bench_webhook [--updates 2000] [--senders 1 10 50] [--latency 0.05]
+
+Бот в одном процессе с тем же роутером, FSM в базе (временный SQLite) и
+ограничителем отправки. Вместо Telegram - локальный сервер Bot API, который
+отвечает через --latency секунд и отдаёт апдейты через getUpdates. Для вебхука
+апдейты POST'ами приходят в FastAPI-приложение app.webhook (telegram_webhook),
+--senders одновременных соединений, как max_connections у Telegram. Каждый
+апдейт - /start зарегистрированного пользователя из своего чата. Меряем время
+от первого апдейта до последнего ответа и время ответа вебхука.
+"""
+from benchmarks.isolated import isolate
+
+PORT = isolate()
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app import webhook
+from app.bot import bot, dp
+from app.database.migrations import upgrade
+from app.database.models import engine
+from app.handlers import router
+from benchmarks.bench_workers import fill, start_update
+from benchmarks.common import FakeBotApi
+from config import WEBHOOK_PATH
+
+
+async def polling(api: FakeBotApi, chats: range) -> float:
+    polling_task = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+    try:
+        # Прогрев: первый апдейт ждёт запуска поллинга
+        sent = api.calls["sendMessage"]
+        api.push_updates([start_update(chats[0])])
+        await api.wait_for("sendMessage", sent + 1)
+        sent = api.calls["sendMessage"]
+        started = time.perf_counter()
+        api.push_updates([start_update(chat_id) for chat_id in chats[1:]])
+        await api.wait_for("sendMessage", sent + len(chats) - 1)
+        return (len(chats) - 1) / (time.perf_counter() - started)
+    finally:
+        await dp.stop_polling()
+        await polling_task
+
+
+async def webhook_load(api: FakeBotApi, chats: range, senders: int):
+    transport = httpx.ASGITransport(app=webhook.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def post(chat_id: int) -> float:
+            posted = time.perf_counter()
+            response = await client.post(WEBHOOK_PATH, json=start_update(chat_id))
+            response.raise_for_status()
+            return (time.perf_counter() - posted) * 1000
+
+        async def sender(queue: asyncio.Queue, replies: list):
+            while not queue.empty():
+                replies.append(await post(queue.get_nowait()))
+
+        sent = api.calls["sendMessage"]
+        await post(chats[0])
+        await api.wait_for("sendMessage", sent + 1)
+        sent = api.calls["sendMessage"]
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id in chats[1:]:
+            queue.put_nowait(chat_id)
+        replies: list = []
+        started = time.perf_counter()
+        await asyncio.gather(*(sender(queue, replies) for _ in range(senders)))
+        await api.wait_for("sendMessage", sent + len(chats) - 1)
+        return (len(chats) - 1) / (time.perf_counter() - started), statistics.median(replies)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--senders", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--latency", type=float, default=0.05, help="Ответ Bot API, секунд")
+    args = parser.parse_args()
+    await upgrade(engine)
+    # Каждый прогон - новые чаты: кэш подписок и состояния FSM не помогают
+    runs = 1 + len(args.senders)
+    await fill((args.updates + 1) * runs)
+    dp.include_router(router)
+    api = FakeBotApi(PORT, latency=args.latency)
+    await api.start()
+    print(f"{args.updates} апдейтов /start, ответ Bot API {args.latency * 1000:.0f} мс")
+    print(f"{'приём':>16} | {'апдейтов/с':>10} | {'ответ вебхука, мс':>17}")
+    chats = iter(range(1, (args.updates + 1) * runs + 1, args.updates + 1))
+    try:
+        first = next(chats)
+        rate = await polling(api, range(first, first + args.updates + 1))
+        print(f"{'getUpdates':>16} | {rate:>10.0f} | {'-':>17}")
+        for senders in args.senders:
+            first = next(chats)
+            rate, reply = await webhook_load(api, range(first, first + args.updates + 1), senders)
+            print(f"{f'вебхук, {senders} соед.':>16} | {rate:>10.0f} | {reply:>17.2f}")
+    finally:
+        await dp.storage.close()
+        await bot.session.close()
+        await api.close()
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
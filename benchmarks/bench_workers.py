@@ -0,0 +1,105 @@
+"""
+Пропускная способность бота с 1-8 процессами-обработчиками (app.workers).
+
+    python -m benchmarks.bench_workers [--workers 1 2 4 8] [--updates 5000] [--latency 0.05]
+
+Бот работает как в проде: приёмник раздаёт апдейты UpdateSharder'ом, обработчики
+идут по роутеру, хранят FSM в базе (временный SQLite) и отвечают через ограничитель
+отправки. Вместо Telegram - локальный сервер Bot API, который отвечает через
+--latency секунд. Каждый апдейт - /start зарегистрированного пользователя из
+своего чата: чтение подписки из базы, запись состояния FSM и одно сообщение.
+Время считается от раздачи апдейтов до последнего ответа; процессы перед этим
+прогреты.
+"""
+from benchmarks.isolated import isolate
+
+PORT = isolate()
+
+import argparse
+import asyncio
+import itertools
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app.database.migrations import upgrade
+from app.database.models import async_session, engine, User
+from app.workers import UpdateSharder
+from benchmarks.common import FakeBotApi
+
+_update_ids = itertools.count(1)
+
+
+def start_update(chat_id: int) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": 1, "date": int(time.time()), "text": "/start",
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Тест"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+async def fill(users: int):
+    now = datetime.now()
+    async with async_session() as session:
+        for start in range(1, users + 1, 50000):
+            await session.execute(insert(User), [
+                {"tg_id": tg_id, "name": f"Пользователь {tg_id}", "login": None, "is_trial": False,
+                 "start_date": now, "end_date": now + timedelta(days=365)}
+                for tg_id in range(start, min(start + 50000, users + 1))
+            ])
+        await session.commit()
+
+
+async def run(api: FakeBotApi, workers: int, chats: range) -> float:
+    sharder = UpdateSharder(workers)
+    sharder.start()
+    try:
+        # Прогрев: по апдейту в каждый процесс, чтобы не мерить запуск и построение индекса
+        sent = api.calls["sendMessage"]
+        await sharder.dispatch(start_update(chat_id) for chat_id in range(chats.start, chats.start + workers))
+        await api.wait_for("sendMessage", sent + workers)
+        sent = api.calls["sendMessage"]
+        started = time.perf_counter()
+        # Апдейты приходят пачками, как из getUpdates
+        updates = [start_update(chat_id) for chat_id in chats[workers:]]
+        for offset in range(0, len(updates), 100):
+            await sharder.dispatch(updates[offset:offset + 100])
+        await api.wait_for("sendMessage", sent + len(updates))
+        return len(updates) / (time.perf_counter() - started)
+    finally:
+        await sharder.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Ответ Bot API, секунд")
+    args = parser.parse_args()
+    await upgrade(engine)
+    # Каждый прогон - новые чаты: кэш подписок и состояния FSM не помогают
+    await fill((args.updates + max(args.workers)) * len(args.workers))
+    await engine.dispose()
+    api = FakeBotApi(PORT, latency=args.latency)
+    await api.start()
+    print(f"{args.updates} апдейтов /start, ответ Bot API {args.latency * 1000:.0f} мс, CPU: {os.cpu_count()}")
+    print(f"{'процессов':>9} | {'апдейтов/с':>10}")
+    first_chat = 1
+    try:
+        for workers in args.workers:
+            chats = range(first_chat, first_chat + args.updates + workers)
+            first_chat = chats.stop
+            rate = await run(api, workers, chats)
+            print(f"{workers:>9} | {rate:>10.0f}")
+    finally:
+        await api.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+import asyncio
+import itertools
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+from typing import Awaitable, Callable, List, Optional
+
+from aiohttp import web
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.database.migrations import upgrade
+from app.database.sqlite_profile import get_profile, install_profile
+
+
+async def temp_engine() -> AsyncEngine:
+    """Пустая база SQLite во временном файле с той же схемой и настройками, что у бота."""
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.sqlite3")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    install_profile(engine.sync_engine, get_profile('wal'))
+    await upgrade(engine)
+    return engine
+
+
+async def measure(call: Callable[[], Awaitable], repeat: int = 50) -> dict:
+    """Медиана и p95 времени вызова в миллисекундах."""
+    timings: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {"median_ms": round(statistics.median(timings), 3), "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3)}
+
+
+class FakeBotApi:
+    """
+    Сервер Bot API на localhost: на любой метод отвечает успехом через latency
+    секунд и считает вызовы. Бот ходит к нему через TELEGRAM_API_SERVER.
+    getUpdates отдаёт апдейты, добавленные через push_updates.
+    """
+
+    def __init__(self, port: int, latency: float = 0.0):
+        self.port = port
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self._changed = asyncio.Event()
+        self._updates: List[dict] = []
+        self._queued = asyncio.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post()) if request.can_read_body else {}
+        if method.lower() == "getupdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(data)})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls[method] += 1
+        self._changed.set()
+        if method.lower() in ("sendmessage", "editmessagetext"):
+            chat_id = int(data.get("chat_id") or 0)
+            result = {
+                "message_id": next(self._message_ids), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", ""),
+            }
+        elif method.lower() == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "Бенчмарк", "username": "bench_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, data: dict) -> List[dict]:
+        # Как Telegram: offset подтверждает всё до него, без новых апдейтов запрос ждёт timeout
+        offset = int(data.get("offset") or 0)
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates:
+            self._queued.clear()
+            try:
+                await asyncio.wait_for(self._queued.wait(), float(data.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(data.get("limit") or 100)]
+
+    def push_updates(self, updates: List[dict]):
+        self._updates.extend(updates)
+        self._queued.set()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def wait_for(self, method: str, count: int, timeout: float = 300):
+        """Ждёт, пока method вызовут count раз с начала работы сервера."""
+        deadline = time.monotonic() + timeout
+        while self.calls[method] < count:
+            self._changed.clear()
+            await asyncio.wait_for(self._changed.wait(), deadline - time.monotonic())
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,28 @@
+"""
+Окружение для бенчмарков, которые запускают бота целиком: временная база и
+локальный сервер Bot API вместо Telegram (benchmarks.common.FakeBotApi).
+Импортировать раньше app и config - они читают настройки при импорте.
+"""
+import os
+import socket
+import tempfile
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def isolate() -> int:
+    """Настраивает окружение и возвращает порт для FakeBotApi."""
+    # Процессы-обработчики (spawn) выполняют модуль бенчмарка заново, но наследуют
+    # окружение родителя и должны получить ту же базу и тот же порт
+    if "BENCH_BOT_API_PORT" not in os.environ:
+        port = _free_port()
+        os.environ["BENCH_BOT_API_PORT"] = str(port)
+        os.environ["TELEGRAM_API_SERVER"] = f"http://127.0.0.1:{port}"
+        os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.sqlite3")
+        # Ограничитель отправки остаётся в цепочке, но не упирается в лимит Telegram
+        os.environ["TELEGRAM_RATE_LIMIT"] = "1000000"
+    return int(os.environ["BENCH_BOT_API_PORT"])
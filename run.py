@@ -1,18 +1,49 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher, F
+from aiogram import Bot, F
 from aiogram.filters import CommandStart
 from aiogram.types import Message
 from app.handlers import router
-from app.bot import bot
+from app.bot import bot, dp
 from app.database.models import  async_main
-dp = Dispatcher()
+from app.database.facets import build_recipe_index
+from app.expiry import expiry_scheduler
+from app.database.user_cache import user_change_watcher
+from app.yookassa_payment import yookassa
+from app.outbound import outbound
+from app.workers import UpdateSharder
+from config import BOT_MODE, BOT_WORKERS
 
 
 async def main():
     await  async_main()
+    # При BOT_WORKERS > 1 этот процесс только принимает апдейты и раздаёт их обработчикам
+    sharder = UpdateSharder(BOT_WORKERS) if BOT_WORKERS > 1 else None
+    if sharder:
+        outbound.split(BOT_WORKERS + 1)
+        sharder.start()
+    else:
+        await build_recipe_index()
     dp.include_router(router)
-    await dp.start_polling(bot)
+    # Напоминания об окончании подписки работают при любом режиме бота
+    expiry_scheduler.start()
+    # Кэш подписок сбрасывается по изменениям из админки
+    user_change_watcher.start()
+    try:
+        if BOT_MODE == 'webhook':
+            from app.webhook import run_webhook
+            await run_webhook(sharder)
+        elif sharder:
+            await sharder.poll(bot, dp)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await expiry_scheduler.stop()
+        await user_change_watcher.stop()
+        if sharder:
+            await sharder.stop()
+            await bot.session.close()
+        await yookassa.close()
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
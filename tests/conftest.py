@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+import pytest
+
+# Тесты работают с временной базой SQLite. С TEST_DATABASE_URL, например
+# postgresql+asyncpg://postgres@localhost/bot_test, те же тесты идут на одноразовой
+# базе PostgreSQL: все таблицы в ней удаляются перед каждым тестом.
+# Задаём до первого импорта app.database.models, который читает config.DATABASE_URL.
+os.environ['DATABASE_URL'] = os.getenv('TEST_DATABASE_URL') or 'sqlite+aiosqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bot-tests-'), 'test.sqlite3')
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+def _reset_caches():
+    from app.database import sampling, user_cache
+    from app.database.facets import recipe_index
+    from app.database.ingredient_pages import forget_ingredient_pages
+    from app.recipe_cards import card_cache
+    recipe_index.__init__()
+    sampling._recipe_ids.clear()
+    user_cache._users.clear()
+    card_cache.clear()
+    forget_ingredient_pages()
+
+
+@pytest.fixture
+async def db():
+    """Пустая база с применёнными миграциями и сброшенными кэшами процесса."""
+    from app.database.migrations import schema_migrations, upgrade
+    from app.database.models import Base, engine, read_engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(schema_migrations.drop, checkfirst=True)
+    await upgrade(engine)
+    _reset_caches()
+    yield engine
+    # Соединения пула привязаны к циклу событий теста
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
@@ -0,0 +1,55 @@
+import itertools
+from types import SimpleNamespace
+from typing import Any, List, Optional, Tuple
+
+
+class FakeBot:
+    """Записывает вызовы методов Bot API вместо отправки в Telegram."""
+
+    def __init__(self):
+        self.calls: List[Tuple[str, dict]] = []
+        self._message_ids = itertools.count(100)
+
+    def _record(self, method: str, **kwargs: Any):
+        self.calls.append((method, kwargs))
+
+    def called(self, method: str) -> List[dict]:
+        return [kwargs for name, kwargs in self.calls if name == method]
+
+    async def send_message(self, chat_id: int, text: str, **kwargs: Any):
+        self._record('send_message', chat_id=chat_id, text=text, **kwargs)
+        return SimpleNamespace(message_id=next(self._message_ids))
+
+    async def edit_message_text(self, **kwargs: Any):
+        self._record('edit_message_text', **kwargs)
+
+    async def edit_message_reply_markup(self, **kwargs: Any):
+        self._record('edit_message_reply_markup', **kwargs)
+
+
+class FakeMessage:
+    """Сообщение пользователя: то, что обработчики берут из aiogram.types.Message."""
+
+    def __init__(self, bot: FakeBot, user_id: int, text: Optional[str] = None, message_id: int = 1, reply_markup=None):
+        self.bot = bot
+        self.text = text
+        self.message_id = message_id
+        self.reply_markup = reply_markup
+        self.from_user = SimpleNamespace(id=user_id)
+        self.chat = SimpleNamespace(id=user_id)
+        self.answers: List[str] = []
+
+    async def answer(self, text: str, **kwargs: Any) -> 'FakeMessage':
+        self.answers.append(text)
+        sent = await self.bot.send_message(self.chat.id, text, **kwargs)
+        return FakeMessage(self.bot, self.from_user.id, text, sent.message_id, kwargs.get('reply_markup'))
+
+
+class FakeCallback:
+    def __init__(self, message: FakeMessage):
+        self.message = message
+        self.from_user = message.from_user
+        self.answers: List[Optional[str]] = []
+
+    async def answer(self, text: Optional[str] = None, **kwargs: Any):
+        self.answers.append(text)
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+import admin
+from app.database.models import async_session, User
+from app.database.user_cache import get_user_access, UserChangeWatcher
+
+pytestmark = pytest.mark.anyio
+
+
+async def _access(tg_id: int):
+    async with async_session() as session:
+        return await get_user_access(session, tg_id)
+
+
+async def test_admin_changes_reset_bot_user_cache(db):
+    now = datetime.now()
+    async with async_session() as session:
+        session.add_all([
+            User(tg_id=tg_id, name=f'Пользователь {tg_id}', is_trial=True, start_date=now, end_date=now - timedelta(days=1))
+            for tg_id in (10, 20, 30)
+        ])
+        await session.commit()
+    watcher = UserChangeWatcher()
+    await watcher.poll_once()
+    for tg_id in (10, 20, 30):
+        assert not (await _access(tg_id)).has_access
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=admin.app), base_url='http://test') as client:
+        response = await client.patch('/api/users/1', json={'is_trial': False, 'end_date': (now + timedelta(days=365)).isoformat()})
+        assert response.status_code == 200
+        assert (await client.delete('/api/users/2')).status_code == 200
+        assert (await client.delete('/api/users/2')).status_code == 404
+        assert (await client.patch('/api/users/3', json={})).status_code == 200
+
+    # Пока журнал не прочитан, бот отвечает из кэша
+    assert not (await _access(10)).has_access
+    assert await watcher.poll_once() == 2
+    assert (await _access(10)).has_access
+    assert await _access(20) is None
+    assert await watcher.poll_once() == 0
+
+
+async def test_watcher_skips_changes_made_before_start(db):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=admin.app), base_url='http://test') as client:
+        async with async_session() as session:
+            session.add(User(tg_id=10, is_trial=True, start_date=datetime.now(), end_date=datetime.now()))
+            await session.commit()
+        assert (await client.patch('/api/users/1', json={'name': 'Петя'})).status_code == 200
+    watcher = UserChangeWatcher()
+    assert await watcher.poll_once() == 0
+    assert await watcher.poll_once() == 0
+    assert watcher.last_id == 1
@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+from typing import List
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import event, select
+
+from app import handlers
+from app.database.models import async_session, Category, Cuisine, Type, IngredientType, Ingredient, Recipe
+from app.database.recipe_writes import save_recipe
+from fakes import FakeBot, FakeMessage
+
+pytestmark = pytest.mark.anyio
+
+# Тесты идут и на SQLite, и на PostgreSQL (TEST_DATABASE_URL, см. conftest.py).
+# SQLite принимает в колонку значение любого типа, поэтому дополнительно проверяем
+# типы параметров запросов: на них asyncpg отвечает DataError.
+
+ADMIN_ID = 1
+
+
+@contextmanager
+def _parameters(engine):
+    seen: List[tuple] = []
+
+    def remember(conn, cursor, statement, parameters, context, executemany):
+        seen.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", remember)
+    try:
+        yield seen
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", remember)
+
+
+def _values(parameters):
+    return list(parameters.values()) if isinstance(parameters, dict) else list(parameters)
+
+
+def _state() -> FSMContext:
+    return FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=ADMIN_ID, user_id=ADMIN_ID))
+
+
+async def test_new_ingredient_nutrients_are_stored_as_strings(db):
+    async with async_session() as session:
+        session.add(IngredientType(name='Овощи'))
+        await session.commit()
+    bot = FakeBot()
+    state = _state()
+    await state.update_data(ingredient_name='Огурец', ingredient_category='Овощи')
+    for handler, text in (
+        (handlers.process_ingredient_protein, '0.8'),
+        (handlers.process_ingredient_fat, '0,1'),  # Не число: переспрашиваем
+        (handlers.process_ingredient_fat, '0.1'),
+    ):
+        await handler(FakeMessage(bot, ADMIN_ID, text), state)
+    message = FakeMessage(bot, ADMIN_ID, '2.5')
+    async with async_session() as session:
+        with _parameters(db) as seen:
+            await handlers.process_ingredient_carbohydrate(message, state, session)
+
+    assert message.answers[0] == "Ингредиент 'Огурец' успешно добавлен в категорию 'Овощи'!"
+    insert = next(parameters for statement, parameters in seen if statement.startswith('INSERT INTO ingredients'))
+    assert [value for value in _values(insert) if isinstance(value, float)] == []
+    async with async_session() as session:
+        ingredient = await session.scalar(select(Ingredient).where(Ingredient.name == 'Огурец'))
+        assert (ingredient.protein, ingredient.fat, ingredient.carbohydrate) == ('0.8', '0.1', '2.5')
+
+
+async def test_recipe_is_deleted_by_numeric_id_only(db):
+    async with async_session() as session:
+        session.add_all([Category(name='Салат'), Cuisine(name='Русская кухня'), Type(name='Постное')])
+        await session.commit()
+        recipe_id = await save_recipe(session, 'Салат', 'Нарезать', 1, 1, 1, [])
+    bot = FakeBot()
+    state = _state()
+    await state.set_state(handlers.AdminStates.waiting_for_recipe_to_delete)
+
+    message = FakeMessage(bot, ADMIN_ID, 'первый')
+    async with async_session() as session:
+        with _parameters(db) as seen:
+            await handlers.process_recipe_to_delete(message, state, session)
+    assert message.answers == ["Пожалуйста, введите число."]
+    assert seen == []
+    assert await state.get_state() == handlers.AdminStates.waiting_for_recipe_to_delete.state
+
+    message = FakeMessage(bot, ADMIN_ID, str(recipe_id))
+    async with async_session() as session:
+        with _parameters(db) as seen:
+            await handlers.process_recipe_to_delete(message, state, session)
+    assert message.answers[0] == f"Рецепт с ID {recipe_id} успешно удален."
+    lookup = next(parameters for statement, parameters in seen if statement.startswith('SELECT'))
+    assert recipe_id in _values(lookup) and str(recipe_id) not in _values(lookup)
+    async with async_session() as session:
+        assert await session.get(Recipe, recipe_id) is None
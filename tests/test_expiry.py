@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import SendMessage
+from sqlalchemy import func, insert, select, text
+
+import app.expiry as expiry
+from app.database.models import async_session, ExpiryNotice, User
+from app.expiry import ExpiryScheduler, EXPIRED, SOON
+from fakes import FakeBot
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 10, 18, 12, 0)
+
+
+class FlakyBot(FakeBot):
+    """Первая отправка в чаты из flaky падает с сетевой ошибкой."""
+
+    def __init__(self, flaky=()):
+        super().__init__()
+        self.flaky = set(flaky)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.flaky:
+            self.flaky.discard(chat_id)
+            raise TelegramNetworkError(SendMessage(chat_id=chat_id, text=text), "timeout")
+        return await super().send_message(chat_id, text, **kwargs)
+
+
+async def _add_users():
+    windows = [
+        (SOON, timedelta(minutes=1), timedelta(hours=23)),  # Закончится в ближайшие сутки
+        (EXPIRED, -timedelta(hours=23), -timedelta(minutes=1)),  # Закончилась за последние сутки
+        (None, timedelta(days=3), timedelta(days=5)),  # Ещё рано напоминать
+        (None, -timedelta(days=5), -timedelta(days=3)),  # Закончилась давно, бот тогда уже напомнил
+    ]
+    rows, expected = [], {SOON: set(), EXPIRED: set()}
+    tg_id = 1000
+    for kind, start, end in windows:
+        for number in range(300):
+            tg_id += 1
+            rows.append({
+                "tg_id": tg_id, "name": None, "login": None, "is_trial": number % 2 == 0,
+                "start_date": NOW - timedelta(days=30), "end_date": NOW + start + (end - start) * number / 300,
+            })
+            if kind:
+                expected[kind].add(tg_id)
+    async with async_session() as session:
+        await session.execute(insert(User), rows)
+        await session.commit()
+    return expected
+
+
+def _recipients(bot: FakeBot):
+    return [call['chat_id'] for call in bot.called('send_message')]
+
+
+async def test_scans_do_not_notify_twice(db, monkeypatch):
+    expected = await _add_users()
+    bot = FlakyBot(flaky={1001, 1301})
+    monkeypatch.setattr(expiry, 'bot', bot)
+
+    first = ExpiryScheduler(batch_size=50)
+    assert await first.run_once(NOW) == 598
+    # Второй проход сразу за первым досылает только не ушедшие из-за сетевой ошибки
+    assert await first.run_once(NOW) == 2
+    assert first.stats()['failed'] == 2
+    # После перезапуска новый планировщик знает об отправленном только из базы
+    restarted = ExpiryScheduler(batch_size=50)
+    assert await restarted.run_once(NOW) == 0
+    assert await restarted.run_once(NOW + timedelta(seconds=30)) == 0
+
+    recipients = _recipients(bot)
+    assert len(recipients) == len(set(recipients)) == 600
+    assert set(recipients) == expected[SOON] | expected[EXPIRED]
+    async with async_session() as session:
+        for kind in (SOON, EXPIRED):
+            count = await session.scalar(select(func.count()).select_from(ExpiryNotice).where(ExpiryNotice.kind == kind))
+            assert count == 300
+
+
+async def test_renewed_subscription_gets_new_reminders(db, monkeypatch):
+    bot = FlakyBot()
+    monkeypatch.setattr(expiry, 'bot', bot)
+    async with async_session() as session:
+        session.add(User(tg_id=1, is_trial=True, start_date=NOW, end_date=NOW + timedelta(hours=2)))
+        await session.commit()
+    scheduler = ExpiryScheduler()
+    assert await scheduler.run_once(NOW) == 1
+
+    async with async_session() as session:
+        user = await session.scalar(select(User).where(User.tg_id == 1))
+        user.end_date = NOW + timedelta(hours=20)
+        await session.commit()
+    assert await scheduler.run_once(NOW) == 1
+    assert _recipients(bot) == [1, 1]
+
+
+def _plan(conn, query):
+    compiled = query.compile(dialect=conn.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    params = [value.isoformat(' ') if isinstance(value, datetime) else value for value in params]
+    return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), tuple(params))]
+
+
+@pytest.mark.parametrize('outside', [0, 100000])
+async def test_window_query_reads_only_the_window(db, outside):
+    if db.dialect.name != 'sqlite':
+        pytest.skip("EXPLAIN QUERY PLAN есть только в SQLite")
+    await _add_users()
+    # Большинство пользователей далеко от окон: проход не должен их перебирать
+    async with async_session() as session:
+        for offset in range(0, outside, 50000):
+            await session.execute(insert(User), [
+                {"tg_id": 10 ** 6 + number, "name": None, "login": None, "is_trial": False,
+                 "start_date": NOW, "end_date": NOW + timedelta(days=30 + number % 300)}
+                for number in range(offset, min(offset + 50000, outside))
+            ])
+        await session.execute(text("ANALYZE"))
+        await session.commit()
+    scheduler = ExpiryScheduler()
+    async with db.connect() as conn:
+        for kind, start, end in ((SOON, NOW, NOW + timedelta(days=1)), (EXPIRED, NOW - timedelta(days=1), NOW)):
+            for last in (None, (start, 0)):
+                plan = await conn.run_sync(_plan, scheduler.window_query(kind, start, end, last))
+                assert any(step.startswith("SEARCH users USING INDEX ix_users_end_date") for step in plan), plan
+                assert not any(step.startswith("SCAN") or "TEMP B-TREE" in step for step in plan), plan
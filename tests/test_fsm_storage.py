@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app import handlers
+from app.database.models import async_session, Category, Cuisine, Type, IngredientType, Ingredient, User
+from app.database.recipe_writes import save_recipe
+from app.fsm_storage import BufferedFSMContext, DatabaseStorage
+from app.middlewares import FSMBufferMiddleware
+from fakes import FakeBot, FakeCallback, FakeMessage
+
+pytestmark = pytest.mark.anyio
+
+USER_ID = 7
+KEY = StorageKey(bot_id=1, chat_id=USER_ID, user_id=USER_ID)
+
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.data_reads = 0
+        self.data_writes = 0
+        self.state_writes = 0
+
+    async def get_data(self, key):
+        self.data_reads += 1
+        return await super().get_data(key)
+
+    async def set_data(self, key, data):
+        self.data_writes += 1
+        await super().set_data(key, data)
+
+    async def set_state(self, key, state=None):
+        self.state_writes += 1
+        await super().set_state(key, state)
+
+    def counters(self):
+        return self.data_reads, self.data_writes, self.state_writes
+
+
+async def _seed_recipes():
+    async with async_session() as session:
+        session.add_all([Category(name='Салат'), Cuisine(name='Русская кухня'), Type(name='Постное'), IngredientType(name='Овощи')])
+        session.add(User(tg_id=USER_ID, name='Петя', is_trial=False, start_date=datetime.now(), end_date=datetime.now() + timedelta(days=30)))
+        await session.flush()
+        session.add_all([Ingredient(name=name, protein='1', fat='0', carbohydrate='5', ingredient_type_id=1) for name in ('Огурец', 'Томат')])
+        await session.commit()
+        for number in range(5):
+            await save_recipe(session, f'Салат {number}', 'Нарезать', 1, 1, 1, [1, 2])
+
+
+async def _browse(storage: CountingStorage, buffered: bool):
+    """Поиск, листание вперёд и назад и "Готовим"; по апдейту на шаг. Возвращает счётчики каждого апдейта."""
+    bot = FakeBot()
+    message = FakeMessage(bot, USER_ID, 'Показать рецепты')
+    await storage.set_data(KEY, {'selected_categorys': 'Салат', 'selected_ingridients': [1]})
+    await storage.set_state(KEY, handlers.Form.waiting_for_recipe_search)
+    per_update = []
+
+    async def feed(handler, event):
+        before = storage.counters()
+        context = FSMContext(storage=storage, key=KEY)
+        raw_state = await context.get_state()
+        async with async_session() as session:
+            if buffered:
+                await FSMBufferMiddleware()(
+                    lambda event, data: handler(event, data['state'], session), event, {'state': context, 'raw_state': raw_state},
+                )
+            else:
+                await handler(event, context, session)
+            await session.commit()
+        per_update.append(tuple(after - was for after, was in zip(storage.counters(), before)))
+
+    await feed(handlers.handle_go_to_recipes, message)
+    shown = FakeMessage(bot, USER_ID, message_id=(await storage.get_data(KEY))['recipe_message_id'])
+    for handler in (handlers.handle_next_recipe, handlers.handle_next_recipe, handlers.handle_prev_recipe, handlers.handle_cook_recipe):
+        await feed(handler, FakeCallback(shown))
+    return per_update, bot
+
+
+async def test_browse_flow_reads_and_writes_state_once_per_update(db):
+    await _seed_recipes()
+    buffered, bot = await _browse(CountingStorage(), buffered=True)
+    unbuffered, _ = await _browse(CountingStorage(), buffered=False)
+
+    assert len(bot.called('edit_message_text')) == 3
+    for data_reads, data_writes, state_writes in buffered:
+        assert data_reads <= 1
+        assert data_writes <= 1
+        assert state_writes <= 1
+    # Без буфера каждое get_data/update_data обработчика доходит до хранилища
+    assert sum(update[0] for update in unbuffered) >= 3 * sum(update[0] for update in buffered)
+    assert sum(update[1] for update in unbuffered) > sum(update[1] for update in buffered)
+
+
+async def test_get_value_sees_changes_of_the_current_update():
+    storage = CountingStorage()
+    await storage.set_data(KEY, {'current_page': 0})
+    state = BufferedFSMContext(FSMContext(storage=storage, key=KEY), None)
+    await state.update_data(current_page=3)
+    assert await state.get_value('current_page') == 3
+    assert await state.get_value('missing', 'default') == 'default'
+    assert (await storage.get_data(KEY))['current_page'] == 0
+    await state.flush()
+    assert (await storage.get_data(KEY))['current_page'] == 3
+
+
+async def test_unchanged_data_is_not_written():
+    storage = CountingStorage()
+    await storage.set_data(KEY, {'selected_ingridients': [1, 2]})
+    writes = storage.data_writes
+    state = BufferedFSMContext(FSMContext(storage=storage, key=KEY), None)
+    data = await state.get_data()
+    await state.update_data(selected_ingridients=data['selected_ingridients'])
+    await state.flush()
+    assert storage.data_writes == writes
+
+
+async def test_database_storage_batches_writes_and_survives_restart(db):
+    storage = DatabaseStorage(engine=db, flush_interval=3600)
+    other = StorageKey(bot_id=1, chat_id=8, user_id=8)
+    for page in range(5):
+        await storage.set_data(KEY, {'current_page': page})
+    await storage.set_state(KEY, handlers.Form.waiting_for_ingridients)
+    await storage.set_data(other, {'selected_ingridients': [3]})
+    await storage.close()
+    # Пять изменений одного ключа и одно другого - две строки
+    assert storage.writes == 2
+
+    restarted = DatabaseStorage(engine=db)
+    assert await restarted.get_data(KEY) == {'current_page': 4}
+    assert await restarted.get_state(KEY) == handlers.Form.waiting_for_ingridients.state
+    assert await restarted.get_data(other) == {'selected_ingridients': [3]}
+    assert restarted.reads == 2
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+from app.database.importer import read_recipes, RecipeImporter
+from app.database.models import async_session, Recipe
+
+pytestmark = pytest.mark.anyio
+
+
+def _recipe(number: int) -> str:
+    return json.dumps({
+        "title": f"Салат {number}", "instructions": "Нарезать", "category": "Салат",
+        "cuisine": "Русская кухня", "type": "Постное", "ingredients": ["Огурец", {"name": "Томат", "protein": 1.1}],
+    }, ensure_ascii=False)
+
+
+async def test_malformed_lines_are_skipped_and_counted(db, tmp_path):
+    path = tmp_path / 'recipes.jsonl'
+    path.write_text("\n".join([
+        _recipe(1),
+        '{"title": "Оборванная строка", "instr',
+        _recipe(2),
+        '["не", "объект"]',
+        '',
+        '42',
+        json.dumps({"title": "Без инструкции", "category": "Салат", "cuisine": "Русская кухня", "type": "Постное"}),
+        json.dumps({"title": "Странный ингредиент", "instructions": "Смешать", "category": "Салат",
+                    "cuisine": "Русская кухня", "type": "Постное", "ingredients": [7]}),
+        _recipe(3),
+    ]) + "\n", encoding='utf-8')
+
+    # Маленькие чанки: плохие строки попадают в разные транзакции
+    stats = await RecipeImporter(engine=db, chunk_size=3, ingredient_type='Овощи').run(read_recipes(path))
+
+    assert (stats.recipes, stats.ingredients) == (3, 6)
+    assert stats.skipped == 5
+    assert stats.malformed == 3
+    async with async_session() as session:
+        titles = (await session.scalars(select(Recipe.title).order_by(Recipe.id))).all()
+        assert titles == ['Салат 1', 'Салат 2', 'Салат 3']
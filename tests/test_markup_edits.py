@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from app import handlers
+from app.callbacks import IngredientToggle
+from app.database.models import async_session, Ingredient, IngredientType
+from app.markup_edits import MarkupEditor
+from fakes import FakeBot, FakeCallback, FakeMessage
+
+pytestmark = pytest.mark.anyio
+
+TAP_INTERVAL = 0.05  # 20 нажатий в секунду
+
+
+def _keyboard(selected) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"{'✅' if id_ in selected else '☑️'} {id_}", callback_data=IngredientToggle(id=id_).pack())]
+        for id_ in range(1, 6)
+    ])
+
+
+def _checked(markup: InlineKeyboardMarkup):
+    return [button.text for row in markup.inline_keyboard for button in row if button.text.startswith('✅')]
+
+
+async def test_burst_of_taps_becomes_one_edit():
+    editor = MarkupEditor()
+    bot = FakeBot()
+    message = FakeMessage(bot, 1, reply_markup=_keyboard(set()))
+    selected = set()
+    for tap in range(20):
+        selected ^= {tap % 3 + 1}
+        editor.schedule(message, _keyboard(selected))
+        await asyncio.sleep(TAP_INTERVAL)
+    await asyncio.sleep(editor.delay + 0.1)
+
+    edits = bot.called('edit_message_reply_markup')
+    assert len(edits) == 1
+    assert _checked(edits[0]['reply_markup']) == ['✅ 1', '✅ 2']
+    assert editor.coalesced == 19
+
+
+async def test_sustained_tapping_still_updates_every_max_wait():
+    editor = MarkupEditor(delay=0.1, max_wait=0.3)
+    bot = FakeBot()
+    message = FakeMessage(bot, 1, reply_markup=_keyboard(set()))
+    for tap in range(50):
+        # Каждое нажатие даёт новую клавиатуру, иначе правка могла бы совпасть с показанной
+        editor.schedule(message, InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=str(tap), callback_data='tap')]]))
+        await asyncio.sleep(0.02)
+    await asyncio.sleep(editor.delay + 0.1)
+    assert 3 <= len(bot.called('edit_message_reply_markup')) <= 5
+
+
+async def test_unchanged_keyboard_is_not_sent():
+    editor = MarkupEditor(delay=0.05)
+    bot = FakeBot()
+    message = FakeMessage(bot, 1, reply_markup=_keyboard({2}))
+    editor.schedule(message, _keyboard({1, 2}))
+    editor.schedule(message, _keyboard({2}))
+    await asyncio.sleep(0.15)
+    assert bot.called('edit_message_reply_markup') == []
+    assert editor.skipped == 1
+
+
+async def test_picker_answers_every_tap_and_edits_once(db, monkeypatch):
+    editor = MarkupEditor()
+    monkeypatch.setattr(handlers, 'markup_editor', editor)
+    async with async_session() as session:
+        session.add(IngredientType(name='Овощи'))
+        await session.flush()
+        session.add_all([Ingredient(name=f'Овощ {n}', protein='1', fat='0', carbohydrate='5', ingredient_type_id=1) for n in range(1, 8)])
+        await session.commit()
+        picker = await handlers.create_ingridients_checkboxes('Овощи', [], session, 0)
+
+    bot = FakeBot()
+    message = FakeMessage(bot, 1, reply_markup=picker)
+    state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=1, user_id=1))
+    await state.update_data(selected_category='Овощи', current_page=0)
+    callbacks = []
+    for tap in range(20):
+        callback = FakeCallback(message)
+        callbacks.append(callback)
+        async with async_session() as session:
+            await handlers.handle_ingridient_selection(callback, IngredientToggle(id=tap % 3 + 1), state, session)
+        await asyncio.sleep(TAP_INTERVAL)
+    await asyncio.sleep(editor.delay + 0.1)
+
+    assert [callback.answers for callback in callbacks] == [[None]] * 20
+    edits = bot.called('edit_message_reply_markup')
+    assert len(edits) == 1
+    assert _checked(edits[0]['reply_markup']) == ['✅ Овощ 1', '✅ Овощ 2']
+    assert (await state.get_data())['selected_ingridients'] == [1, 2]
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from app.outbound import OutboundLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeApi:
+    """make_request для middleware: отвечает 429 retry_after раз подряд, потом успехом."""
+
+    def __init__(self, retry_after: int = 0, failures: int = 0):
+        self.retry_after = retry_after
+        self.failures = failures
+        self.sent = []
+
+    async def __call__(self, bot, method):
+        self.sent.append(time.monotonic())
+        if self.failures:
+            self.failures -= 1
+            raise TelegramRetryAfter(method, "Flood control exceeded", self.retry_after)
+        return "ok"
+
+
+async def test_reply_of_several_messages_is_not_delayed():
+    limiter = OutboundLimiter()
+    api = FakeApi()
+    started = time.monotonic()
+    for number in range(5):
+        await limiter(api, None, SendMessage(chat_id=1, text=str(number)))
+    assert time.monotonic() - started < 0.1
+
+
+async def test_retry_after_outlives_the_chat_bucket_ttl():
+    limiter = OutboundLimiter(per_chat_rate=10, chat_ttl=0.05)
+    api = FakeApi(retry_after=1, failures=1)
+    await limiter(api, None, SendMessage(chat_id=1, text="первое"))
+    assert len(api.sent) == 2
+    assert api.sent[1] - api.sent[0] >= 0.9
+    # Бакет чата давно вышел бы из TTLCache, но пауза от Telegram ещё действует
+    limiter._block_chat(1, 5)
+    await asyncio.sleep(0.1)
+    assert limiter._chat_bucket(1).delay() > 4
+
+
+async def test_unblocked_chats_are_forgotten():
+    limiter = OutboundLimiter(per_chat_rate=10, chat_ttl=0.05)
+    limiter._block_chat(1, 0.05)
+    await asyncio.sleep(0.3)
+    limiter._block_chat(2, 5)
+    assert list(limiter._blocked) == [2]
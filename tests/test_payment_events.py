@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import func, select
+
+import app.payment_events as payment_events
+from app import webhook
+from app.database import user_cache
+from app.database.models import async_session, PaymentEvent, User
+from app.database.user_cache import get_user_access, UserChangeWatcher
+from app.payment_events import DONE, payment_worker, process_payment_event, record_payment_event
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def _notification(payment_id: str, user_id: int) -> bytes:
+    return json.dumps({
+        "type": "notification",
+        "event": "payment.succeeded",
+        "object": {"id": payment_id, "status": "succeeded", "metadata": {"user_id": str(user_id)}},
+    }).encode()
+
+
+async def _post(client: httpx.AsyncClient, body: bytes) -> str:
+    signature = hmac.new(webhook.YOOKASSA_SECRET_KEY.encode(), body, hashlib.sha256).hexdigest()
+    response = await client.post('/yookassa-webhook', content=body, headers={'Content-SHA256': signature})
+    assert response.status_code == 200
+    return response.json()["status"]
+
+
+@pytest.fixture
+def fake_bot(monkeypatch):
+    bot = FakeBot()
+    monkeypatch.setattr(payment_events, 'bot', bot)
+    return bot
+
+
+async def test_replayed_notification_extends_subscription_once(db, fake_bot):
+    trial_end = datetime.now() + timedelta(days=3)
+    async with async_session() as session:
+        session.add(User(tg_id=42, name='Аня', is_trial=True, start_date=datetime.now(), end_date=trial_end))
+        await session.commit()
+
+    await payment_worker.start()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=webhook.app), base_url='http://test') as client:
+            body = _notification('pay-1', 42)
+            assert await _post(client, body) == 'accepted'
+            assert await _post(client, body) == 'duplicate'
+            # Юкасса повторяет уведомление, пока не получит ответ, иногда пачкой
+            statuses = await asyncio.gather(*(_post(client, body) for _ in range(50)))
+            assert set(statuses) == {'duplicate'}
+    finally:
+        await payment_worker.stop()
+
+    async with async_session() as session:
+        assert await session.scalar(select(func.count()).select_from(PaymentEvent)) == 1
+        assert await session.scalar(select(PaymentEvent.status)) == DONE
+        user = await session.scalar(select(User).where(User.tg_id == 42))
+        paid_until = user.end_date
+    assert user.is_trial is False
+    assert paid_until > trial_end + timedelta(days=300)
+    assert fake_bot.sent == [(42, payment_events.SUCCESS_TEXT)]
+
+    # Обработка того же события после перезапуска ничего не меняет
+    await process_payment_event('pay-1')
+    async with async_session() as session:
+        assert await session.scalar(select(User.end_date).where(User.tg_id == 42)) == paid_until
+    assert len(fake_bot.sent) == 1
+
+
+async def test_payment_resets_user_cache_of_other_processes(db, fake_bot):
+    async with async_session() as session:
+        session.add(User(tg_id=42, name='Аня', is_trial=True, start_date=datetime.now(), end_date=datetime.now() - timedelta(days=1)))
+        await session.commit()
+    watcher = UserChangeWatcher()
+    await watcher.poll_once()
+    async with async_session() as session:
+        stale = await get_user_access(session, 42)
+    assert not stale.has_access
+
+    assert await record_payment_event('pay-1', 'payment.succeeded', 42)
+    await process_payment_event('pay-1')
+    await process_payment_event('pay-1')
+    # Кэш процесса бота, в котором платёж не обрабатывался
+    user_cache._users[42] = stale
+
+    assert await watcher.poll_once() == 1
+    async with async_session() as session:
+        assert (await get_user_access(session, 42)).has_access
@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database.migrations import check_query_plans, upgrade
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def fresh_engine():
+    path = os.path.join(tempfile.mkdtemp(prefix='bot-tests-'), 'plans.sqlite3')
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    await upgrade(engine)
+    yield engine
+    await engine.dispose()
+
+
+async def test_hot_queries_use_indexes(fresh_engine):
+    await check_query_plans(fresh_engine)
+
+
+async def test_dropped_index_is_reported(fresh_engine):
+    async with fresh_engine.begin() as conn:
+        await conn.execute(text("DROP INDEX ix_users_end_date"))
+    with pytest.raises(RuntimeError, match="окончание подписки в окне"):
+        await check_query_plans(fresh_engine)
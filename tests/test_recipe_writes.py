@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from typing import List
+
+import pytest
+from sqlalchemy import event, select
+
+from app.database.models import async_session, Category, Cuisine, Type, IngredientType, Ingredient, Recipe_ingredient
+from app.database.recipe_writes import save_recipe
+
+pytestmark = pytest.mark.anyio
+
+
+@contextmanager
+def _statements(engine):
+    executed: List[str] = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        yield executed
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+
+async def _save(engine, ingredient_ids, recipe_id=None):
+    async with async_session() as session:
+        with _statements(engine) as executed:
+            recipe_id = await save_recipe(session, 'Салат', 'Нарезать', 1, 1, 1, ingredient_ids, recipe_id=recipe_id)
+        links = (await session.scalars(
+            select(Recipe_ingredient.ingredient_id).where(Recipe_ingredient.recipe_id == recipe_id)
+        )).all()
+    assert sorted(links) == sorted(ingredient_ids)
+    return recipe_id, len(executed)
+
+
+async def test_save_recipe_queries_do_not_depend_on_ingredient_count(db):
+    async with async_session() as session:
+        session.add_all([Category(name='Салат'), Cuisine(name='Русская кухня'), Type(name='Постное'), IngredientType(name='Овощи')])
+        await session.flush()
+        session.add_all([Ingredient(name=f'Овощ {n}', protein='1', fat='0', carbohydrate='5', ingredient_type_id=1) for n in range(50)])
+        await session.commit()
+
+    one_id, one = await _save(db, [1])
+    many_id, many = await _save(db, list(range(1, 51)))
+    # INSERT рецепта и один executemany связей
+    assert one == many == 2
+    # Перезапись: UPDATE, DELETE старых связей и один executemany новых
+    _, one_update = await _save(db, [2], recipe_id=many_id)
+    _, many_update = await _save(db, list(range(1, 51)), recipe_id=one_id)
+    assert one_update == many_update == 3
@@ -0,0 +1,51 @@
+from typing import List
+
+import pytest
+from sqlalchemy import event, insert
+
+from app.database.models import async_session, Category, Cuisine, Type, IngredientType, Ingredient, Recipe, Recipe_ingredient
+from app.database.sampling import MATCH_ALL, sample_recipe_ids
+
+pytestmark = pytest.mark.anyio
+
+RECIPES = 3000
+
+
+async def test_sql_fallback_does_not_bind_recipe_ids(db):
+    async with async_session() as session:
+        for model in (Category, Cuisine, Type, IngredientType):
+            await session.execute(insert(model), [{"name": "Любая"}, {"name": "Другая"}])
+        await session.execute(insert(Ingredient), [
+            {"name": name, "protein": "1", "fat": "1", "carbohydrate": "1", "ingredient_type_id": 1}
+            for name in ("Рис", "Лук", "Соль")
+        ])
+        await session.execute(insert(Recipe), [
+            {"title": f"Рецепт {number}", "instructions": "Сварить", "category_id": 1 if number % 10 else 2,
+             "cuisine_id": 1, "type_id": 1, "position": None, "like": None, "dislike": None}
+            for number in range(RECIPES)
+        ])
+        # У каждого рецепта рис и лук, у каждого третьего ещё соль
+        await session.execute(insert(Recipe_ingredient), [
+            {"recipe_id": recipe_id, "ingredient_id": ingredient_id}
+            for recipe_id in range(1, RECIPES + 1)
+            for ingredient_id in ((1, 2, 3) if recipe_id % 3 == 0 else (1, 2))
+        ])
+        await session.commit()
+
+        bound: List[int] = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            bound.append(len(parameters))
+
+        # Индекс рецептов ещё не построен - поиск идёт запросами к базе
+        event.listen(db.sync_engine, "before_cursor_execute", count)
+        try:
+            picked = await sample_recipe_ids(session, 10, category_id=1, ingredient_ids=[1, 2], match_mode=MATCH_ALL, penalize_missing=True)
+        finally:
+            event.remove(db.sync_engine, "before_cursor_execute", count)
+    assert len(picked) == 10
+    # Без недостающих ингредиентов (без соли) рецепты идут первыми
+    assert all(recipe_id % 3 and (recipe_id - 1) % 10 for recipe_id in picked)
+    # Списки ID рецептов не передаются параметрами: SQLite по умолчанию принимает
+    # не больше 32766 параметров на запрос, а подходящих рецептов может быть больше
+    assert bound and max(bound) < 10
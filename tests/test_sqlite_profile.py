@@ -0,0 +1,80 @@
+import asyncio
+import os
+import tempfile
+from typing import Optional
+
+import pytest
+from sqlalchemy import inspect, select, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import migrations
+from app.database.migrations import upgrade
+from app.database.models import User
+from app.database.sqlite_profile import get_profile, install_profile, PROFILES
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=sorted(PROFILES))
+async def profile_engine(request):
+    path = os.path.join(tempfile.mkdtemp(prefix='bot-tests-'), 'profile.sqlite3')
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    install_profile(engine.sync_engine, get_profile(request.param))
+    await upgrade(engine)
+    yield engine
+    await engine.dispose()
+
+
+async def _read_then_write(sessions, tg_id: int, read: asyncio.Event, before_write: Optional[asyncio.Event] = None, wrote: Optional[asyncio.Event] = None):
+    async with sessions() as session:
+        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        read.set()
+        if before_write is not None:
+            await before_write.wait()
+        await session.execute(update(User).where(User.id == user.id).values(name=f'{user.name}!'))
+        if wrote is not None:
+            wrote.set()
+        await session.commit()
+
+
+async def test_sessions_that_read_then_write_do_not_conflict(profile_engine):
+    # Так работают сессии на апдейт (DbSessionMiddleware) рядом с записью
+    # состояний FSM, оплатами и напоминаниями
+    sessions = async_sessionmaker(profile_engine)
+    async with sessions() as session:
+        session.add_all([User(tg_id=1, name='A', is_trial=True), User(tg_id=2, name='B', is_trial=True)])
+        await session.commit()
+
+    # Вторая сессия читает, пишет и коммитит между чтением и записью первой
+    first_read, second_read, second_wrote = asyncio.Event(), asyncio.Event(), asyncio.Event()
+    first = asyncio.create_task(_read_then_write(sessions, 1, first_read, before_write=second_wrote))
+    await first_read.wait()
+    second = asyncio.create_task(_read_then_write(sessions, 2, second_read, wrote=second_wrote))
+    await asyncio.wait_for(asyncio.gather(first, second), timeout=10)
+
+    # Обе прочитали до того, как любая начала писать
+    first_read, second_read, both_read = asyncio.Event(), asyncio.Event(), asyncio.Event()
+    first = asyncio.create_task(_read_then_write(sessions, 1, first_read, before_write=both_read))
+    second = asyncio.create_task(_read_then_write(sessions, 2, second_read, before_write=both_read))
+    await first_read.wait()
+    await second_read.wait()
+    both_read.set()
+    await asyncio.wait_for(asyncio.gather(first, second), timeout=10)
+
+    async with sessions() as session:
+        assert (await session.scalars(select(User.name).order_by(User.tg_id))).all() == ['A!!', 'B!!']
+
+
+async def test_failed_migration_is_rolled_back(profile_engine, monkeypatch):
+    def broken(conn):
+        conn.exec_driver_sql("CREATE TABLE half_done (id INTEGER PRIMARY KEY)")
+        raise RuntimeError("миграция упала")
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [(999, "Сломанная", broken)])
+    with pytest.raises(RuntimeError):
+        await upgrade(profile_engine)
+    async with profile_engine.connect() as conn:
+        assert 'half_done' not in await conn.run_sync(lambda sync: inspect(sync).get_table_names())
+        # Соединение вернулось в пул без AUTOCOMMIT: запись снова ждёт commit
+        await conn.execute(text("UPDATE users SET name = 'x'"))
+        assert (await conn.get_raw_connection()).driver_connection.in_transaction
@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.yookassa_payment import YooKassaClient
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeYooKassa:
+    """Локальный сервер вместо API Юкассы: отвечает по очереди из replies, дальше - успехом."""
+
+    def __init__(self, replies=(), delay: float = 0):
+        self.replies = list(replies)
+        self.delay = delay
+        self.keys = []
+        self.active = 0
+        self.max_active = 0
+        app = web.Application()
+        app.router.add_post('/payments', self.create_payment)
+        self.server = TestServer(app)
+
+    async def create_payment(self, request: web.Request) -> web.Response:
+        self.keys.append(request.headers['Idempotence-Key'])
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if self.replies:
+            status, body = self.replies.pop(0)
+            return web.Response(status=status, text=body)
+        payload = await request.json()
+        return web.json_response({"id": f"payment-{len(self.keys)}", "status": "pending", "metadata": payload.get("metadata")})
+
+    async def __aenter__(self):
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.server.close()
+
+    def client(self, **kwargs) -> YooKassaClient:
+        kwargs.setdefault('backoff', 0.01)
+        return YooKassaClient('shop', 'secret', base_url=str(self.server.make_url('')).rstrip('/'), **kwargs)
+
+
+async def test_retries_server_errors_with_the_same_idempotence_key():
+    async with FakeYooKassa(replies=[(500, '{}'), (429, '{}')]) as fake:
+        client = fake.client()
+        try:
+            payment = await client.request("POST", "/payments", {"amount": {"value": "1"}})
+        finally:
+            await client.close()
+    assert payment["status"] == "pending"
+    assert len(fake.keys) == 3
+    assert len(set(fake.keys)) == 1
+
+
+async def test_non_json_error_page_is_a_failed_attempt():
+    html = "<html><body>502 Bad Gateway</body></html>"
+    async with FakeYooKassa(replies=[(404, html), (200, html)]) as fake:
+        client = fake.client()
+        try:
+            payment = await client.request("POST", "/payments", {})
+        finally:
+            await client.close()
+    assert payment["status"] == "pending"
+    assert len(fake.keys) == 3
+
+
+async def test_gives_up_after_retries():
+    async with FakeYooKassa(replies=[(503, 'down')] * 3) as fake:
+        client = fake.client(retries=3)
+        try:
+            payment = await client.request("POST", "/payments", {})
+        finally:
+            await client.close()
+    assert payment == {"type": "error", "code": "request_failed", "description": "HTTP 503"}
+    assert len(fake.keys) == 3
+
+
+async def test_client_errors_are_returned_without_retry():
+    async with FakeYooKassa(replies=[(400, '{"type": "error", "code": "invalid_request"}')]) as fake:
+        client = fake.client()
+        try:
+            payment = await client.request("POST", "/payments", {})
+        finally:
+            await client.close()
+    assert payment["code"] == "invalid_request"
+    assert len(fake.keys) == 1
+
+
+async def test_loop_stays_responsive_under_concurrent_payments():
+    async with FakeYooKassa(delay=0.05) as fake:
+        client = fake.client(max_concurrency=20)
+        lags = []
+        done = asyncio.Event()
+
+        async def ticker():
+            # Как часто успевает проснуться любой другой обработчик бота
+            while not done.is_set():
+                started = time.monotonic()
+                await asyncio.sleep(0.01)
+                lags.append(time.monotonic() - started - 0.01)
+
+        ticks = asyncio.create_task(ticker())
+        try:
+            payments = await asyncio.gather(*(
+                client.request("POST", "/payments", {"metadata": {"user_id": user_id}}) for user_id in range(200)
+            ))
+        finally:
+            done.set()
+            await ticks
+            await client.close()
+    assert [payment["metadata"]["user_id"] for payment in payments] == list(range(200))
+    assert len(set(fake.keys)) == 200
+    assert fake.max_active <= 20
+    assert max(lags) < 0.1